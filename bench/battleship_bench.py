@@ -0,0 +1,548 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Micro-benchmarks of the battleship hot paths, with stored baselines.
+
+Covers payload parsing, the state codecs, the rule functions, the handler
+itself and the building of client transactions. Each benchmark is timed as
+the best of several repeats; the results are saved as a JSON baseline, and a
+later run compared to a baseline fails when a benchmark got slower than the
+threshold allows.
+'''
+
+import argparse
+import collections
+import contextlib
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessRequest
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from processor.battleship_payload import BattleshipPayload
+from processor.battleship_sim import game_moves
+from processor.battleship_sim import simulate
+from processor.battleship_state import BattleshipState
+from processor.battleship_state import Game
+from processor.battleship_tp import BattleshipTransactionHandler
+from processor.battleship_tp import FAMILY_NAME
+from processor.battleship_tp import _game_boat_data_to_list
+from processor.battleship_tp import _game_boat_data_to_str
+from processor.battleship_tp import _place
+from processor.battleship_tp import _update_board
+from processor.battleship_tp import _update_game_state
+from processor.battleship_tp import bs_namespace
+from processor.memory_context import MemoryContext
+from processor.memory_context import MemoryState
+
+from battleship_family.battleship_client import BattleshipClient
+from battleship_family.battleship_payload import encode_payload
+from battleship_family.battleship_signing import sign_spec
+
+BASELINE_VERSION = 1
+
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_REPEAT = 5
+DEFAULT_MIN_TIME = 0.1
+
+# Times a regressed benchmark is timed again before the run fails
+DEFAULT_RETRIES = 2
+
+# Games in a partition and in a player index, for the codec benchmarks
+PARTITION_GAMES = 100
+
+# Shots fired by both players in the mid-game fixture
+MIDGAME_SHOTS = 60
+
+# A fixed key, so the client benchmarks need no key file
+BENCH_PRIVATE_KEY = '1' * 64
+
+# name -> setup, returning the function to time
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _request(payload, signer='02' + '00' * 32):
+    return TpProcessRequest(
+        header=TransactionHeader(
+            family_name=FAMILY_NAME,
+            family_version='1.0',
+            inputs=[bs_namespace],
+            outputs=[bs_namespace],
+            signer_public_key=signer),
+        payload=payload)
+
+
+def _game_payloads(name, seed=0):
+    '''Return the payloads of a simulated game, from its creation on.'''
+    result = simulate(1, np.random.default_rng(seed))
+    players = [name + '-p1', name + '-p2']
+    payloads = [','.join([name, 'create', '', '', '', players[0], players[1],
+                          ''])]
+    for player, action, fields in game_moves(result, 0):
+        payloads.append(','.join([
+            name, action, str(fields['space']), fields.get('boat', ''),
+            fields.get('direction', ''), '', '', players[player]]))
+    return [payload.encode() for payload in payloads]
+
+
+class _Fixture(object):
+    '''A state holding one game after its fleets are placed and shots
+       shots are fired, and the next move of the game.
+    '''
+
+    def __init__(self, name='bench', shots=MIDGAME_SHOTS):
+        self.handler = BattleshipTransactionHandler(bs_namespace)
+        self.state = MemoryState()
+
+        payloads = _game_payloads(name)
+        played = 1 + 10 + shots
+        for payload in payloads[:played]:
+            self.apply(payload)
+            self.state.apply(self.context.changes)
+        self.next_move = payloads[played]
+
+        self.game = BattleshipState(self.context).get_game(name)
+
+    def apply(self, payload):
+        '''Execute payload on the state, leaving the state unchanged.'''
+        self.context = MemoryContext(
+            self.state, [bs_namespace], [bs_namespace])
+        self.handler.apply(_request(payload), self.context)
+
+
+_FIXTURE = None
+
+
+def _fixture():
+    global _FIXTURE
+    if _FIXTURE is None:
+        _FIXTURE = _Fixture()
+    return _FIXTURE
+
+
+def _games(game, count):
+    games = {}
+    for number in range(count):
+        name = '{}-{}'.format(game.name, number)
+        games[name] = Game(name, game.board_P1, game.board_P2, game.state,
+                           game.player1, game.player2, game.boat_cases,
+                           game.to_place)
+    return games
+
+
+@benchmark('payload/parse-create')
+def _parse_create():
+    payload = b'bench,create,,,,bench-p1,bench-p2,'
+    return lambda: BattleshipPayload.from_bytes(payload)
+
+
+@benchmark('payload/parse-shoot')
+def _parse_shoot():
+    payload = _fixture().next_move
+    return lambda: BattleshipPayload.from_bytes(payload)
+
+
+@benchmark('payload/parse-create-v2')
+def _parse_create_v2():
+    payload = encode_payload('2.0', 'bench', 'create', player1='bench-p1',
+                             player2='bench-p2')
+    return lambda: BattleshipPayload.from_bytes(payload, '2.0')
+
+
+@benchmark('payload/parse-shoot-v2')
+def _parse_shoot_v2():
+    payload = encode_payload('2.0', *_fixture().next_move.decode().split(','))
+    return lambda: BattleshipPayload.from_bytes(payload, '2.0')
+
+
+@benchmark('state/deserialize-game')
+def _deserialize_game():
+    codec = BattleshipState(None)
+    data = codec._serialize({_fixture().game.name: _fixture().game})
+    return lambda: codec._deserialize(data)
+
+
+@benchmark('state/serialize-game')
+def _serialize_game():
+    codec = BattleshipState(None)
+    games = {_fixture().game.name: _fixture().game}
+    return lambda: codec._serialize(games)
+
+
+@benchmark('state/deserialize-partition')
+def _deserialize_partition():
+    codec = BattleshipState(None)
+    data = codec._serialize(_games(_fixture().game, PARTITION_GAMES))
+    return lambda: codec._deserialize(data)
+
+
+@benchmark('state/serialize-partition')
+def _serialize_partition():
+    codec = BattleshipState(None)
+    games = _games(_fixture().game, PARTITION_GAMES)
+    return lambda: codec._serialize(games)
+
+
+@benchmark('state/deserialize-index')
+def _deserialize_index():
+    codec = BattleshipState(None)
+    data = codec._serialize_index({
+        'bench-{}'.format(number): 'P1-NEXT'
+        for number in range(PARTITION_GAMES)})
+    return lambda: codec._deserialize_index(data)
+
+
+@benchmark('state/serialize-index')
+def _serialize_index():
+    codec = BattleshipState(None)
+    index = {
+        'bench-{}'.format(number): 'P1-NEXT'
+        for number in range(PARTITION_GAMES)}
+    return lambda: codec._serialize_index(index)
+
+
+@benchmark('rules/update-board')
+def _rules_update_board():
+    game = _fixture().game
+    space = int(BattleshipPayload.from_bytes(_fixture().next_move).space)
+    board = game.board_P2 if game.state == 'P1-NEXT' else game.board_P1
+
+    def run():
+        _update_board(board, _game_boat_data_to_list(game.boat_cases), space,
+                      game.state)
+    return run
+
+
+@benchmark('rules/place')
+def _rules_place():
+    board = '-' * 100
+    to_place = _game_boat_data_to_str([[1] * 5, [1] * 5])
+
+    def run():
+        _place(board, _game_boat_data_to_list(to_place), 45, 'L',
+               'horizontal', 0)
+    return run
+
+
+@benchmark('rules/update-game-state')
+def _rules_update_game_state():
+    to_place = [[0] * 5, [0] * 5]
+    boat_cases = _game_boat_data_to_list(_fixture().game.boat_cases)
+    return lambda: _update_game_state('P1-NEXT', to_place, boat_cases)
+
+
+@benchmark('handler/create')
+def _handler_create():
+    payload = b'bench-new,create,,,,bench-p1,bench-p2,'
+    return lambda: _fixture().apply(payload)
+
+
+@benchmark('handler/place')
+def _handler_place():
+    # The last boat of player 2, which starts the game
+    fixture = _Fixture(name='bench-place', shots=-1)
+    return lambda: fixture.apply(fixture.next_move)
+
+
+@benchmark('handler/shoot')
+def _handler_shoot():
+    payload = _fixture().next_move
+    return lambda: _fixture().apply(payload)
+
+
+@benchmark('client/txn-spec')
+def _client_txn_spec():
+    client = BattleshipClient(base_url='http://127.0.0.1:8008')
+    client.txn_spec('bench', 'create', player1='bench-p1',
+                    player2='bench-p2', private_key=BENCH_PRIVATE_KEY)
+    return lambda: client.txn_spec(
+        'bench', 'shoot', space=45, currentplayer='bench-p1',
+        private_key=BENCH_PRIVATE_KEY)
+
+
+@benchmark('client/sign-spec')
+def _client_sign_spec():
+    client = BattleshipClient(base_url='http://127.0.0.1:8008')
+    client.txn_spec('bench', 'create', player1='bench-p1',
+                    player2='bench-p2', private_key=BENCH_PRIVATE_KEY)
+    spec = client.txn_spec(
+        'bench', 'shoot', space=45, currentplayer='bench-p1',
+        private_key=BENCH_PRIVATE_KEY)
+    return lambda: sign_spec(spec)
+
+
+def time_benchmark(function, repeat=DEFAULT_REPEAT,
+                   min_time=DEFAULT_MIN_TIME):
+    '''Time function; return the best and median time of one call, in
+       microseconds, and the number of calls per repeat.
+    '''
+    # Calls per repeat, so that a repeat lasts at least min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else \
+            max(2, min(10, int(min_time / elapsed * 1.2) + 1))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number * 1e6)
+
+    return {
+        'best_us': round(min(times), 3),
+        'median_us': round(statistics.median(times), 3),
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(patterns=None, repeat=DEFAULT_REPEAT,
+                   min_time=DEFAULT_MIN_TIME, report=None):
+    '''Run the benchmarks whose names match one of patterns, or all of
+       them; return the results as stored in a baseline.
+    '''
+    results = collections.OrderedDict()
+    with open(os.devnull, 'w') as devnull:
+        for name, setup in BENCHMARKS.items():
+            if patterns and not any(
+                    fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+            # The handler and the rules print every hit and miss
+            with contextlib.redirect_stdout(devnull):
+                results[name] = time_benchmark(
+                    setup(), repeat=repeat, min_time=min_time)
+            if report:
+                report(name, results[name])
+
+    return {
+        'version': BASELINE_VERSION,
+        'created': datetime.datetime.utcnow().replace(
+            microsecond=0).isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': results,
+    }
+
+
+def retime(results, names, repeat=DEFAULT_REPEAT, min_time=DEFAULT_MIN_TIME):
+    '''Time the benchmarks names again, keeping their best time, so that a
+       single noisy run does not count as a regression.
+    '''
+    with open(os.devnull, 'w') as devnull:
+        for name in names:
+            with contextlib.redirect_stdout(devnull):
+                result = time_benchmark(
+                    BENCHMARKS[name](), repeat=repeat, min_time=min_time)
+            best = results['benchmarks'][name]
+            if result['best_us'] < best['best_us']:
+                results['benchmarks'][name] = result
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    '''Compare results to baseline; return (name, baseline us, result us,
+       change) rows, and the names of the benchmarks that regressed by more
+       than threshold, a fraction.
+    '''
+    rows = []
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        reference = baseline['benchmarks'].get(name)
+        if reference is None:
+            rows.append((name, None, result['best_us'], None))
+            continue
+        change = result['best_us'] / reference['best_us'] - 1
+        rows.append((name, reference['best_us'], result['best_us'], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def load_baseline(path):
+    with open(path) as fd:
+        baseline = json.load(fd)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise Exception('Unsupported baseline version in {}: {}'.format(
+            path, baseline.get('version')))
+    return baseline
+
+
+def save_baseline(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as fd:
+        json.dump(results, fd, indent=2)
+        fd.write('\n')
+
+
+def _print_result(name, result):
+    print('{:<32} {:>12.3f} us  (median {:.3f}, {} x {})'.format(
+        name, result['best_us'], result['median_us'], result['number'],
+        result['repeat']), flush=True)
+
+
+def _print_comparison(rows, regressions, threshold):
+    print()
+    print('{:<32} {:>12} {:>12} {:>8}'.format(
+        'benchmark', 'baseline us', 'us', 'change'))
+    for name, reference, best, change in rows:
+        if change is None:
+            print('{:<32} {:>12} {:>12.3f} {:>8}'.format(
+                name, '-', best, 'new'))
+            continue
+        print('{:<32} {:>12.3f} {:>12.3f} {:>+7.1f}%{}'.format(
+            name, reference, best, change * 100,
+            '  REGRESSION' if name in regressions else ''))
+
+    if regressions:
+        print('\n{} benchmark(s) slower than the baseline by more than '
+              '{:.0f}%: {}'.format(len(regressions), threshold * 100,
+                                   ', '.join(regressions)))
+    else:
+        print('\nNo regression beyond {:.0f}%'.format(threshold * 100))
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Times the battleship payload parsing, state codecs, '
+        'rules, handler and client transaction building, and compares the '
+        'results to a stored baseline.')
+
+    parser.add_argument(
+        'patterns',
+        nargs='*',
+        help='run only the benchmarks matching one of these glob patterns, '
+        'e.g. "state/*"')
+
+    parser.add_argument(
+        '--baseline',
+        type=str,
+        help='JSON baseline to compare with; the command fails if a '
+        'benchmark is slower than the threshold allows')
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help='largest slowdown accepted, as a fraction of the baseline '
+        'time (default: {})'.format(DEFAULT_THRESHOLD))
+
+    parser.add_argument(
+        '--save',
+        type=str,
+        help='write the results to this file, to serve as a baseline')
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=DEFAULT_REPEAT,
+        help='number of timed repeats of each benchmark, the best counting')
+
+    parser.add_argument(
+        '--min-time',
+        type=float,
+        default=DEFAULT_MIN_TIME,
+        help='shortest duration of one repeat, in seconds')
+
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=DEFAULT_RETRIES,
+        help='times a regressed benchmark is timed again before it counts '
+        'as a regression')
+
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='list the benchmarks and exit')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    if args.list:
+        for name in BENCHMARKS:
+            print(name)
+        return
+
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    results = run_benchmarks(
+        patterns=args.patterns,
+        repeat=args.repeat,
+        min_time=args.min_time,
+        report=_print_result)
+    if not results['benchmarks']:
+        raise Exception('No benchmark matches {}'.format(
+            ' '.join(args.patterns)))
+
+    if baseline is not None:
+        if baseline['python'] != results['python']:
+            print('Warning: the baseline was taken with Python {}'.format(
+                baseline['python']))
+        rows, regressions = compare(results, baseline, args.threshold)
+        for _ in range(args.retries):
+            if not regressions:
+                break
+            retime(results, regressions, repeat=args.repeat,
+                   min_time=args.min_time)
+            rows, regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        save_baseline(results, args.save)
+        print('Saved the results to {}'.format(args.save))
+
+    if baseline is not None:
+        _print_comparison(rows, regressions, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
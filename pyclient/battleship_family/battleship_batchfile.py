@@ -0,0 +1,191 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Files of pre-signed battleship batches.
+
+A batch file starts with MAGIC, followed by records made of a 4 byte big
+endian length and a serialized BatchList. Files are written by
+`battleship build` and streamed to the validator by `battleship submit-file`,
+so signing can be done once, ahead of the runs that submit. The
+transactions of a game are chained by build, so the validator applies them
+in order even though submit-file has several requests in flight.
+'''
+
+import mmap
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+MAGIC = b'BSBATCH1'
+
+_LENGTH = struct.Struct('>I')
+
+# Number of batch ids asked for in one batch status request
+STATUS_CHUNK = 1000
+
+STATUS_POLL_INTERVAL = 1
+
+
+def write_batch_file(path, batches, batches_per_list=1):
+    '''Write batches to path, batches_per_list to each BatchList.
+
+       Returns the number of BatchList records written.
+    '''
+    records = 0
+    with open(path, 'wb') as fd:
+        fd.write(MAGIC)
+        for i in range(0, len(batches), batches_per_list):
+            data = BatchList(
+                batches=batches[i:i + batches_per_list]).SerializeToString()
+            fd.write(_LENGTH.pack(len(data)))
+            fd.write(data)
+            records += 1
+
+    return records
+
+
+def iter_batch_file(path):
+    '''Yield the serialized BatchLists of a batch file.
+
+       The file is memory-mapped, so large files are paged in as they are
+       read rather than loaded up front.
+    '''
+    with open(path, 'rb') as fd:
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise Exception('Not a battleship batch file: {}'.format(path))
+
+            offset = len(MAGIC)
+            while offset < len(data):
+                if offset + _LENGTH.size > len(data):
+                    raise Exception('Truncated batch file: {}'.format(path))
+                length, = _LENGTH.unpack_from(data, offset)
+                offset += _LENGTH.size
+
+                if offset + length > len(data):
+                    raise Exception('Truncated batch file: {}'.format(path))
+                yield data[offset:offset + length]
+                offset += length
+
+
+class SubmitStats(object):
+    '''Counts of a submit_file run.'''
+
+    def __init__(self):
+        self.submitted = 0
+        self.failed = 0
+        self.pending = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.submitted / self.elapsed if self.elapsed else 0.0
+
+
+def _batch_ids(data):
+    batch_list = BatchList()
+    batch_list.ParseFromString(data)
+    return [batch.header_signature for batch in batch_list.batches]
+
+
+def wait_for_batches(client, batch_ids, stats, timeout=None,
+                     auth_user=None, auth_password=None):
+    '''Poll the status of batch_ids until none is pending, or for timeout
+       seconds, counting the invalid and unknown batches as failed and the
+       others not committed as pending in stats.
+    '''
+    pending = list(batch_ids)
+    start = time.time()
+    while pending:
+        statuses = {}
+        for i in range(0, len(pending), STATUS_CHUNK):
+            statuses.update(client.get_batch_statuses(
+                pending[i:i + STATUS_CHUNK],
+                auth_user=auth_user,
+                auth_password=auth_password))
+
+        still_pending = []
+        for batch_id in pending:
+            status = statuses.get(batch_id, 'UNKNOWN')
+            if status in ('INVALID', 'UNKNOWN'):
+                stats.failed += 1
+                stats.errors.append(
+                    'Batch {} is {}'.format(batch_id, status))
+            elif status != 'COMMITTED':
+                still_pending.append(batch_id)
+        pending = still_pending
+
+        if not pending or \
+                (timeout is not None and time.time() - start >= timeout):
+            break
+        time.sleep(STATUS_POLL_INTERVAL)
+
+    stats.pending = len(pending)
+
+
+def submit_file(client, path, rate=None, in_flight=8, timeout=None,
+                auth_user=None, auth_password=None):
+    '''Stream the BatchLists of a batch file to the validator.
+
+       At most in_flight submissions are outstanding at a time, and with
+       rate they are started at no more than rate BatchLists per second.
+       The batches are then polled until they commit, for at most timeout
+       seconds: requests that fail and batches found invalid or unknown
+       count as failed. Returns the SubmitStats of the run.
+    '''
+    stats = SubmitStats()
+    slots = threading.BoundedSemaphore(in_flight)
+    lock = threading.Lock()
+    batch_ids = []
+
+    def submit(data):
+        try:
+            client.submit_batch_list(
+                data, auth_user=auth_user, auth_password=auth_password)
+            with lock:
+                stats.submitted += 1
+                batch_ids.extend(_batch_ids(data))
+        except Exception as err:
+            with lock:
+                stats.failed += 1
+                stats.errors.append(str(err))
+        finally:
+            slots.release()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=in_flight) as executor:
+        for i, data in enumerate(iter_batch_file(path)):
+            slots.acquire()
+
+            if rate:
+                delay = start + i / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            executor.submit(submit, data)
+
+    stats.elapsed = time.time() - start
+
+    wait_for_batches(
+        client, batch_ids, stats,
+        timeout=timeout,
+        auth_user=auth_user,
+        auth_password=auth_password)
+
+    return stats
@@ -0,0 +1,352 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Bot players, to load the network with games played the way people play.
+
+A DensityBot shoots where the most placements of the enemy boats still
+afloat would cover, given the misses and hits on the enemy board: it hunts
+while no boat is damaged, and targets the damaged boats otherwise. A
+BotDriver plays many games between bots through one BattleshipClient,
+reading all its games at once on every round.
+'''
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from battleship_family.battleship_client import BOAT_LENGTHS
+from battleship_family.battleship_client import ID_BOAT
+from battleship_family.battleship_keystore import default_key_dir
+from battleship_family.battleship_keystore import get_keystore
+from battleship_family.battleship_signing import sign_spec
+
+# The payload only accepts spaces 1 to 99: bots never shoot the last square,
+# nor place a boat on it, so that games between bots can always be won
+PLAYABLE_SQUARES = 99
+
+# How much more a placement of a damaged boat counts than one of an intact
+# boat, so that damaged boats are finished before hunting goes on
+TARGET_WEIGHT = 50
+
+DEFAULT_WORKERS = 32
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+_MISS = ord('X')
+_HIT = ord('O')
+
+
+def _placements(length):
+    '''Return the spaces, directions and (n, length) covered squares of
+       every position of a boat of length on the board.
+    '''
+    spaces, directions, cells = [], [], []
+    for index in range(100):
+        row, col = divmod(index, 10)
+        if col + length <= 10:
+            spaces.append(index + 1)
+            directions.append('horizontal')
+            cells.append([index + k for k in range(length)])
+        if row + length <= 10:
+            spaces.append(index + 1)
+            directions.append('vertical')
+            cells.append([index + 10 * k for k in range(length)])
+
+    return spaces, directions, np.array(cells)
+
+
+_PLACEMENTS = {length: _placements(length) for length in set(BOAT_LENGTHS)}
+
+
+class DensityBot(object):
+    '''Places a random fleet and picks shots from a probability density.'''
+
+    def __init__(self, rng=None):
+        self._rng = np.random.default_rng() if rng is None else rng
+
+    def place_fleet(self):
+        '''Return a random fleet as (space, boat, direction) placements.'''
+        taken = np.zeros(100, dtype=bool)
+        taken[PLAYABLE_SQUARES:] = True
+
+        fleet = []
+        for boat, length in zip(ID_BOAT, BOAT_LENGTHS):
+            spaces, directions, cells = _PLACEMENTS[length]
+            free = np.flatnonzero(~taken[cells].any(axis=1))
+            choice = self._rng.choice(free)
+            taken[cells[choice]] = True
+            fleet.append((spaces[choice], boat, directions[choice]))
+
+        return fleet
+
+    def density(self, board, remaining):
+        '''Return the (100,) density of the enemy boats over board.
+
+           board is the enemy board as stored in state, where only misses
+           ('X') and hits ('O') are taken into account, and remaining the
+           squares left afloat of each enemy boat, in the order of ID_BOAT.
+           A boat with k hits can only lie where it covers exactly k hit
+           squares and no miss.
+        '''
+        marks = np.frombuffer(board.encode(), dtype=np.uint8)
+        misses = marks == _MISS
+        hits = marks == _HIT
+
+        density = np.zeros(100)
+        for length, left in zip(BOAT_LENGTHS, remaining):
+            if left == 0:
+                continue
+            _, _, cells = _PLACEMENTS[length]
+
+            fits = ~misses[cells].any(axis=1) & \
+                (hits[cells].sum(axis=1) == length - left)
+            weight = fits * (TARGET_WEIGHT if left < length else 1.0)
+            density += np.bincount(
+                cells.ravel(), weights=np.repeat(weight, length),
+                minlength=100)
+
+        density[misses | hits] = 0
+        density[PLAYABLE_SQUARES:] = 0
+        return density
+
+    def choose(self, board, remaining):
+        '''Return the space, from 1 to 99, of the next shot on board.'''
+        density = self.density(board, remaining)
+
+        if density.max() > 0:
+            best = np.flatnonzero(density == density.max())
+        else:
+            # Only on boards bots did not place: nothing fits the marks
+            marks = np.frombuffer(board.encode(), dtype=np.uint8)
+            best = np.flatnonzero(
+                (marks[:PLAYABLE_SQUARES] != _MISS) &
+                (marks[:PLAYABLE_SQUARES] != _HIT))
+            if len(best) == 0:
+                raise Exception("No square left to shoot")
+
+        return int(self._rng.choice(best)) + 1
+
+
+class BotGame(object):
+    '''A game played by two bots, as followed by a BotDriver.'''
+
+    def __init__(self, name, player1, player2):
+        self.name = name
+        self.players = (player1, player2)
+        self.state = None
+        self.winner = None
+        self.error = None
+        self.moves = 0
+        self.started = None
+        self.finished = None
+
+        # Number of shots on the boards when the last shot was sent: a
+        # game is not played again until state shows that shot
+        self.acted = -1
+
+        # Batches sent for the game and not known to be committed yet
+        self.batches = []
+
+    @property
+    def done(self):
+        return self.winner is not None or self.error is not None
+
+
+def _shots(game_fields):
+    return sum(
+        board.count('X') + board.count('O')
+        for board in game_fields[1:3])
+
+
+class BotDriver(object):
+    '''Plays games between DensityBots through a BattleshipClient.
+
+       The client needs no key of its own: moves are signed with the keys
+       of the players, from key_dir. Each round reads every unfinished game
+       with one show_many() call and sends the moves due concurrently,
+       without waiting for them to commit. The batches of the games state
+       does not show progress in are checked instead, and a game is over,
+       in error, once one of them is invalid.
+    '''
+
+    def __init__(self, client, key_dir=None, workers=DEFAULT_WORKERS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, seed=None,
+                 auth_user=None, auth_password=None):
+        self._client = client
+        self._key_dir = key_dir
+        # Bots play as many users, so their whole key directory is loaded
+        self._keys = get_keystore().load_dir(key_dir)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._poll_interval = poll_interval
+        self._bot = DensityBot(np.random.default_rng(seed))
+        self._auth = dict(auth_user=auth_user, auth_password=auth_password)
+        self.games = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _private_key(self, username):
+        try:
+            return self._keys[username]
+        except KeyError:
+            raise Exception("No private key for {} in {}".format(
+                username, self._key_dir or default_key_dir()))
+
+    def add_game(self, name, player1, player2):
+        '''Create game name and place the fleets of both players.
+
+           The placements depend on the creation, so all of them are sent
+           in one request.
+        '''
+        game = BotGame(name, player1, player2)
+        self.games[name] = game
+        game.started = time.time()
+
+        create = sign_spec(self._client.txn_spec(
+            name, 'create',
+            player1=player1,
+            player2=player2,
+            private_key=self._private_key(player1),
+            **self._auth))
+        create_id = create.transactions[0].header_signature
+
+        batches = [create]
+        for player in game.players:
+            for space, boat, direction in self._bot.place_fleet():
+                spec = self._client.txn_spec(
+                    name, 'place', space,
+                    boat=boat,
+                    direction=direction,
+                    currentplayer=player,
+                    private_key=self._private_key(player),
+                    **self._auth)
+                batches.append(sign_spec(
+                    spec._replace(dependencies=[create_id])))
+
+        self._client.send_batches(batches, key=name, **self._auth)
+        game.batches = [batch.header_signature for batch in batches]
+        return game
+
+    def _shoot(self, name, player, space):
+        '''Send a shot; return the id of its batch.'''
+        batch = sign_spec(self._client.txn_spec(
+            name, 'shoot', space,
+            currentplayer=player,
+            private_key=self._private_key(player),
+            **self._auth))
+        self._client.send_batches([batch], key=name, **self._auth)
+        return batch.header_signature
+
+    def _check_batches(self, games):
+        '''Drop the committed batches of games, and put the games with an
+           invalid or unknown batch in error: state will never move on.
+        '''
+        owners = {
+            batch_id: game for game in games for batch_id in game.batches
+        }
+        if not owners:
+            return
+
+        statuses = self._client.get_batch_statuses(
+            list(owners), **self._auth)
+        for batch_id, status in statuses.items():
+            game = owners.get(batch_id)
+            if game is None or game.done:
+                continue
+            if status == 'COMMITTED':
+                game.batches.remove(batch_id)
+            elif status in ('INVALID', 'UNKNOWN'):
+                game.error = "Batch {} is {}".format(batch_id, status)
+                game.finished = time.time()
+
+    def _next_shot(self, game, fields):
+        '''Return the player and space of the shot due in game.'''
+        turn = 0 if fields[3] == 'P1-NEXT' else 1
+        board = fields[2 if turn == 0 else 1]
+        remaining = [int(left) for left in fields[6][5 * (1 - turn):][:5]]
+
+        return game.players[turn], self._bot.choose(board, remaining)
+
+    def step(self):
+        '''Play one round: read the unfinished games and send the shots
+           that are due. Returns the number of shots sent.
+        '''
+        playing = [name for name, game in self.games.items() if not game.done]
+        if not playing:
+            return 0
+
+        due = []
+        waiting = []
+        for name, fields in self._client.show_many(
+                playing, **self._auth).items():
+            game = self.games[name]
+            if fields is None:
+                waiting.append(game)
+                continue
+
+            game.state = fields[3]
+            game.moves = _shots(fields)
+            if game.state in ('P1-WIN', 'P2-WIN'):
+                game.winner = game.players[game.state == 'P2-WIN']
+                game.finished = time.time()
+            elif game.state != 'PLACE' and game.moves > game.acted:
+                game.acted = game.moves
+                due.append((game, fields))
+            else:
+                waiting.append(game)
+
+        self._check_batches(waiting)
+
+        # Shots are chosen here, only the requests run in the workers
+        futures = []
+        for game, fields in due:
+            try:
+                player, space = self._next_shot(game, fields)
+            except Exception as err:
+                game.error = str(err)
+                game.finished = time.time()
+                continue
+            futures.append((game, self._executor.submit(
+                self._shoot, game.name, player, space)))
+
+        for game, future in futures:
+            try:
+                game.batches = [future.result()]
+            except Exception as err:
+                game.error = str(err)
+                game.finished = time.time()
+
+        return len(due)
+
+    def run(self, timeout=None):
+        '''Play rounds until every game is over, or for timeout seconds.
+
+           Returns the games that are not over.
+        '''
+        start_time = time.time()
+        while any(not game.done for game in self.games.values()):
+            if timeout is not None and time.time() - start_time > timeout:
+                break
+            if self.step() == 0:
+                time.sleep(self._poll_interval)
+
+        return [game for game in self.games.values() if not game.done]
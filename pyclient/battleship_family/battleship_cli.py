@@ -20,9 +20,12 @@ to process.
 ''' 
 
 import argparse
+import csv
 import getpass
+import json
 import logging
 import os
+import shlex
 import sys
 import traceback
 import pkg_resources
@@ -30,8 +33,19 @@ import pkg_resources
 from colorlog import ColoredFormatter
 
 
+from battleship_family.battleship_batchfile import submit_file
+from battleship_family.battleship_bot import BotDriver
+from battleship_family.battleship_batchfile import write_batch_file
 from battleship_family.battleship_client import BattleshipClient
-ID_BOAT = ['L', 'M', 'N', 'Q', 'P'] # Name IDs of ID_BOAT, can be found in TP as well 
+from battleship_family.battleship_client import GAME_PARTITIONS
+from battleship_family.battleship_client import ID_BOAT
+from battleship_family.battleship_client import partition_for_state
+from battleship_family.battleship_keystore import default_key_dir
+from battleship_family.battleship_keystore import get_keystore
+from battleship_family.battleship_signing import SigningPool
+from battleship_family.battleship_trace import STAGES
+from battleship_family.battleship_trace import read_trace
+from battleship_family.battleship_trace import summarize
 
 DISTRIBUTION_NAME = 'battleship'
 
@@ -88,7 +102,8 @@ def add_create_parser(subparsers, parent_parser):
     parser.add_argument(
         '--url',
         type=str,
-        help='specify URL of REST API')
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
 
     parser.add_argument(
         '--username',
@@ -134,10 +149,32 @@ def add_list_parser(subparsers, parent_parser):
         'the players, the game state, and the board for each game.',
         parents=[parent_parser])
 
+    parser.add_argument(
+        '--format',
+        default='table',
+        choices=['table', 'json', 'csv', 'ndjson'],
+        help='choose the output format (default: table)')
+
+    parser.add_argument(
+        '--state',
+        type=str,
+        help='only list games in this state (e.g. PLACE, P1-NEXT, P1-WIN)')
+
+    parser.add_argument(
+        '--player',
+        type=str,
+        help='only list games in which this player takes part')
+
+    parser.add_argument(
+        '--limit',
+        type=int,
+        help='stop after listing this many games')
+
     parser.add_argument(
         '--url',
         type=str,
-        help='specify URL of REST API')
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
 
     parser.add_argument(
         '--username',
@@ -183,7 +220,8 @@ def add_show_parser(subparsers, parent_parser):
     parser.add_argument(
         '--url',
         type=str,
-        help='specify URL of REST API')
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
 
     parser.add_argument(
         '--key-dir',
@@ -261,7 +299,8 @@ def add_shoot_parser(subparsers, parent_parser):
     parser.add_argument(
         '--url',
         type=str,
-        help='specify URL of REST API')
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
 
     parser.add_argument(
         '--key-dir',
@@ -340,7 +379,8 @@ def add_place_parser(subparsers, parent_parser):
     parser.add_argument(
         '--url',
         type=str,
-        help='specify URL of REST API')
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
 
     parser.add_argument(
         '--key-dir',
@@ -379,7 +419,8 @@ def add_delete_parser(subparsers, parent_parser):
     parser.add_argument(
         '--url',
         type=str,
-        help='specify URL of REST API')
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
 
     parser.add_argument(
         '--username',
@@ -410,6 +451,302 @@ def add_delete_parser(subparsers, parent_parser):
         type=int,
         help='set time, in seconds, to wait for delete transaction to commit')
 
+def add_archive_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser(
+        'archive',
+        help='Archives a finished battleship game',
+        description='Sends a transaction to replace the finished game <name> '
+        'with a compact result record (players, winner, number of moves). '
+        'This transaction will fail if the game has not ended.',
+        parents=[parent_parser])
+
+    parser.add_argument(
+        'name',
+        type=str,
+        help='name of the game to be archived')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
+
+    parser.add_argument(
+        '--username',
+        type=str,
+        help="identify name of user's private key file")
+
+    parser.add_argument(
+        '--key-dir',
+        type=str,
+        help="identify directory of user's private key file")
+
+    parser.add_argument(
+        '--auth-user',
+        type=str,
+        help='specify username for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--auth-password',
+        type=str,
+        help='specify password for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--wait',
+        nargs='?',
+        const=sys.maxsize,
+        type=int,
+        help='set time, in seconds, to wait for archive transaction to commit')
+
+def add_build_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser(
+        'build',
+        help='Signs battleship transactions into a batch file',
+        description='Reads the commands of <script>, one per line as '
+        '"<username> <command> <arguments>" (e.g. "jack shoot game1 B 3"), '
+        'signs each one with the private key of <username> and writes the '
+        'batches to <output>, to be sent later with submit-file. The '
+        'transactions of a game are chained so that they are applied in '
+        'order. Supported commands are create, place, shoot, delete and '
+        'archive.',
+        parents=[parent_parser])
+
+    parser.add_argument(
+        'script',
+        type=str,
+        help='file of commands to sign')
+
+    parser.add_argument(
+        'output',
+        type=str,
+        help='batch file to write')
+
+    parser.add_argument(
+        '--batches-per-list',
+        type=int,
+        default=1,
+        help='number of batches submitted together in one request')
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='number of signing processes (default: one per CPU)')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        help='specify URL of REST API, or tcp:// URL of a validator, used '
+        'to look up the players of games not created by the script')
+
+    parser.add_argument(
+        '--key-dir',
+        type=str,
+        help="identify directory of the users' private key files")
+
+    parser.add_argument(
+        '--auth-user',
+        type=str,
+        help='specify username for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--auth-password',
+        type=str,
+        help='specify password for authentication if REST API '
+        'is using Basic Auth')
+
+def add_run_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser(
+        'run',
+        help='Plays a script of battleship commands',
+        description='Sends the commands of <script>, written as for build, '
+        'without waiting for each one to commit. The transactions of a game '
+        'are chained so that they are applied in order; when one of them '
+        'fails, the remaining commands of that game are skipped.',
+        parents=[parent_parser])
+
+    parser.add_argument(
+        'script',
+        type=str,
+        help='file of commands to send')
+
+    parser.add_argument(
+        '--timeout',
+        type=int,
+        default=300,
+        help='set time, in seconds, to wait for the transactions to commit '
+        'once all are sent')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
+
+    parser.add_argument(
+        '--key-dir',
+        type=str,
+        help="identify directory of the users' private key files")
+
+    parser.add_argument(
+        '--auth-user',
+        type=str,
+        help='specify username for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--auth-password',
+        type=str,
+        help='specify password for authentication if REST API '
+        'is using Basic Auth')
+
+def add_submit_file_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser(
+        'submit-file',
+        help='Submits the batches of a batch file',
+        description='Streams the pre-signed batches of <file>, written by '
+        'build, to the validator in order, then waits for them to commit. '
+        'Requests that fail and batches found invalid count as failures.',
+        parents=[parent_parser])
+
+    parser.add_argument(
+        'file',
+        type=str,
+        help='batch file to submit')
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        help='maximum number of requests started per second '
+        '(default: as fast as possible)')
+
+    parser.add_argument(
+        '--in-flight',
+        type=int,
+        default=8,
+        help='maximum number of requests awaiting a response')
+
+    parser.add_argument(
+        '--timeout',
+        type=int,
+        default=300,
+        help='set time, in seconds, to wait for the batches to commit '
+        'once all are submitted')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
+
+    parser.add_argument(
+        '--auth-user',
+        type=str,
+        help='specify username for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--auth-password',
+        type=str,
+        help='specify password for authentication if REST API '
+        'is using Basic Auth')
+
+def add_bots_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser(
+        'bots',
+        help='Plays games between bots',
+        description='Creates <count> games between two players and plays '
+        'them with bots that shoot where the enemy boats most likely are, '
+        'signing the moves with the keys of the players.',
+        parents=[parent_parser])
+
+    parser.add_argument(
+        'count',
+        type=int,
+        help='number of games to play at the same time')
+
+    parser.add_argument(
+        '--players',
+        type=str,
+        default='jack,jill',
+        help='the two players of the games, comma separated')
+
+    parser.add_argument(
+        '--prefix',
+        type=str,
+        default='bot',
+        help='prefix of the names of the games')
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=32,
+        help='number of requests sent at the same time')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed of the bots, for reproducible games')
+
+    parser.add_argument(
+        '--timeout',
+        type=int,
+        default=600,
+        help='set time, in seconds, to wait for the games to end')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
+
+    parser.add_argument(
+        '--key-dir',
+        type=str,
+        help="identify directory of the users' private key files")
+
+    parser.add_argument(
+        '--auth-user',
+        type=str,
+        help='specify username for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--auth-password',
+        type=str,
+        help='specify password for authentication if REST API '
+        'is using Basic Auth')
+
+def add_trace_parser(subparsers, parent_parser):
+    parser = subparsers.add_parser(
+        'trace',
+        help='Shows where the time of traced moves went',
+        description='Reads a trace file, written by the client and the '
+        'processors run with BATTLESHIP_TRACE set, and shows the time the '
+        'slowest moves, or the move <id>, spent being built, signed, '
+        'submitted, queued and applied, reading and writing state, and '
+        'until they committed.',
+        parents=[parent_parser])
+
+    parser.add_argument(
+        'file',
+        type=str,
+        help='trace file to read')
+
+    parser.add_argument(
+        '--id',
+        type=str,
+        help='show the stages of the moves whose trace id starts with id')
+
+    parser.add_argument(
+        '--slowest',
+        type=int,
+        default=10,
+        help='number of moves shown, slowest first')
+
+
 def create_parent_parser(prog_name):
     '''Define the -V/--version command line options.'''
     parent_parser = argparse.ArgumentParser(prog=prog_name, add_help=False)
@@ -447,6 +784,12 @@ def create_parser(prog_name):
     add_shoot_parser(subparsers, parent_parser)
     add_place_parser(subparsers, parent_parser)
     add_delete_parser(subparsers, parent_parser)
+    add_archive_parser(subparsers, parent_parser)
+    add_build_parser(subparsers, parent_parser)
+    add_submit_file_parser(subparsers, parent_parser)
+    add_run_parser(subparsers, parent_parser)
+    add_bots_parser(subparsers, parent_parser)
+    add_trace_parser(subparsers, parent_parser)
 
     return parser
 
@@ -457,10 +800,8 @@ def _get_url(args):
 def _get_keyfile(args):
     '''Get the private key for a customer.'''
     username = getpass.getuser() if args.username is None else args.username
-    home = os.path.expanduser("~")
-    key_dir = os.path.join(home, ".sawtooth", "keys")
 
-    return '{}/{}.priv'.format(key_dir, username)
+    return '{}/{}.priv'.format(_get_key_dir(args), username)
 
 
 def _get_auth_info(args):
@@ -478,29 +819,104 @@ def _get_pubkeyfile(customerName):
 
     return '{}/{}.pub'.format(key_dir, customerName)
 
+LIST_FIELDS = ['name', 'player1', 'player2', 'state']
+
+# Number of transactions sent by run between two checks of their status
+RUN_CHECK_INTERVAL = 50
+
+
+def _filter_games(games, state=None, player=None, limit=None):
+    '''Lazily apply the list filters to a stream of game field lists.'''
+    count = 0
+    for game_data in games:
+        if limit is not None and count >= limit:
+            return
+
+        name, board_P1, board_P2, game_state, player1, player2, boat_cases, to_place = game_data
+
+        if state is not None and game_state != state:
+            continue
+        if player is not None and player not in (player1, player2):
+            continue
+
+        count += 1
+        yield {
+            'name': name,
+            'player1': player1,
+            'player2': player2,
+            'state': game_state,
+        }
+
+
+def _write_table(games, out):
+    fmt = "%-15s %-15.15s %-15.15s %s"
+    print(fmt % ('GAME', 'PLAYER 1', 'PLAYER 2', 'STATE'), file=out)
+    for game in games:
+        print(fmt % (game['name'], game['player1'][:6], game['player2'][:6],
+                     game['state']), file=out)
+
+
+def _write_csv(games, out):
+    writer = csv.DictWriter(out, fieldnames=LIST_FIELDS)
+    writer.writeheader()
+    for game in games:
+        writer.writerow(game)
+
+
+def _write_ndjson(games, out):
+    for game in games:
+        out.write(json.dumps(game))
+        out.write("\n")
+
+
+def _write_json(games, out):
+    # Written element by element so the array streams like the other formats
+    out.write("[")
+    separator = "\n"
+    for game in games:
+        out.write(separator)
+        out.write(json.dumps(game))
+        separator = ",\n"
+    out.write("\n]\n")
+
+
+LIST_WRITERS = {
+    'table': _write_table,
+    'csv': _write_csv,
+    'ndjson': _write_ndjson,
+    'json': _write_json,
+}
+
+
 def do_list(args):
     url = _get_url(args)
     auth_user, auth_password = _get_auth_info(args)
 
     client = BattleshipClient(base_url=url, keyfile=None)
 
-    game_list = [
-        game.split(',')
-        for games in client.list(auth_user=auth_user,
-                                 auth_password=auth_password)
-        for game in games.decode().split('|')
-    ]
-
-    if game_list is not None:
-        fmt = "%-15s %-15.15s %-15.15s %s"
-        print(fmt % ('GAME', 'PLAYER 1', 'PLAYER 2', 'STATE'))
-        for game_data in game_list:
-
-            name, board_P1, board_P2, game_state, player1, player2, boat_cases, to_place = game_data
+    # Without filters, --limit also bounds the size of the first page
+    page_size = None
+    if args.limit is not None and args.state is None and args.player is None:
+        page_size = max(args.limit, 1)
+
+    # A state lives in a single address partition; only that one is read
+    partitions = GAME_PARTITIONS
+    if args.state is not None:
+        partitions = [partition_for_state(args.state)]
+
+    games = _filter_games(
+        client.iter_games(partitions=partitions,
+                          page_size=page_size,
+                          auth_user=auth_user,
+                          auth_password=auth_password),
+        state=args.state,
+        player=args.player,
+        limit=args.limit)
 
-            print(fmt % (name, player1[:6], player2[:6], game_state))
-    else:
-        raise BaseException("Could not retrieve game listing.")
+    try:
+        LIST_WRITERS[args.format](games, sys.stdout)
+    except ValueError as err:
+        raise BaseException("Could not retrieve game listing.") from err
 
 
 def do_show(args):
@@ -543,7 +959,31 @@ def do_show(args):
             raise Exception("Player {} doesn't exist in the game {}".format(currentplayer, name))
 
     else:
-        raise Exception("Game not found: {}".format(name))
+        # An archived game only has its result left
+        result = client.show_result(
+            name, auth_user=auth_user, auth_password=auth_password)
+        if result is None:
+            raise Exception("Game not found: {}".format(name))
+        display_result(name, result)
+
+def display_result(name, data):
+    '''
+    Function printing the result record of an archived game. 
+    '''
+    for result in data.decode().split('|'):
+        result_name, player1, player2, winner, moves, _ = result.split(',')
+        if result_name != name:
+            continue
+
+        print("GAME:     : {}".format(name))
+        print("PLAYER 1  : {}".format(player1[:6]))
+        print("PLAYER 2  : {}".format(player2[:6]))
+        print("WINNER    : {}".format(winner[:6]))
+        print("MOVES     : {}".format(moves))
+        print("The game is over and archived.")
+        return
+
+    raise Exception("Game not found: {}".format(name))
 
 def display_both_boards(name, player1, player2, game_state, board_current_player, board_enemy): 
     '''
@@ -698,7 +1138,15 @@ def do_shoot(args):
     # Get the boat cases number before the shoot update to show the right message to the player 
     data = client.show(name, auth_user=auth_user, auth_password=auth_password)
 
-    if data is not None:
+    if data is None:
+        # With BATTLESHIP_AUTO_ARCHIVE=1, the winning shot archived the game
+        result = client.show_result(
+            name, auth_user=auth_user, auth_password=auth_password)
+        if result is None:
+            raise Exception("Game not found: {}".format(name))
+        display_result(name, result)
+
+    else:
 
         board_str_P1, board_str_P2, game_state, player1, player2, boat_cases, to_place = {
             name: (board_P1, board_P2, state, player_1, player_2, boat_cases, to_place)
@@ -814,6 +1262,276 @@ def do_delete(args):
 
     print("Response: {}".format(response))
 
+def do_archive(args):
+    '''
+    This archives the finished game that has the name you give as argument
+    '''
+    name = args.name
+
+    url = _get_url(args)
+    keyfile = _get_keyfile(args)
+    auth_user, auth_password = _get_auth_info(args)
+
+    client = BattleshipClient(base_url=url, keyfile=keyfile)
+
+    response = client.archive(
+        name, wait=args.wait,
+        auth_user=auth_user,
+        auth_password=auth_password)
+
+    print("Response: {}".format(response))
+
+def _space(row, col):
+    return ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J"].index(
+        correct_space_row(row)) * 10 + correct_space_col(col)
+
+
+def _script_txn(client, private_key, username, command, arguments,
+                auth_user=None, auth_password=None):
+    '''Return the TransactionSpec of one command of a build script.'''
+    fields = {}
+    if command == 'create':
+        name, player1, player2 = arguments
+        fields = dict(player1=player1, player2=player2)
+    elif command == 'place':
+        name, row, col, boat, direction = arguments
+        fields = dict(
+            space=_space(row, col),
+            boat=correct_boat(boat),
+            direction=correct_direction(direction),
+            currentplayer=username)
+    elif command == 'shoot':
+        name, row, col = arguments
+        fields = dict(space=_space(row, col), currentplayer=username)
+    elif command in ('delete', 'archive'):
+        name, = arguments
+    else:
+        raise Exception("Invalid command: {}".format(command))
+
+    return client.txn_spec(
+        name, command,
+        private_key=private_key,
+        auth_user=auth_user,
+        auth_password=auth_password,
+        **fields)
+
+
+def _get_key_dir(args):
+    return default_key_dir() if args.key_dir is None else args.key_dir
+
+
+def _read_script(client, path, key_dir, auth_user=None, auth_password=None):
+    '''Yield the line number, game name and TransactionSpec of each
+       command of a script.
+    '''
+    keystore = get_keystore()
+
+    with open(path) as fd:
+        for line_number, line in enumerate(fd, 1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            if len(words) < 3:
+                raise Exception("Line {}: missing command".format(line_number))
+
+            username, command = words[0], words[1]
+            private_key = keystore.load_user(username, key_dir)
+
+            try:
+                spec = _script_txn(
+                    client, private_key, username,
+                    command, words[2:],
+                    auth_user=auth_user,
+                    auth_password=auth_password)
+            except (ValueError, argparse.ArgumentTypeError) as err:
+                raise Exception("Line {}: {}".format(line_number, err))
+
+            yield line_number, words[2], spec
+
+
+def do_build(args):
+    '''
+    This signs the commands of a script into a batch file
+    '''
+    url = _get_url(args)
+    auth_user, auth_password = _get_auth_info(args)
+    key_dir = _get_key_dir(args)
+
+    # One client keeps track of the players of every game in the script
+    client = BattleshipClient(base_url=url, keyfile=None)
+
+    specs = [
+        (name, spec) for _, name, spec in _read_script(
+            client, args.script, key_dir,
+            auth_user=auth_user,
+            auth_password=auth_password)
+    ]
+
+    # The transactions of a game are chained, as in run, so they are
+    # applied in order whatever order the batches arrive in
+    with SigningPool(workers=args.workers) as pool:
+        batches = pool.sign_chained(specs)
+
+    records = write_batch_file(
+        args.output, batches, batches_per_list=args.batches_per_list)
+
+    print("Wrote {} batches in {} requests to {}".format(
+        len(batches), records, args.output))
+
+
+def do_run(args):
+    '''
+    This plays a script, chaining the transactions of each game
+    '''
+    url = _get_url(args)
+    auth_user, auth_password = _get_auth_info(args)
+
+    client = BattleshipClient(base_url=url, keyfile=None, pipeline=True)
+
+    sent = 0
+    skipped = 0
+    for line_number, name, spec in _read_script(
+            client, args.script, _get_key_dir(args),
+            auth_user=auth_user,
+            auth_password=auth_password):
+        try:
+            client.send_spec(
+                name, spec,
+                auth_user=auth_user,
+                auth_password=auth_password)
+            sent += 1
+        except Exception as err:
+            print("Line {}: {}".format(line_number, err), file=sys.stderr)
+            skipped += 1
+
+        # Look for broken chains now and then, to skip their games early
+        if sent % RUN_CHECK_INTERVAL == 0:
+            client.check_pipeline(
+                auth_user=auth_user,
+                auth_password=auth_password)
+
+    broken = client.flush(
+        timeout=args.timeout,
+        auth_user=auth_user,
+        auth_password=auth_password)
+
+    print("Sent {} transactions, skipped {}, {} still pending".format(
+        sent, skipped, client.pending))
+    for name, reason in sorted(broken.items()):
+        print("Game {}: {}".format(name, reason), file=sys.stderr)
+
+    if broken or client.pending:
+        raise Exception("Script did not complete")
+
+
+def do_bots(args):
+    '''
+    This plays games between bots until they are all over
+    '''
+    url = _get_url(args)
+    auth_user, auth_password = _get_auth_info(args)
+    player1, player2 = args.players.split(',')
+
+    client = BattleshipClient(base_url=url, keyfile=None)
+
+    with BotDriver(
+            client,
+            key_dir=_get_key_dir(args),
+            workers=args.workers,
+            seed=args.seed,
+            auth_user=auth_user,
+            auth_password=auth_password) as driver:
+        for i in range(args.count):
+            driver.add_game(
+                '{}{}'.format(args.prefix, i), player1, player2)
+
+        unfinished = driver.run(timeout=args.timeout)
+        games = list(driver.games.values())
+
+    finished = [game for game in games if game.winner is not None]
+    print("Finished {} games, {} failed, {} unfinished".format(
+        len(finished),
+        sum(1 for game in games if game.error is not None),
+        len(unfinished)))
+    if finished:
+        print("Mean moves per game: {:.1f}".format(
+            sum(game.moves for game in finished) / len(finished)))
+
+    for game in games:
+        if game.error is not None:
+            print("Game {}: {}".format(game.name, game.error), file=sys.stderr)
+
+    if len(finished) < len(games):
+        raise Exception("Not all games were played to the end")
+
+
+def _ms(microseconds):
+    return '{:.3f}'.format(microseconds / 1000)
+
+
+def do_trace(args):
+    '''
+    This shows the stages of the moves of a trace file
+    '''
+    moves = summarize(read_trace(args.file))
+
+    if args.id is not None:
+        matching = [trace for trace in moves if trace.startswith(args.id)]
+        if not matching:
+            raise Exception("No move with trace id {}".format(args.id))
+
+        fmt = "%-12s %12s %12s %6s"
+        for trace in matching:
+            start, end, stages = moves[trace]
+            print("Move {}: {} ms".format(trace, _ms(end - start)))
+            print(fmt % ('STAGE', 'AT MS', 'MS', 'COUNT'))
+            for stage in STAGES:
+                if stage in stages:
+                    at, duration, count = stages[stage]
+                    print(fmt % (stage, _ms(at - start), _ms(duration), count))
+        return
+
+    columns = [
+        stage for stage in STAGES
+        if any(stage in stages for _, _, stages in moves.values())
+    ]
+    fmt = "%-16s %10s" + " %10s" * len(columns)
+    print(fmt % tuple(['TRACE ID', 'TOTAL MS'] + [
+        stage.upper() for stage in columns]))
+    for trace, (start, end, stages) in list(moves.items())[:args.slowest]:
+        print(fmt % tuple([trace[:16], _ms(end - start)] + [
+            _ms(stages[stage][1]) if stage in stages else '-'
+            for stage in columns]))
+
+
+def do_submit_file(args):
+    '''
+    This submits the batches of a batch file
+    '''
+    url = _get_url(args)
+    auth_user, auth_password = _get_auth_info(args)
+
+    client = BattleshipClient(base_url=url, keyfile=None)
+
+    stats = submit_file(
+        client, args.file,
+        rate=args.rate,
+        in_flight=args.in_flight,
+        timeout=args.timeout,
+        auth_user=auth_user,
+        auth_password=auth_password)
+
+    print("Submitted {} requests in {:.2f}s ({:.1f}/s), {} failed, "
+          "{} batches still pending".format(
+              stats.submitted, stats.elapsed, stats.rate, stats.failed,
+              stats.pending))
+    for error in stats.errors[:10]:
+        print("Error: {}".format(error), file=sys.stderr)
+
+    if stats.failed or stats.pending:
+        raise Exception("Batch file did not complete")
+
+
 def _game_boat_data_to_list(boat_str): 
     out = []
     for i in range(2): 
@@ -847,6 +1565,18 @@ def main(prog_name=os.path.basename(sys.argv[0]), args=None):
         do_place(args)
     elif args.command == 'delete':
         do_delete(args)
+    elif args.command == 'archive':
+        do_archive(args)
+    elif args.command == 'build':
+        do_build(args)
+    elif args.command == 'submit-file':
+        do_submit_file(args)
+    elif args.command == 'run':
+        do_run(args)
+    elif args.command == 'bots':
+        do_bots(args)
+    elif args.command == 'trace':
+        do_trace(args)
     else:
         raise Exception("Invalid command: {}".format(args.command))
 
@@ -16,66 +16,142 @@
 This SimpleWalletClient class interfaces with Sawtooth through the REST API.
 '''
 
+import collections
 import hashlib
 import base64
 from base64 import b64encode
+import os
 import time 
-import random
-import requests
 import yaml
 
-from sawtooth_signing import create_context
-from sawtooth_signing import CryptoFactory
-from sawtooth_signing import ParseError
-from sawtooth_signing.secp256k1 import Secp256k1PrivateKey
 
-from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
-from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
 from sawtooth_sdk.protobuf.batch_pb2 import BatchList
-from sawtooth_sdk.protobuf.batch_pb2 import BatchHeader
-from sawtooth_sdk.protobuf.batch_pb2 import Batch
+
+from battleship_family.battleship_keystore import get_keystore
+from battleship_family.battleship_payload import FAMILY_VERSIONS
+from battleship_family.battleship_payload import encode_payload
+from battleship_family.battleship_payload import payload_action
+from battleship_family.battleship_signing import TransactionSpec
+from battleship_family.battleship_signing import sign_spec
+from battleship_family.battleship_trace import get_tracer
+from battleship_family.battleship_trace import trace_id
+from battleship_family.battleship_transport import make_transport
 
 # The Transaction Family Name
 FAMILY_NAME = 'battleship'
 
+# Address partitions, as laid out by the transaction processor
+PARTITION_PLACING = '00'
+PARTITION_IN_PLAY = '01'
+PARTITION_FINISHED = '02'
+PARTITION_RESULTS = '03'
+PARTITION_PLAYERS = '10'
+
+GAME_PARTITIONS = (PARTITION_PLACING, PARTITION_IN_PLAY, PARTITION_FINISHED)
+
+# Actions that only read state; they are served by the query methods and
+# are refused by the transaction processor
+READ_ONLY_ACTIONS = ('list', 'show')
+
+# Family version of the transactions sent, unless given to the client:
+# 1.0 for CSV payloads, 2.0 for binary ones
+FAMILY_VERSION_ENV = 'BATTLESHIP_FAMILY_VERSION'
+
+# Actions that add or remove the game in the index of its players, and so
+# declare the index entries of the game, reading its players if needed.
+INDEX_ACTIONS = ('create', 'delete', 'archive')
+
+# With BATTLESHIP_AUTO_ARCHIVE=1 on the processors, the winning shot archives
+# the game and removes its index entries, and no shot is known not to win.
+# A shot declares the entries of the game when the client knows its players,
+# and the whole index partition otherwise, rather than reading the game.
+ARCHIVING_ACTIONS = ('shoot',)
+
+# Name IDs of the boats, as in the TP, and their lengths, in fleet order
+ID_BOAT = ['L', 'M', 'N', 'Q', 'P']
+BOAT_LENGTHS = [5, 4, 3, 3, 2]
+
+# Order in which show() looks for a game, most frequently read first
+SHOW_PARTITIONS = (PARTITION_IN_PLAY, PARTITION_PLACING, PARTITION_FINISHED)
+
 def _hash(data):
     return hashlib.sha512(data).hexdigest()
 
 
+# The address prefix of the family
+NAMESPACE = _hash(FAMILY_NAME.encode('utf-8'))[0:6]
+
+
+def partition_for_state(state):
+    '''Return the address partition holding the games in state.'''
+    if state == 'PLACE':
+        return PARTITION_PLACING
+    if state in ('P1-WIN', 'P2-WIN'):
+        return PARTITION_FINISHED
+    return PARTITION_IN_PLAY
+
+
+def deserialize_games(data):
+    '''Split a state entry into the field lists of the games it holds.'''
+    return [game.split(',') for game in data.decode().split('|')]
+
+
 class BattleshipClient(object):
     '''Client battleship class.
 
     This supports create game, delete game, list existing games, shoot, place, show functions.
     '''
 
-    def __init__(self, base_url, keyfile=None):
+    def __init__(self, base_url, keyfile=None, pipeline=False, family_version=None):
         '''Initialize the client class.
 
            This is mainly getting the key pair and computing the address.
+           With pipeline, the transactions of a game are chained and sent
+           without waiting for the previous one to commit. family_version
+           sets the payload encoding of the transactions, from
+           BATTLESHIP_FAMILY_VERSION by default, else 1.0.
         '''
 
         self._baseUrl = base_url
 
+        if family_version is None:
+            family_version = os.environ.get(FAMILY_VERSION_ENV) or '1.0'
+        if family_version not in FAMILY_VERSIONS:
+            raise Exception("Unsupported family version: {}".format(
+                family_version))
+        self._family_version = family_version
+
+        # REST API by default, the validator itself for tcp:// URLs, and
+        # several of them for a comma separated list
+        self._transport = make_transport(base_url)
+
+        # Players of the games this client has created or read, by game name
+        self._players = {}
+
+        # Spans of the transactions sent, with BATTLESHIP_TRACE set
+        self._tracer = get_tracer()
+
+        # Pipeline mode: last transaction sent per game, batches not yet
+        # committed with their game, and the games whose chain is broken
+        self._pipeline = pipeline
+        self._chains = {}
+        self._pending = collections.OrderedDict()
+        self._broken = {}
+
         if keyfile is None:
             self._signer = None
+            self._privateKey = None
             return
 
-        try:
-            with open(keyfile) as fd:
-                privateKeyStr = fd.read().strip()
-        except OSError as err:
-            raise Exception('Failed to read private key {}: {}'.format(
-                keyfile, str(err)))
+        # Keys are shared by every client of the process, read only once
+        keystore = get_keystore()
 
-        try:
-            privateKey = Secp256k1PrivateKey.from_hex(privateKeyStr)
-        except ParseError as err:
-            raise Exception('Failed to load private key: {}'.format(str(err)))
+        # Sent along with the specs built for a SigningPool
+        self._privateKey = keystore.load_file(keyfile)
 
-        self._signer = CryptoFactory(create_context('secp256k1')) \
-            .new_signer(privateKey)
+        self._signer = keystore.signer(self._privateKey)
 
-        self._publicKey = self._signer.get_public_key().as_hex()
+        self._publicKey = keystore.public_key(self._privateKey)
 
         self._address = _hash(FAMILY_NAME.encode('utf-8'))[0:6] + \
             _hash(self._publicKey.encode('utf-8'))[0:64]
@@ -105,6 +181,14 @@ class BattleshipClient(object):
             auth_user=auth_user,
             auth_password=auth_password)
 
+    def archive(self, name, wait=None, auth_user=None, auth_password=None):
+        return self._send_battleship_txn(
+            name,
+            "archive",
+            wait=wait,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
     def shoot(self, name, space, currentplayer, wait=None, auth_user=None, auth_password=None):
         return self._send_battleship_txn(
             name,
@@ -127,272 +211,322 @@ class BattleshipClient(object):
             auth_user=auth_user,
             auth_password=auth_password)
 
-    def list(self, auth_user=None, auth_password=None):
-        battleship_prefix = self._get_prefix()
+    def list(self, partitions=GAME_PARTITIONS, auth_user=None, auth_password=None):
+        try:
+            return list(self.iter_list(
+                partitions=partitions,
+                auth_user=auth_user,
+                auth_password=auth_password))
+
+        except BaseException:
+            return None
+
+    def iter_list(self, partitions=GAME_PARTITIONS, page_size=None,
+                  auth_user=None, auth_password=None):
+        '''Yield the raw state entries of the given game partitions.
+
+           Entries are fetched one page at a time, so a caller
+           that stops iterating early never downloads the remaining pages.
+        '''
+        for partition in partitions:
+            for data in self._transport.list_state(
+                    self._get_prefix() + partition,
+                    page_size=page_size,
+                    auth_user=auth_user,
+                    auth_password=auth_password):
+                yield data
+
+    def iter_games(self, partitions=GAME_PARTITIONS, page_size=None,
+                   auth_user=None, auth_password=None):
+        '''Yield the field list of every game in the given partitions.'''
+        for entry in self.iter_list(
+                partitions=partitions,
+                page_size=page_size,
+                auth_user=auth_user,
+                auth_password=auth_password):
+            for game in deserialize_games(entry):
+                yield game
+
+    def show(self, name, auth_user=None, auth_password=None):
+        for partition in SHOW_PARTITIONS:
+            data = self._transport.get_state(
+                self._get_address(name, partition),
+                auth_user=auth_user,
+                auth_password=auth_password)
+            if data is not None:
+                return data
+
+        return None
 
-        result = self._send_request(
-            "state?address={}".format(battleship_prefix),
+    def show_result(self, name, auth_user=None, auth_password=None):
+        '''Return the archived result entry of game name, or None.'''
+        return self._transport.get_state(
+            self._get_address(name, PARTITION_RESULTS),
             auth_user=auth_user,
             auth_password=auth_password)
 
-        try:
-            encoded_entries = yaml.safe_load(result)["data"]
+    def my_games(self, player, auth_user=None, auth_password=None):
+        '''Return the (name, state) pairs of the games player takes part in.
 
-            return [
-                base64.b64decode(entry["data"]) for entry in encoded_entries
-            ]
+           This lists the index entries of the player maintained by the
+           transaction processor, one per game, then reads the states of
+           those games only, instead of scanning every game.
+        '''
+        names = set()
+        for data in self._transport.list_state(
+                self._get_player_index_prefix(player),
+                auth_user=auth_user,
+                auth_password=auth_password):
+            names.update(data.decode().split('|'))
 
-        except BaseException:
-            return None
+        games = self.show_many(
+            sorted(names),
+            auth_user=auth_user,
+            auth_password=auth_password)
+        return [
+            (name, games[name][3])
+            for name in sorted(names) if games[name] is not None
+        ]
 
-    def show(self, name, auth_user=None, auth_password=None):
-        address = self._get_address(name)
+    def query(self, addresses, auth_user=None, auth_password=None):
+        '''Read several state addresses at once.
 
-        result = self._send_request(
-            "state/{}".format(address),
-            name=name,
+           Returns the data of each address, or None, by address.
+        '''
+        return self._transport.get_states(
+            addresses,
             auth_user=auth_user,
             auth_password=auth_password)
-        try:
-            return base64.b64decode(yaml.safe_load(result)["data"])
 
-        except BaseException:
-            return None
+    def query_games(self, names, auth_user=None, auth_password=None):
+        '''Read several games with batched state reads.
 
-    def _send_to_restapi(self,
-                         suffix,
-                         data=None,
-                         contentType=None):
-        '''Send a REST command to the Validator via the REST API.'''
+           Returns, by name, the state entry holding the game as show()
+           does, or None for a game that does not exist. The partitions are
+           read in the order of show(), each only for the games not found
+           in the previous ones, so most games cost a single read.
+        '''
+        games = {name: None for name in names}
+
+        missing = list(games)
+        for partition in SHOW_PARTITIONS:
+            if not missing:
+                break
+
+            addresses = {
+                name: self._get_address(name, partition) for name in missing
+            }
+            values = self.query(
+                list(addresses.values()),
+                auth_user=auth_user,
+                auth_password=auth_password)
 
-        if self._baseUrl.startswith("http://"):
-            url = "{}/{}".format(self._baseUrl, suffix)
-        else:
-            url = "http://{}/{}".format(self._baseUrl, suffix)
+            for name, address in addresses.items():
+                data = values.get(address)
+                if data and any(game[0] == name
+                                for game in deserialize_games(data)):
+                    games[name] = data
+            missing = [name for name in missing if games[name] is None]
 
-        headers = {}
+        return games
 
-        if contentType is not None:
-            headers['Content-Type'] = contentType
+    def show_many(self, names, prefix_reads=False,
+                  auth_user=None, auth_password=None):
+        '''Return the field lists of several games, by name.
 
-        try:
-            if data is not None:
-                result = requests.post(url, headers=headers, data=data)
-            else:
-                result = requests.get(url, headers=headers)
+           Missing games map to None. The addresses of the games are read
+           concurrently; with prefix_reads, the game partitions are listed
+           instead, which is cheaper when the games asked for are a large
+           share of all the games.
+        '''
+        games = {name: None for name in names}
 
-            if not result.ok:
-                raise Exception("Error {}: {}".format(
-                    result.status_code, result.reason))
+        if prefix_reads:
+            for game in self.iter_games(
+                    partitions=SHOW_PARTITIONS,
+                    auth_user=auth_user,
+                    auth_password=auth_password):
+                if game[0] in games:
+                    games[game[0]] = game
+            return games
 
-        except requests.ConnectionError as err:
-            raise Exception(
-                'Failed to connect to {}: {}'.format(url, str(err)))
+        entries = self.query_games(
+            names,
+            auth_user=auth_user,
+            auth_password=auth_password)
+        for name, data in entries.items():
+            if data is None:
+                continue
+            for game in deserialize_games(data):
+                if game[0] == name:
+                    games[name] = game
+
+        return games
+
+    def get_batch_statuses(self, batch_ids, wait=0,
+                           auth_user=None, auth_password=None):
+        '''Return the status of each of batch_ids, by batch id.'''
+        return self._transport.get_batch_statuses(
+            batch_ids,
+            wait=wait,
+            auth_user=auth_user,
+            auth_password=auth_password)
 
-        except BaseException as err:
-            raise Exception(err)
-
-        return result.text
-
-    def _wrap_and_send(self,
-                       action,
-                       *values):
-        '''Create a transaction, then wrap it in a batch.     
-                                                              
-           Even single transactions must be wrapped into a batch.
-        ''' 
-
-        # Generate a csv utf-8 encoded string as payload
-        rawPayload = action
-
-        for val in values:
-            rawPayload = ",".join([rawPayload, str(val)])
-
-        payload = rawPayload.encode()
-
-        # Construct the address where we'll store our state
-        address = self._address
-        inputAddressList = [address]
-        outputAddressList = [address]
-
-        if "transfer" == action:
-            toAddress = _hash(FAMILY_NAME.encode('utf-8'))[0:6] + \
-            _hash(values[1].encode('utf-8'))[0:64]
-            inputAddressList.append(toAddress)
-            outputAddressList.append(toAddress)
-
-        # Create a TransactionHeader
-        header = TransactionHeader(
-            signer_public_key=self._publicKey,
-            family_name=FAMILY_NAME,
-            family_version="1.0",
-            inputs=inputAddressList,
-            outputs=outputAddressList,
-            dependencies=[],
-            payload_sha512=_hash(payload),
-            batcher_public_key=self._publicKey,
-            nonce=random.random().hex().encode()
-        ).SerializeToString()
-
-        # Create a Transaction from the header and payload above
-        transaction = Transaction(
-            header=header,
-            payload=payload,
-            header_signature=self._signer.sign(header)
-        )
-
-        transactionList = [transaction]
-
-        # Create a BatchHeader from transactionList above
-        header = BatchHeader(
-            signer_public_key=self._publicKey,
-            transaction_ids=[txn.header_signature for txn in transactionList]
-        ).SerializeToString()
-
-        #Create Batch using the BatchHeader and transactionList above
-        batch = Batch(
-            header=header,
-            transactions=transactionList,
-            header_signature=self._signer.sign(header))
-
-        #Create a Batch List from Batch above
-        batch_list = BatchList(batches=[batch])
-
-        # Send batch_list to rest-api
-        return self._send_to_restapi(
-            "batches",
-            batch_list.SerializeToString(),
-            'application/octet-stream')
+    def get_head(self, auth_user=None, auth_password=None):
+        '''Return the id of the current chain head block.'''
+        return self._transport.get_head(
+            auth_user=auth_user,
+            auth_password=auth_password)
 
     def _get_status(self, batch_id, wait, auth_user=None, auth_password=None):
         try:
-            result = self._send_request(
-                'batch_statuses?id={}&wait={}'.format(batch_id, wait),
+            return self._transport.get_batch_status(
+                batch_id,
+                wait,
                 auth_user=auth_user,
                 auth_password=auth_password)
-            return yaml.safe_load(result)['data'][0]['status']
         except BaseException as err:
             raise Exception(err) from err
 
     def _get_prefix(self):
         return _hash('battleship'.encode('utf-8'))[0:6]
 
-    def _get_address(self, name):
+    def _get_address(self, name, partition):
         battleship_prefix = self._get_prefix()
-        game_address = _hash(name.encode('utf-8'))[0:64]
-        return battleship_prefix + game_address
-
-    def _send_request(self,
-                      suffix,
-                      data=None,
-                      content_type=None,
-                      name=None,
-                      auth_user=None,
-                      auth_password=None):
-        '''Send a REST command to the Validator via the REST API.'''
-
-        if self._baseUrl.startswith("http://"):
-            url = "{}/{}".format(self._baseUrl, suffix)
-        else:
-            url = "http://{}/{}".format(self._baseUrl, suffix)
-
-        headers = {}
-
-        if auth_user is not None:
-            auth_string = "{}:{}".format(auth_user, auth_password)
-            b64_string = b64encode(auth_string.encode()).decode()
-            auth_header = 'Basic {}'.format(b64_string)
-            headers['Authorization'] = auth_header
-
-        if content_type is not None:
-            headers['Content-Type'] = content_type
+        game_address = _hash(name.encode('utf-8'))[0:62]
+        return battleship_prefix + partition + game_address
 
-        try:
-            if data is not None:
-                result = requests.post(url, headers=headers, data=data)
-            else:
-                result = requests.get(url, headers=headers)
+    def _get_player_index_prefix(self, player):
+        return self._get_prefix() + PARTITION_PLAYERS + \
+            _hash(player.encode('utf-8'))[0:30]
+
+    def _get_player_game_address(self, player, name):
+        return self._get_player_index_prefix(player) + \
+            _hash(name.encode('utf-8'))[0:32]
+
+    def _get_players(self, name, auth_user=None, auth_password=None):
+        '''Return the players of game name, reading the game if needed.
+
+           The index entries of the game for both players are declared in
+           the inputs and outputs of the INDEX_ACTIONS.
+        '''
+        if name not in self._players:
+            data = self.show(
+                name,
+                auth_user=auth_user,
+                auth_password=auth_password)
+            if data is None:
+                raise Exception("No such game: {}".format(name))
 
-            if result.status_code == 404:
+            for game in deserialize_games(data):
+                if game[0] == name:
+                    self._players[name] = (game[4], game[5])
+
+            if name not in self._players:
                 raise Exception("No such game: {}".format(name))
 
-            if not result.ok:
-                raise Exception("Error {}: {}".format(
-                    result.status_code, result.reason))
+        return self._players[name]
+
+    def get_game_addresses(self, name):
+        '''Return every address the record of game name can live at.
 
-        except requests.ConnectionError as err:
+           A game moves to another partition on state transitions, and
+           archiving moves it into the results partition.
+        '''
+        return [
+            self._get_address(name, partition)
+            for partition in GAME_PARTITIONS + (PARTITION_RESULTS,)
+        ]
+
+    def _get_addresses(self, name, players):
+        addresses = self.get_game_addresses(name)
+        for player in players:
+            address = self._get_player_game_address(player, name)
+            if player and address not in addresses:
+                addresses.append(address)
+        return addresses
+
+    def txn_spec(self,
+                 name,
+                 action,
+                 space="",
+                 boat="",
+                 direction="",
+                 player1="",
+                 player2="",
+                 currentplayer="",
+                 private_key=None,
+                 auth_user=None,
+                 auth_password=None):
+        '''Return the unsigned TransactionSpec of a battleship action.
+
+           The spec can be signed inline, or by a SigningPool when many
+           transactions are prepared at once. private_key, a hex encoded
+           key, signs the spec instead of the key of the client.
+        '''
+        if action in READ_ONLY_ACTIONS:
             raise Exception(
-                'Failed to connect to {}: {}'.format(url, str(err))) from err
+                "{} only reads state, use the query methods instead of a "
+                "transaction".format(action))
+
+        # A delimited utf-8 encoded string in 1.0, packed bytes in 2.0
+        payload = encode_payload(
+            self._family_version, name, action, space=space, boat=boat,
+            direction=direction, player1=player1, player2=player2,
+            currentplayer=currentplayer)
+
+        # Construct the addresses of the game, and of its index entries when
+        # the action changes them
+        if action == "create":
+            self._players[name] = (player1, player2)
+        players = ()
+        if action in INDEX_ACTIONS:
+            players = self._get_players(
+                name,
+                auth_user=auth_user,
+                auth_password=auth_password)
+        elif action in ARCHIVING_ACTIONS:
+            players = self._players.get(name, ())
+        addresses = self._get_addresses(name, players)
+        if action in ARCHIVING_ACTIONS and not players:
+            addresses.append(self._get_prefix() + PARTITION_PLAYERS)
 
-        except BaseException as err:
-            raise Exception(err) 
+        if private_key is None:
+            private_key = self._privateKey
 
-        return result.text
+        return TransactionSpec(
+            private_key, payload, addresses, [], self._family_version)
 
-    def _send_battleship_txn(self,
-                     name,
-                     action,
-                     space="",
-                     boat="", 
-                     direction="", 
-                     player1="", 
-                     player2="", 
-                     currentplayer="", 
-                     wait=None,
-                     auth_user=None,
-                     auth_password=None):
-        # Serialization is just a delimited utf-8 encoded string
-        payload = ",".join([name, action, str(space), str(boat), str(direction), str(player1), str(player2), str(currentplayer)]).encode()
-
-        # Construct the address where we'll store our state 
-        address = self._get_address(name)
-
-        # Create a TransactionHeader 
-        header = TransactionHeader(
-            signer_public_key=self._publicKey,
-            family_name="battleship",
-            family_version="1.0",
-            inputs=[address],
-            outputs=[address],
-            dependencies=[],
-            payload_sha512=_hash(payload),
-            batcher_public_key=self._publicKey,
-            nonce=hex(random.randint(0, 2**64))
-        ).SerializeToString()
-
-        # Create a Transaction from the header and payload above 
-        transaction = Transaction(
-            header=header,
-            payload=payload,
-            header_signature=self._signer.sign(header)
-        )
-
-        transactionList = [transaction]
-
-        # Create a BatchHeader from transactionList above
-        header = BatchHeader(
-            signer_public_key=self._publicKey, 
-            transaction_ids=[txn.header_signature for txn in transactionList]
-        ).SerializeToString()
- 
-        # Create Batch using the BatchHeader and transactionList above 
-        batch = Batch(
-            header=header,
-            transactions=transactionList,
-            header_signature=self._signer.sign(header))
-
-        # Create a Batch List from Batch above 
-        batch_list = BatchList(batches=[batch])
-        batch_id = batch_list.batches[0].header_signature
+    def send_batches(self, batches, wait=None, key=None, auth_user=None, auth_password=None):
+        '''Submit signed batches in one BatchList.
+
+           With wait, block until the last batch is no longer pending or
+           wait seconds have passed. key names the game of the batches.
+        '''
+        batch_list = BatchList(batches=batches)
+        batch_id = batch_list.batches[-1].header_signature
+
+        traces = [
+            trace_id(transaction)
+            for batch in batches for transaction in batch.transactions
+        ] if self._tracer.enabled else []
+
+        submitting = self._tracer.now()
+        response = self.submit_batch_list(
+            batch_list.SerializeToString(),
+            key=key,
+            auth_user=auth_user,
+            auth_password=auth_password)
+        submitted = self._tracer.now()
+
+        for trace in traces:
+            self._tracer.span('submit', submitting, submitted, trace)
+            self._tracer.flow_start(submitting, trace)
 
         if wait and wait > 0:
             wait_time = 0
             start_time = time.time()
-            response = self._send_request(
-                "batches", batch_list.SerializeToString(),
-                'application/octet-stream',
-                auth_user=auth_user,
-                auth_password=auth_password)
+            status = 'PENDING'
             while wait_time < wait:
                 status = self._get_status(
                     batch_id,
@@ -402,12 +536,163 @@ class BattleshipClient(object):
                 wait_time = time.time() - start_time
 
                 if status != 'PENDING':
-                    return response
+                    break
+
+            for trace in traces:
+                self._tracer.span(
+                    'commit', submitted, self._tracer.now(), trace,
+                    status=status)
+
+        return response
+
+    def send_spec(self, name, spec, wait=None, auth_user=None, auth_password=None,
+                  started=None):
+        '''Sign spec, a transaction on game name, and submit it.
+
+           In pipeline mode the transaction depends on the previous one sent
+           for the same game, so the validator applies them in order even
+           though it is sent before that one commits. started, the time the
+           building of spec started, is traced as its build stage.
+        '''
+        if self._pipeline:
+            if name in self._broken:
+                raise Exception("Move chain of game {} is broken: {}".format(
+                    name, self._broken[name]))
+            if name in self._chains:
+                spec = spec._replace(dependencies=[self._chains[name]])
+
+        signing = self._tracer.now()
+        batch = sign_spec(spec)
+        if self._tracer.enabled:
+            trace = trace_id(batch.transactions[0])
+            action = payload_action(spec.payload, spec.family_version)
+            if started is not None:
+                self._tracer.span(
+                    'build', started, signing, trace, game=name, action=action)
+            self._tracer.span(
+                'sign', signing, self._tracer.now(), trace, game=name,
+                action=action)
+
+        response = self.send_batches(
+            [batch],
+            wait=wait,
+            key=name,
+            auth_user=auth_user,
+            auth_password=auth_password)
 
-            return response
+        if self._pipeline:
+            self._chains[name] = batch.transactions[0].header_signature
+            self._pending[batch.header_signature] = name
 
-        return self._send_request(
-            "batches", batch_list.SerializeToString(),
-            'application/octet-stream',
+        return response
+
+    @property
+    def pending(self):
+        '''Number of pipelined batches not known to be committed.'''
+        return len(self._pending)
+
+    def check_pipeline(self, wait=0, auth_user=None, auth_password=None):
+        '''Update the status of the pipelined batches not yet committed.
+
+           An invalid or unknown batch breaks the chain of its game: the
+           transactions depending on it can never commit, and new ones for
+           the game are refused until reset_chain(). Returns the broken
+           chains, as game name -> reason.
+        '''
+        if self._pending:
+            statuses = self._transport.get_batch_statuses(
+                list(self._pending),
+                wait=wait,
+                auth_user=auth_user,
+                auth_password=auth_password)
+
+            for batch_id, status in statuses.items():
+                if batch_id not in self._pending:
+                    continue
+                if status == 'COMMITTED':
+                    del self._pending[batch_id]
+                elif status in ('INVALID', 'UNKNOWN'):
+                    name = self._pending.pop(batch_id)
+                    self._broken.setdefault(
+                        name, "batch {} is {}".format(batch_id, status))
+
+            for batch_id, name in list(self._pending.items()):
+                if name in self._broken:
+                    del self._pending[batch_id]
+
+        return dict(self._broken)
+
+    def flush(self, timeout=None, auth_user=None, auth_password=None):
+        '''Wait until every pipelined batch is committed or broken.
+
+           Gives up after timeout seconds, leaving the rest pending. Returns
+           the broken chains, like check_pipeline().
+        '''
+        start_time = time.time()
+        while self._pending:
+            wait = 30
+            if timeout is not None:
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                wait = max(1, min(wait, int(remaining)))
+
+            self.check_pipeline(
+                wait=wait,
+                auth_user=auth_user,
+                auth_password=auth_password)
+
+        return dict(self._broken)
+
+    def reset_chain(self, name):
+        '''Forget the pipelined transactions of game name.'''
+        self._chains.pop(name, None)
+        self._broken.pop(name, None)
+        for batch_id, game in list(self._pending.items()):
+            if game == name:
+                del self._pending[batch_id]
+
+    def submit_batch_list(self, data, key=None, auth_user=None, auth_password=None):
+        '''Submit an already serialized BatchList.
+
+           With several endpoints, the BatchLists of the same key are all
+           sent to the same one.
+        '''
+        return self._transport.submit_batches(
+            data,
+            key=key,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def _send_battleship_txn(self,
+                     name,
+                     action,
+                     space="",
+                     boat="", 
+                     direction="", 
+                     player1="", 
+                     player2="", 
+                     currentplayer="", 
+                     wait=None,
+                     auth_user=None,
+                     auth_password=None):
+        started = self._tracer.now()
+        spec = self.txn_spec(
+            name,
+            action,
+            space=space,
+            boat=boat,
+            direction=direction,
+            player1=player1,
+            player2=player2,
+            currentplayer=currentplayer,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+        return self.send_spec(
+            name,
+            spec,
+            wait=wait,
             auth_user=auth_user,
-            auth_password=auth_password)
\ No newline at end of file
+            auth_password=auth_password,
+            started=started)
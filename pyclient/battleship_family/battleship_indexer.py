@@ -0,0 +1,611 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Read-side indexer for the battleship transaction family.
+
+Follows the state changes of the battleship namespace, either live from the
+validator's event stream or from a recorded file, and keeps a SQLite
+projection of the games that lobby and analytics queries can use instead of
+scanning the namespace through the REST API.
+
+Each block is stored with its parent and the addresses it changed. A block
+whose parent is not the last one applied comes from a fork: the blocks it
+replaces are dropped and the addresses they changed are read again from the
+validator, and recorded with the block so that a replay gets them too.
+'''
+
+import argparse
+import base64
+import json
+import logging
+import os
+import sqlite3
+import sys
+import traceback
+
+from battleship_family.battleship_client import GAME_PARTITIONS
+from battleship_family.battleship_client import NAMESPACE
+from battleship_family.battleship_client import PARTITION_RESULTS
+from battleship_family.battleship_client import deserialize_games
+from battleship_family.battleship_transport import make_transport
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_VALIDATOR_URL = 'tcp://validator:4004'
+DEFAULT_DB = 'battleship-index.sqlite'
+
+# Subscribing from this block id replays every event since genesis
+NULL_BLOCK_ID = '0000000000000000'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    name TEXT PRIMARY KEY,
+    address TEXT NOT NULL,
+    state TEXT NOT NULL,
+    player1 TEXT NOT NULL,
+    player2 TEXT NOT NULL,
+    moves INTEGER NOT NULL,
+    winner TEXT,
+    archived INTEGER NOT NULL DEFAULT 0,
+    block_num INTEGER
+);
+CREATE INDEX IF NOT EXISTS games_by_address ON games (address);
+CREATE INDEX IF NOT EXISTS games_by_state ON games (state);
+
+CREATE TABLE IF NOT EXISTS players (
+    player TEXT NOT NULL,
+    game TEXT NOT NULL,
+    PRIMARY KEY (player, game)
+);
+CREATE INDEX IF NOT EXISTS players_by_game ON players (game);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    block_num INTEGER PRIMARY KEY,
+    block_id TEXT NOT NULL,
+    previous_id TEXT
+);
+
+CREATE TABLE IF NOT EXISTS block_changes (
+    block_num INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (block_num, address)
+);
+'''
+
+# Number of blocks whose changed addresses are kept, the deepest fork the
+# projection can recover from
+FORK_DEPTH = 1000
+
+
+def _count_moves(board_P1, board_P2):
+    return sum(board.count('X') + board.count('O')
+               for board in (board_P1, board_P2))
+
+
+def _winner(state, player1, player2):
+    if state == 'P1-WIN':
+        return player1
+    if state == 'P2-WIN':
+        return player2
+    return None
+
+
+class GameProjection(object):
+    '''SQLite projection of the games stored in the battleship namespace.'''
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def last_block(self):
+        '''Return (block_num, block_id) of the last applied block, or None.'''
+        row = self._conn.execute(
+            'SELECT block_num, block_id FROM blocks '
+            'ORDER BY block_num DESC LIMIT 1').fetchone()
+        return None if row is None else (row['block_num'], row['block_id'])
+
+    def apply_block(self, block_num, block_id, changes, previous_id=None,
+                    read_state=None):
+        '''Apply the state changes of one block in a single transaction.
+
+           changes is an iterable of (address, value, deleted) tuples. When
+           previous_id, the id of the parent of the block, is not the last
+           block applied, the blocks applied from the same height on were
+           orphaned by a fork: the games they changed are read again with
+           read_state(addresses), which returns the current value of each
+           address, or None. Returns those values after a fork, else None.
+        '''
+        changes = list(changes)
+        with self._conn:
+            values = None
+            orphaned = self._orphaned_from(block_num, previous_id)
+            if orphaned is not None:
+                values = self._roll_back(orphaned, read_state)
+
+            for address, value, deleted in changes:
+                self._apply_change(address, value, deleted, block_num)
+
+            if block_id is not None:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO blocks (block_num, block_id, '
+                    'previous_id) VALUES (?, ?, ?)',
+                    (block_num, block_id, previous_id))
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO block_changes (block_num, address) '
+                    'VALUES (?, ?)',
+                    [(block_num, address) for address, _, _ in changes
+                     if address.startswith(NAMESPACE)])
+                self._conn.execute(
+                    'DELETE FROM block_changes WHERE block_num < ?',
+                    (block_num - FORK_DEPTH,))
+
+        return values
+
+    def _orphaned_from(self, block_num, previous_id):
+        '''Return the first block orphaned by block_num, or None.'''
+        if previous_id is None or block_num is None:
+            return None
+
+        parent = self._conn.execute(
+            'SELECT block_id FROM blocks WHERE block_num = ?',
+            (block_num - 1,)).fetchone()
+        if parent is not None and parent['block_id'] != previous_id:
+            # The parent itself was replaced, by a block not received
+            LOGGER.warning('Block %s does not follow block %s',
+                           block_num, block_num - 1)
+            return block_num - 1
+
+        later = self._conn.execute(
+            'SELECT 1 FROM blocks WHERE block_num >= ? LIMIT 1',
+            (block_num,)).fetchone()
+        return None if later is None else block_num
+
+    def _roll_back(self, block_num, read_state):
+        '''Forget the blocks from block_num on, and read the addresses they
+           changed again.
+        '''
+        LOGGER.info('Fork: rolling back the blocks from %s on', block_num)
+
+        addresses = [row['address'] for row in self._conn.execute(
+            'SELECT DISTINCT address FROM block_changes WHERE block_num >= ? '
+            'ORDER BY address', (block_num,))]
+        self._conn.execute(
+            'DELETE FROM block_changes WHERE block_num >= ?', (block_num,))
+        self._conn.execute(
+            'DELETE FROM blocks WHERE block_num >= ?', (block_num,))
+
+        if not addresses:
+            return {}
+        if read_state is None:
+            raise Exception(
+                'Blocks from {} on were orphaned, and their games cannot be '
+                'read again without the validator'.format(block_num))
+
+        values = read_state(addresses)
+
+        # Deletions first, so a game that moved between partitions ends up
+        # at the address it is at now
+        for address in addresses:
+            if not values.get(address):
+                self._apply_change(address, b'', True, None)
+        for address in addresses:
+            if values.get(address):
+                self._apply_change(address, values[address], False, None)
+
+        return values
+
+    def _apply_change(self, address, value, deleted, block_num):
+        if not address.startswith(NAMESPACE):
+            return
+
+        partition = address[len(NAMESPACE):len(NAMESPACE) + 2]
+
+        if deleted:
+            # A game leaving an address either moved to another partition,
+            # which already updated its row, or was deleted.
+            if partition in GAME_PARTITIONS:
+                names = [row['name'] for row in self._conn.execute(
+                    'SELECT name FROM games WHERE address = ?', (address,))]
+                for name in names:
+                    self._delete_game(name)
+            return
+
+        if partition in GAME_PARTITIONS:
+            for game in deserialize_games(value):
+                name, board_P1, board_P2, state, player1, player2 = game[:6]
+                self._upsert_game(
+                    name, address, state, player1, player2,
+                    moves=_count_moves(board_P1, board_P2),
+                    winner=_winner(state, player1, player2),
+                    archived=0,
+                    block_num=block_num)
+
+        elif partition == PARTITION_RESULTS:
+            for result in value.decode().split('|'):
+                name, player1, player2, winner, moves, _ = result.split(',')
+                state = 'P1-WIN' if winner == player1 else 'P2-WIN'
+                self._upsert_game(
+                    name, address, state, player1, player2,
+                    moves=int(moves),
+                    winner=winner,
+                    archived=1,
+                    block_num=block_num)
+
+    def _upsert_game(self, name, address, state, player1, player2,
+                     moves, winner, archived, block_num):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO games (name, address, state, player1, '
+            'player2, moves, winner, archived, block_num) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (name, address, state, player1, player2, moves, winner, archived,
+             block_num))
+
+        self._conn.execute('DELETE FROM players WHERE game = ?', (name,))
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO players (player, game) VALUES (?, ?)',
+            [(player, name) for player in (player1, player2) if player])
+
+    def _delete_game(self, name):
+        self._conn.execute('DELETE FROM games WHERE name = ?', (name,))
+        self._conn.execute('DELETE FROM players WHERE game = ?', (name,))
+
+    def games(self, state=None, player=None, limit=None):
+        '''Return the games matching the filters, as dicts.'''
+        query = 'SELECT games.* FROM games'
+        clauses = []
+        params = []
+
+        if player is not None:
+            query += ' JOIN players ON players.game = games.name'
+            clauses.append('players.player = ?')
+            params.append(player)
+        if state is not None:
+            clauses.append('games.state = ?')
+            params.append(state)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+
+        query += ' ORDER BY games.name'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        return [dict(row) for row in self._conn.execute(query, params)]
+
+    def stats(self):
+        '''Return game counts by state and the win records of the players.'''
+        states = {
+            row['state']: row['count'] for row in self._conn.execute(
+                'SELECT state, COUNT(*) AS count FROM games GROUP BY state')
+        }
+
+        moves = self._conn.execute(
+            'SELECT AVG(moves) AS average FROM games '
+            'WHERE winner IS NOT NULL').fetchone()['average']
+
+        players = [dict(row) for row in self._conn.execute(
+            'SELECT players.player AS player, COUNT(*) AS games, '
+            'COALESCE(SUM(games.winner = players.player), 0) AS wins '
+            'FROM players JOIN games ON players.game = games.name '
+            'GROUP BY players.player ORDER BY wins DESC, players.player')]
+
+        return {
+            'states': states,
+            'average_moves_to_win': moves,
+            'players': players,
+        }
+
+
+def _read_replay_file(path):
+    '''Yield (block_num, block_id, previous_id, changes, values) from a
+       JSON lines event file, values being the addresses read again after a
+       fork, or None.
+    '''
+    with open(path) as fd:
+        for line in fd:
+            if not line.strip():
+                continue
+            block = json.loads(line)
+
+            values = None
+            if 'reread' in block:
+                values = {
+                    entry['address']: (
+                        None if entry['value'] is None
+                        else base64.b64decode(entry['value']))
+                    for entry in block['reread']
+                }
+
+            yield (
+                block['block_num'],
+                block.get('block_id'),
+                block.get('previous_block_id'),
+                [(change['address'],
+                  base64.b64decode(change.get('value', '')),
+                  change['type'] == 'DELETE')
+                 for change in block['changes']],
+                values)
+
+
+def _block_to_json(block_num, block_id, previous_id, changes, values=None):
+    block = {
+        'block_num': block_num,
+        'block_id': block_id,
+        'previous_block_id': previous_id,
+        'changes': [{
+            'address': address,
+            'type': 'DELETE' if deleted else 'SET',
+            'value': base64.b64encode(value).decode(),
+        } for address, value, deleted in changes],
+    }
+    if values is not None:
+        block['reread'] = [{
+            'address': address,
+            'value': None if value is None else base64.b64encode(value).decode(),
+        } for address, value in sorted(values.items())]
+
+    return json.dumps(block)
+
+
+def _subscribe(url, last_block_id):
+    '''Subscribe to block commits and battleship state deltas.'''
+    # Imported here so replay and query do not need a ZMQ stack
+    from sawtooth_sdk.messaging.stream import Stream
+    from sawtooth_sdk.protobuf.client_event_pb2 import \
+        ClientEventsSubscribeRequest
+    from sawtooth_sdk.protobuf.client_event_pb2 import \
+        ClientEventsSubscribeResponse
+    from sawtooth_sdk.protobuf.events_pb2 import EventFilter
+    from sawtooth_sdk.protobuf.events_pb2 import EventSubscription
+    from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+    stream = Stream(url)
+
+    request = ClientEventsSubscribeRequest(
+        subscriptions=[
+            EventSubscription(event_type='sawtooth/block-commit'),
+            EventSubscription(
+                event_type='sawtooth/state-delta',
+                filters=[EventFilter(
+                    key='address',
+                    match_string='^{}.*'.format(NAMESPACE),
+                    filter_type=EventFilter.REGEX_ANY)]),
+        ],
+        last_known_block_ids=[last_block_id])
+
+    future = stream.send(
+        Message.CLIENT_EVENTS_SUBSCRIBE_REQUEST,
+        request.SerializeToString())
+
+    response = ClientEventsSubscribeResponse()
+    response.ParseFromString(future.result().content)
+    if response.status != ClientEventsSubscribeResponse.OK:
+        stream.close()
+        raise Exception('Subscription failed: {}'.format(
+            response.response_message))
+
+    return stream
+
+
+def _iter_live_blocks(stream):
+    '''Yield (block_num, block_id, previous_id, changes, None) for each
+       event list received.
+    '''
+    from sawtooth_sdk.protobuf.events_pb2 import EventList
+    from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChange
+    from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChangeList
+    from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+    while True:
+        message = stream.receive().result()
+        if message.message_type != Message.CLIENT_EVENTS:
+            continue
+
+        event_list = EventList()
+        event_list.ParseFromString(message.content)
+
+        block_num = None
+        block_id = None
+        previous_id = None
+        changes = []
+        for event in event_list.events:
+            if event.event_type == 'sawtooth/block-commit':
+                attributes = {a.key: a.value for a in event.attributes}
+                block_num = int(attributes['block_num'])
+                block_id = attributes['block_id']
+                previous_id = attributes.get('previous_block_id')
+            elif event.event_type == 'sawtooth/state-delta':
+                change_list = StateChangeList()
+                change_list.ParseFromString(event.data)
+                changes.extend(
+                    (change.address, change.value,
+                     change.type == StateChange.DELETE)
+                    for change in change_list.state_changes)
+
+        yield block_num, block_id, previous_id, changes, None
+
+
+def _recorded_state(values):
+    def read_state(addresses):
+        missing = [address for address in addresses if address not in values]
+        if missing:
+            raise Exception(
+                'The record lacks the state of {} after a fork'.format(
+                    missing[0]))
+        return values
+    return read_state
+
+
+def _apply_blocks(projection, blocks, read_state=None, record=None):
+    '''Apply blocks, re-reading the state after a fork with read_state, or
+       from the values recorded with the block.
+    '''
+    for block_num, block_id, previous_id, changes, values in blocks:
+        values = projection.apply_block(
+            block_num, block_id, changes,
+            previous_id=previous_id,
+            read_state=read_state if values is None
+            else _recorded_state(values))
+        if record is not None:
+            record.write(_block_to_json(
+                block_num, block_id, previous_id, changes, values))
+            record.write('\n')
+            record.flush()
+        LOGGER.debug('Applied block %s: %d state changes',
+                     block_num, len(changes))
+
+
+def do_run(args):
+    projection = GameProjection(args.db)
+    last_block = projection.last_block()
+    last_block_id = NULL_BLOCK_ID if last_block is None else last_block[1]
+
+    stream = _subscribe(args.connect, last_block_id)
+    # Reads the games changed on an orphaned fork again
+    reader = make_transport(args.connect)
+    record = open(args.record, 'a') if args.record else None
+    try:
+        _apply_blocks(
+            projection, _iter_live_blocks(stream),
+            read_state=reader.get_states,
+            record=record)
+    finally:
+        stream.close()
+        reader.close()
+        if record is not None:
+            record.close()
+        projection.close()
+
+
+def do_replay(args):
+    projection = GameProjection(args.db)
+    try:
+        _apply_blocks(projection, _read_replay_file(args.file))
+    finally:
+        projection.close()
+
+
+def do_query(args):
+    projection = GameProjection(args.db)
+    try:
+        for game in projection.games(
+                state=args.state, player=args.player, limit=args.limit):
+            print(json.dumps(game))
+    finally:
+        projection.close()
+
+
+def do_stats(args):
+    projection = GameProjection(args.db)
+    try:
+        print(json.dumps(projection.stats(), indent=2))
+    finally:
+        projection.close()
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Maintains a SQLite projection of the battleship games '
+        'from the validator event stream and answers queries from it.')
+
+    parser.add_argument(
+        '--db',
+        type=str,
+        default=DEFAULT_DB,
+        help='specify the SQLite database file (default: {})'.format(
+            DEFAULT_DB))
+
+    subparsers = parser.add_subparsers(title='subcommands', dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser(
+        'run',
+        help='Follows the validator event stream')
+    run_parser.add_argument(
+        '--connect',
+        type=str,
+        default=DEFAULT_VALIDATOR_URL,
+        help='specify the validator component endpoint')
+    run_parser.add_argument(
+        '--record',
+        type=str,
+        help='append the received blocks to this file, for later replay')
+
+    replay_parser = subparsers.add_parser(
+        'replay',
+        help='Applies the blocks of a recorded event file')
+    replay_parser.add_argument(
+        'file',
+        type=str,
+        help='JSON lines file of blocks, as written by run --record')
+
+    query_parser = subparsers.add_parser(
+        'query',
+        help='Lists the indexed games as JSON lines')
+    query_parser.add_argument(
+        '--state',
+        type=str,
+        help='only list games in this state')
+    query_parser.add_argument(
+        '--player',
+        type=str,
+        help='only list games in which this player takes part')
+    query_parser.add_argument(
+        '--limit',
+        type=int,
+        help='stop after listing this many games')
+
+    subparsers.add_parser(
+        'stats',
+        help='Displays game counts and player records')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+
+    if args.command == 'run':
+        do_run(args)
+    elif args.command == 'replay':
+        do_replay(args)
+    elif args.command == 'query':
+        do_query(args)
+    elif args.command == 'stats':
+        do_stats(args)
+    else:
+        raise Exception("Invalid command: {}".format(args.command))
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
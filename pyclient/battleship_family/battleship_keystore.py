@@ -0,0 +1,127 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Process-wide cache of the private keys of the battleship users.
+
+Key files are read once, and the signer and public key of each private key
+are derived once, however many clients use them.
+'''
+
+import os
+import threading
+
+from sawtooth_signing import create_context
+from sawtooth_signing import CryptoFactory
+from sawtooth_signing import ParseError
+from sawtooth_signing.secp256k1 import Secp256k1PrivateKey
+
+
+def default_key_dir():
+    return os.path.join(os.path.expanduser("~"), ".sawtooth", "keys")
+
+
+class KeyStore(object):
+    '''Private keys by file and user, with their signers and public keys.
+
+       Private keys are handled as hex strings, as found in the key files.
+    '''
+
+    def __init__(self):
+        self._factory = CryptoFactory(create_context('secp256k1'))
+        self._lock = threading.Lock()
+
+        # keyfile -> private key
+        self._files = {}
+
+        # private key -> (signer, public key)
+        self._signers = {}
+
+    def load_file(self, keyfile):
+        '''Return the private key stored in keyfile.'''
+        with self._lock:
+            if keyfile in self._files:
+                return self._files[keyfile]
+
+        try:
+            with open(keyfile) as fd:
+                private_key = fd.read().strip()
+        except OSError as err:
+            raise Exception('Failed to read private key {}: {}'.format(
+                keyfile, str(err)))
+
+        # Parsed now so a bad file fails where it is named
+        self._load(private_key)
+
+        with self._lock:
+            self._files[keyfile] = private_key
+        return private_key
+
+    def load_user(self, username, key_dir=None):
+        '''Return the private key of username, from <key_dir>/<username>.priv.'''
+        if key_dir is None:
+            key_dir = default_key_dir()
+        return self.load_file('{}/{}.priv'.format(key_dir, username))
+
+    def load_dir(self, key_dir=None):
+        '''Load every .priv file of key_dir.
+
+           Returns the private keys by username.
+        '''
+        if key_dir is None:
+            key_dir = default_key_dir()
+
+        try:
+            filenames = sorted(os.listdir(key_dir))
+        except OSError as err:
+            raise Exception('Failed to read key directory {}: {}'.format(
+                key_dir, str(err)))
+
+        return {
+            filename[:-len('.priv')]: self.load_file(
+                os.path.join(key_dir, filename))
+            for filename in filenames
+            if filename.endswith('.priv')
+        }
+
+    def signer(self, private_key):
+        return self._load(private_key)[0]
+
+    def public_key(self, private_key):
+        '''Return the hex encoded public key of private_key.'''
+        return self._load(private_key)[1]
+
+    def _load(self, private_key):
+        with self._lock:
+            entry = self._signers.get(private_key)
+        if entry is not None:
+            return entry
+
+        try:
+            signer = self._factory.new_signer(
+                Secp256k1PrivateKey.from_hex(private_key))
+        except ParseError as err:
+            raise Exception('Failed to load private key: {}'.format(str(err)))
+
+        entry = (signer, signer.get_public_key().as_hex())
+        with self._lock:
+            return self._signers.setdefault(private_key, entry)
+
+
+_KEYSTORE = KeyStore()
+
+
+def get_keystore():
+    '''Return the KeyStore shared by the whole process.'''
+    return _KEYSTORE
@@ -0,0 +1,546 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Closed-loop load generator for the battleship transaction family.
+
+Keeps a number of games in play, each with one transaction outstanding at a
+time: the next move of a game is only sent once the previous one is
+committed, and a finished game is replaced by a new one. The generator places
+both fleets itself, so it follows every game locally and never reads state;
+shots are chosen by a DensityBot. It reports the submit-to-commit latency of
+each action, the transactions accepted and refused, and the transactions per
+second achieved.
+'''
+
+import argparse
+import binascii
+import collections
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from battleship_family.battleship_bot import DensityBot
+from battleship_family.battleship_client import BOAT_LENGTHS
+from battleship_family.battleship_client import BattleshipClient
+from battleship_family.battleship_client import ID_BOAT
+from battleship_family.battleship_keystore import default_key_dir
+from battleship_family.battleship_keystore import get_keystore
+from battleship_family.battleship_signing import sign_spec
+
+DEFAULT_URL = 'http://rest-api:8008'
+
+ACTIONS = ('create', 'place', 'shoot')
+
+PERCENTILES = (50, 95, 99)
+
+# Most batch ids asked about in one status request
+STATUS_CHUNK = 500
+
+
+def _fleet_board(fleet):
+    '''Return the board string of a fleet of (space, boat, direction).'''
+    board = ['-'] * 100
+    for space, boat, direction in fleet:
+        step = 1 if direction == 'horizontal' else 10
+        for k in range(BOAT_LENGTHS[ID_BOAT.index(boat)]):
+            board[space - 1 + k * step] = boat
+    return ''.join(board)
+
+
+class LatencyStats(object):
+    '''Submit-to-commit latencies, in seconds, by action.'''
+
+    def __init__(self):
+        self._samples = {action: [] for action in ACTIONS}
+        self._recent = []
+
+    def record(self, action, latency):
+        self._samples[action].append(latency)
+        self._recent.append(latency)
+
+    def take_recent(self):
+        '''Return the latencies recorded since the last call.'''
+        recent, self._recent = self._recent, []
+        return recent
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {'count': 0}
+
+        samples = np.array(samples)
+        summary = {
+            'count': len(samples),
+            'mean': round(float(samples.mean()), 4),
+            'max': round(float(samples.max()), 4),
+        }
+        for percentile, value in zip(
+                PERCENTILES, np.percentile(samples, PERCENTILES)):
+            summary['p{}'.format(percentile)] = round(float(value), 4)
+        return summary
+
+    def summary(self):
+        '''Return the count, mean, max and percentiles of each action, and
+           of all of them under 'all'.
+        '''
+        summary = {
+            action: self._summary(samples)
+            for action, samples in self._samples.items()
+        }
+        summary['all'] = self._summary(
+            [latency for samples in self._samples.values()
+             for latency in samples])
+        return summary
+
+
+class LoadGame(object):
+    '''A game of the load, as followed locally.'''
+
+    def __init__(self, name, players, fleets):
+        self.name = name
+        self.players = players
+        self.fleets = fleets
+        self.boards = [_fleet_board(fleet) for fleet in fleets]
+        self.remaining = [list(BOAT_LENGTHS), list(BOAT_LENGTHS)]
+        self.turn = 0
+        self.done = False
+        self.won = False
+
+        # Moves to send before the shots
+        self.setup = [('create', {})] + [
+            ('place', dict(space=space, boat=boat, direction=direction,
+                           currentplayer=player))
+            for player, fleet in zip(players, fleets)
+            for space, boat, direction in fleet
+        ]
+
+        # The transaction in flight: action, fields, batch id, submit time
+        self.action = None
+        self.fields = None
+        self.batch_id = None
+        self.submitted = None
+        self.future = None
+
+    def next_move(self, bot):
+        '''Return the action and payload fields of the next move.'''
+        if self.setup:
+            return self.setup[0]
+
+        enemy = 1 - self.turn
+        space = bot.choose(self.boards[enemy], self.remaining[enemy])
+        return 'shoot', dict(space=space,
+                             currentplayer=self.players[self.turn])
+
+    def committed(self):
+        '''Apply the move in flight, once committed.'''
+        if self.action != 'shoot':
+            self.setup.pop(0)
+            return
+
+        enemy = 1 - self.turn
+        index = self.fields['space'] - 1
+        board = self.boards[enemy]
+        if board[index] in ID_BOAT:
+            self.remaining[enemy][ID_BOAT.index(board[index])] -= 1
+            mark = 'O'
+        else:
+            mark = 'X'
+        self.boards[enemy] = board[:index] + mark + board[index + 1:]
+
+        if not any(self.remaining[enemy]):
+            self.done = True
+            self.won = True
+        self.turn = enemy
+
+
+class LoadGenerator(object):
+    '''Plays games concurrently against a network and measures it.
+
+       games is the number of games kept in play, and rate, if given, the
+       most transactions started per second over the whole run.
+    '''
+
+    def __init__(self, client, players, games=10, rate=None, key_dir=None,
+                 workers=32, poll_interval=0.1, txn_timeout=60,
+                 prefix='load', seed=None,
+                 auth_user=None, auth_password=None):
+        self._client = client
+        self._players = players
+        self._games = games
+        self._rate = rate
+        self._poll_interval = poll_interval
+        self._txn_timeout = txn_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._bot = DensityBot(np.random.default_rng(seed))
+        self._auth = dict(auth_user=auth_user, auth_password=auth_password)
+
+        keys = get_keystore().load_dir(key_dir)
+        missing = [player for player in players if player not in keys]
+        if missing:
+            raise Exception("No private key for {} in {}".format(
+                ', '.join(missing), key_dir or default_key_dir()))
+        self._keys = {player: keys[player] for player in players}
+
+        # Names must not collide with the games of earlier runs
+        self._prefix = '{}-{}-'.format(
+            prefix, binascii.hexlify(os.urandom(3)).decode())
+        self._count = 0
+
+        self.latencies = LatencyStats()
+        self.counts = dict(
+            submitted=0, committed=0, invalid=0, rejected=0, lost=0,
+            games_started=0, games_finished=0)
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _new_game(self):
+        name = '{}{}'.format(self._prefix, self._count)
+        self._count += 1
+        self.counts['games_started'] += 1
+        return LoadGame(
+            name, self._players,
+            [self._bot.place_fleet() for _ in self._players])
+
+    def _submit(self, game, batch):
+        self._client.send_batches([batch], key=game.name, **self._auth)
+
+    def _start_move(self, game):
+        game.action, game.fields = game.next_move(self._bot)
+
+        fields = dict(game.fields)
+        if game.action == 'create':
+            fields.update(player1=self._players[0], player2=self._players[1])
+            signer = self._players[0]
+        else:
+            signer = fields['currentplayer']
+
+        batch = sign_spec(self._client.txn_spec(
+            game.name, game.action,
+            private_key=self._keys[signer],
+            **dict(fields, **self._auth)))
+
+        game.batch_id = batch.header_signature
+        game.submitted = time.time()
+        game.future = self._executor.submit(self._submit, game, batch)
+        self.counts['submitted'] += 1
+
+    def _error(self, kind, game, message):
+        self.counts[kind] += 1
+        if len(self.errors) < 100:
+            self.errors.append('{} {} of game {}: {}'.format(
+                kind, game.action, game.name, message))
+
+    def _check(self, in_flight):
+        '''Poll the status of the batches in flight.
+
+           Returns the games whose transaction is over, committed or not.
+        '''
+        sent = {game.batch_id: game for game in in_flight}
+        ids = list(sent)
+
+        statuses = {}
+        for i in range(0, len(ids), STATUS_CHUNK):
+            statuses.update(self._client.get_batch_statuses(
+                ids[i:i + STATUS_CHUNK], **self._auth))
+
+        now = time.time()
+        over = []
+        for batch_id, game in sent.items():
+            status = statuses.get(batch_id)
+            if status == 'COMMITTED':
+                self.latencies.record(game.action, now - game.submitted)
+                self.counts['committed'] += 1
+                game.committed()
+                if game.won:
+                    self.counts['games_finished'] += 1
+                over.append(game)
+            elif status == 'INVALID':
+                self._error('invalid', game, status)
+                game.done = True
+                over.append(game)
+            elif now - game.submitted > self._txn_timeout:
+                # Pending or unknown for too long: dropped somewhere
+                self._error('lost', game, status)
+                game.done = True
+                over.append(game)
+
+        return over
+
+    def run(self, duration, drain_timeout=60, report=None,
+            report_interval=5):
+        '''Generate load for duration seconds.
+
+           Games still in flight then get up to drain_timeout seconds to
+           commit their last move. report, if given, is called every
+           report_interval seconds with a live summary. Returns the summary
+           of the run.
+        '''
+        start_time = time.time()
+        deadline = start_time + duration
+        last_poll = 0
+        last_report = start_time
+        reported = 0
+
+        ready = collections.deque(
+            self._new_game() for _ in range(self._games))
+        in_flight = []
+        started = 0
+
+        while True:
+            now = time.time()
+            running = now < deadline
+            if not running and (not in_flight or
+                                now > deadline + drain_timeout):
+                break
+
+            # Submissions that failed never reach the validator
+            for game in list(in_flight):
+                if game.future is None or not game.future.done():
+                    continue
+                error = game.future.exception()
+                game.future = None
+                if error is not None:
+                    self._error('rejected', game, error)
+                    game.done = True
+                    in_flight.remove(game)
+                    ready.append(game)
+
+            if in_flight and now - last_poll >= self._poll_interval:
+                last_poll = now
+                polled = [game for game in in_flight if game.future is None]
+                for game in self._check(polled):
+                    in_flight.remove(game)
+                    ready.append(game)
+
+            while running and ready:
+                if self._rate and \
+                        started >= (now - start_time) * self._rate:
+                    break
+
+                game = ready.popleft()
+                if game.done:
+                    game = self._new_game()
+
+                self._start_move(game)
+                in_flight.append(game)
+                started += 1
+
+            if report is not None and now - last_report >= report_interval:
+                report(self._live(now - start_time, now - last_report,
+                                  self.counts['committed'] - reported))
+                reported = self.counts['committed']
+                last_report = now
+
+            time.sleep(0.005)
+
+        self.counts['pending'] = len(in_flight)
+        return self.summary(time.time() - start_time, duration)
+
+    def _live(self, elapsed, interval, recent):
+        live = {
+            'elapsed': round(elapsed, 1),
+            'tps': round(recent / interval, 1) if interval else 0.0,
+            'committed': self.counts['committed'],
+            'invalid': self.counts['invalid'],
+            'rejected': self.counts['rejected'],
+        }
+        live.update(LatencyStats._summary(self.latencies.take_recent()))
+        return live
+
+    def summary(self, elapsed, duration):
+        return {
+            'duration': round(elapsed, 2),
+            'target_tps': self._rate,
+            'tps': round(self.counts['committed'] / min(elapsed, duration),
+                         2) if elapsed else 0.0,
+            'games': self._games,
+            'counts': self.counts,
+            'latency': self.latencies.summary(),
+            'errors': self.errors[:10],
+        }
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Keeps battleship games in play against a network, '
+        'each with one move in flight at a time, and reports the '
+        'submit-to-commit latencies and the throughput achieved.')
+
+    parser.add_argument(
+        '--games',
+        type=int,
+        default=10,
+        help='number of games kept in play at the same time')
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        help='most transactions started per second (default: as fast as '
+        'the games allow)')
+
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=60,
+        help='time, in seconds, during which new moves are sent')
+
+    parser.add_argument(
+        '--drain-timeout',
+        type=float,
+        default=60,
+        help='time, in seconds, to wait for the last moves to commit')
+
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=0.1,
+        help='time, in seconds, between two batch status polls; the '
+        'resolution of the latencies measured')
+
+    parser.add_argument(
+        '--txn-timeout',
+        type=float,
+        default=60,
+        help='time, in seconds, after which a move that is not committed '
+        'is counted as lost')
+
+    parser.add_argument(
+        '--players',
+        type=str,
+        default='jack,jill',
+        help='the two players of the games, comma separated')
+
+    parser.add_argument(
+        '--prefix',
+        type=str,
+        default='load',
+        help='prefix of the names of the games')
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=32,
+        help='number of submissions sent at the same time')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed of the bots, for reproducible games')
+
+    parser.add_argument(
+        '--report-interval',
+        type=float,
+        default=5,
+        help='time, in seconds, between two live reports on stderr; '
+        '0 disables them')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        help='write the JSON summary to this file instead of stdout')
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        help='specify URL of REST API, or tcp:// URL of a validator; '
+        'several comma separated URLs are used in turn')
+
+    parser.add_argument(
+        '--key-dir',
+        type=str,
+        help="identify directory of the users' private key files")
+
+    parser.add_argument(
+        '--auth-user',
+        type=str,
+        help='specify username for authentication if REST API '
+        'is using Basic Auth')
+
+    parser.add_argument(
+        '--auth-password',
+        type=str,
+        help='specify password for authentication if REST API '
+        'is using Basic Auth')
+
+    return parser
+
+
+def _print_live(live):
+    print('{elapsed:>7}s  {tps:>8} tps  committed {committed}  '
+          'invalid {invalid}  rejected {rejected}  '
+          'p50 {p50}  p95 {p95}  p99 {p99}'.format(
+              **dict(dict(p50='-', p95='-', p99='-'), **live)),
+          file=sys.stderr)
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    url = DEFAULT_URL if args.url is None else args.url
+    players = args.players.split(',')
+
+    client = BattleshipClient(base_url=url, keyfile=None)
+
+    with LoadGenerator(
+            client, players,
+            games=args.games,
+            rate=args.rate,
+            key_dir=args.key_dir,
+            workers=args.workers,
+            poll_interval=args.poll_interval,
+            txn_timeout=args.txn_timeout,
+            prefix=args.prefix,
+            seed=args.seed,
+            auth_user=args.auth_user,
+            auth_password=args.auth_password) as generator:
+        summary = generator.run(
+            args.duration,
+            drain_timeout=args.drain_timeout,
+            report=_print_live if args.report_interval > 0 else None,
+            report_interval=args.report_interval)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(summary, fd, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -18,17 +18,36 @@ This file is used for automated testing of the battleship client.
 
 from sawtooth_processor_test.message_factory import MessageFactory
 
+from battleship_family.battleship_client import GAME_PARTITIONS
+from battleship_family.battleship_client import PARTITION_RESULTS
+from battleship_family.battleship_client import partition_for_state
+from battleship_family.battleship_payload import encode_payload
+
+EMPTY_BOARD = "-" * 100
+BOAT_CASES = "5433254332"
+TO_PLACE = "1111111111"
+
+
 class BattleshipMessageFactory(object):
-    def __init__(self, signer=None):
+    def __init__(self, signer=None, family_version="1.0"):
+        self._family_version = family_version
         self._factory = MessageFactory(
             family_name="battleship",
-            family_version="1.0",
+            family_version=family_version,
             namespace=MessageFactory.sha512("battleship".encode("utf-8"))[0:6],
             signer=signer)
 
-    def _game_to_address(self, game):
-        return self._factory.namespace + \
-            self._factory.sha512(game.encode())[0:64]
+    def _game_to_address(self, game, partition):
+        # namespace + partition + hash of the name, as laid out by the
+        # transaction processor
+        return self._factory.namespace + partition + \
+            self._factory.sha512(game.encode())[0:62]
+
+    def _game_addresses(self, game):
+        return [
+            self._game_to_address(game, partition)
+            for partition in GAME_PARTITIONS + (PARTITION_RESULTS,)
+        ]
 
     def get_public_key(self):
         return self._factory.get_public_key()
@@ -39,56 +58,67 @@ class BattleshipMessageFactory(object):
     def create_tp_response(self, status):
         return self._factory.create_tp_response(status)
 
-    def _create_txn(self, txn_function, game, action, space=None):
-        payload = ",".join([
-            str(game), str(action), str(space)
-        ]).encode()
+    def _create_txn(self, txn_function, game, action, space="", boat="",
+                    direction="", currentplayer=""):
+        payload = encode_payload(
+            self._family_version, game, action, space=space, boat=boat,
+            direction=direction, currentplayer=currentplayer)
 
-        addresses = [self._game_to_address(game)]
+        addresses = self._game_addresses(game)
 
         return txn_function(payload, addresses, addresses, [])
 
-    def create_tp_process_request(self, action, value=None):
+    def create_tp_process_request(self, game, action, **fields):
         txn_function = self._factory.create_tp_process_request
-        return self._create_txn(txn_function, action, value)
+        return self._create_txn(txn_function, game, action, **fields)
 
-    def create_transaction(self, action, value=None):
+    def create_transaction(self, game, action, **fields):
         txn_function = self._factory.create_transaction
-        return self._create_txn(txn_function, action, value)
-
-    def create_get_request(self):
-        addresses = [self._make_address()]
+        return self._create_txn(txn_function, game, action, **fields)
+
+    def create_get_request(self, game):
+        # The processor looks for a game in every game partition at once
+        addresses = [
+            self._game_to_address(game, partition)
+            for partition in GAME_PARTITIONS
+        ]
         return self._factory.create_get_request(addresses)
 
-    ## Adapt to board def /!\
+    def _game_data(self, game, board_P1, board_P2, state, player1, player2,
+                   boat_cases, to_place):
+        return ",".join([
+            game, board_P1, board_P2, state, player1, player2, boat_cases,
+            to_place]).encode()
+
     def create_set_request(
-        self, game, board_P1="---------------------------------------------------------------------------------------------------", board_P2="---------------------------------------------------------------------------------------------------", state="PLACE", player1="", player2=""
+        self, game, board_P1=EMPTY_BOARD, board_P2=EMPTY_BOARD, state="PLACE",
+        player1="", player2="", boat_cases=BOAT_CASES, to_place=TO_PLACE
     ):
-        address = self._game_to_address(game)
+        address = self._game_to_address(game, partition_for_state(state))
 
-        data = None
-        if state is not None:
-            data = ",".join([game, board_P1, board_P2, state, player1, player2]).encode()
-        else:
-            data = None
+        data = self._game_data(
+            game, board_P1, board_P2, state, player1, player2, boat_cases,
+            to_place)
 
         return self._factory.create_set_request({address: data})
 
-    ## Adapt to board def /!\
     def create_get_response(
-        self, game, board_P1="---------------------------------------------------------------------------------------------------", board_P2="---------------------------------------------------------------------------------------------------", state="PLACE", player1="", player2=""
+        self, game, board_P1=EMPTY_BOARD, board_P2=EMPTY_BOARD, state="PLACE",
+        player1="", player2="", boat_cases=BOAT_CASES, to_place=TO_PLACE
     ):
-        address = self._game_to_address(game)
-
-        data = None
+        # A game that does not exist is missing from every partition
+        entries = {
+            self._game_to_address(game, partition): None
+            for partition in GAME_PARTITIONS
+        }
         if board_P1 is not None and board_P2 is not None:
-            data = ",".join([game, board_P1, board_P2, state, player1, player2]).encode()
-        else:
-            data = None
+            entries[self._game_to_address(game, partition_for_state(state))] = \
+                self._game_data(
+                    game, board_P1, board_P2, state, player1, player2,
+                    boat_cases, to_place)
 
-        return self._factory.create_get_response({address: data})
+        return self._factory.create_get_response(entries)
 
-    def create_set_response(self, game):
-        addresses = [self._make_address()]
+    def create_set_response(self, game, state="PLACE"):
+        addresses = [self._game_to_address(game, partition_for_state(state))]
         return self._factory.create_set_response(addresses)
-
@@ -0,0 +1,104 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Encoding of battleship payloads, for each family version.
+
+1.0 payloads are the 8 fields of a move as a comma separated string. 2.0
+payloads are binary, and a shot takes a few bytes plus the names:
+
+    opcode byte, cell byte (space - 1, or NO_CELL), boat/direction byte,
+    then name, currentplayer, player1 and player2, each as a length byte and
+    UTF-8 text, the trailing empty ones left out.
+
+The boat/direction byte is 0 without a boat, otherwise the index of the boat
+in V2_BOATS plus one, shifted left by one, with the low bit set if vertical.
+The transaction processor of the family must run with 2.0 support for 2.0
+transactions to be applied.
+'''
+
+import struct
+
+FAMILY_VERSIONS = ('1.0', '2.0')
+
+V2_OPCODES = {'create': 1, 'place': 2, 'shoot': 3, 'delete': 4, 'archive': 5}
+V2_ACTIONS = {opcode: action for action, opcode in V2_OPCODES.items()}
+V2_BOATS = ('L', 'M', 'N', 'Q', 'P')
+NO_CELL = 0xFF
+
+_V2_HEADER = struct.Struct('BBB')
+
+
+def _encode_v1(name, action, space, boat, direction, player1, player2,
+               currentplayer):
+    return ",".join([name, action, str(space), str(boat), str(direction), str(player1), str(player2), str(currentplayer)]).encode()
+
+
+def _encode_v2(name, action, space, boat, direction, player1, player2,
+               currentplayer):
+    if action not in V2_OPCODES:
+        raise Exception("Invalid action: {}".format(action))
+
+    cell = NO_CELL
+    if space != "":
+        cell = int(space) - 1
+        if not 0 <= cell < NO_CELL:
+            raise Exception("Space must be an integer from 1 to 100")
+
+    boat_direction = 0
+    if boat:
+        if boat not in V2_BOATS:
+            raise Exception("Invalid boat: {}".format(boat))
+        if direction not in ('horizontal', 'vertical'):
+            raise Exception(
+                "Direction has to be horizontal or vertical")
+        boat_direction = (V2_BOATS.index(boat) + 1) << 1 | \
+            (direction == 'vertical')
+
+    fields = [
+        str(field).encode()
+        for field in (name, currentplayer, player1, player2)
+    ]
+    while fields and not fields[-1]:
+        fields.pop()
+    for field in fields:
+        if len(field) > 255:
+            raise Exception("Names are limited to 255 bytes")
+
+    return _V2_HEADER.pack(V2_OPCODES[action], cell, boat_direction) + \
+        b''.join(bytes([len(field)]) + field for field in fields)
+
+
+_ENCODERS = {
+    '1.0': _encode_v1,
+    '2.0': _encode_v2,
+}
+
+
+def encode_payload(family_version, name, action, space="", boat="",
+                   direction="", player1="", player2="", currentplayer=""):
+    '''Return the payload of a move for family_version.'''
+    try:
+        encode = _ENCODERS[family_version]
+    except KeyError:
+        raise Exception("Unsupported family version: {}".format(
+            family_version))
+    return encode(name, action, space, boat, direction, player1, player2,
+                  currentplayer)
+
+
+def payload_action(payload, family_version):
+    '''Return the action of an encoded payload.'''
+    if family_version == '2.0':
+        return V2_ACTIONS.get(payload[0], '') if payload else ''
+    fields = payload.split(b',')
+    return fields[1].decode() if len(fields) > 1 else ''
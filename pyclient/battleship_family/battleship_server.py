@@ -0,0 +1,646 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+HTTP game API for the battleship transaction family.
+
+Serves JSON views of the games and accepts moves, on top of BattleshipClient.
+Reads go through one shared cache that is invalidated whenever the chain head
+changes, and identical reads in flight at the same time share one request to
+the REST API.
+
+Moves are signed with the keys of the players held by the server, so every
+move must come from the player it is signed for: requests authenticate with
+an "Authorization: Bearer <token>" header, the tokens being issued with
+--add-token. A player's own board is only shown to that player; everybody
+else sees the games as spectators, without the boats.
+'''
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sys
+import traceback
+
+from aiohttp import web
+
+from battleship_family.battleship_client import BattleshipClient
+from battleship_family.battleship_client import GAME_PARTITIONS
+from battleship_family.battleship_client import ID_BOAT
+from battleship_family.battleship_client import partition_for_state
+from battleship_family.battleship_client import deserialize_games
+from battleship_family.battleship_spectator import SpectatorHub
+from battleship_family.battleship_spectator import handle_watch
+from battleship_family.battleship_transport import TransportError
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_URL = 'http://rest-api:8008'
+DEFAULT_BIND = '0.0.0.0:3000'
+DEFAULT_HEAD_INTERVAL = 0.5
+
+ROWS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class TokenStore(object):
+    '''The players by token, read from a file of "player:sha256" lines,
+       the SHA-256 of their tokens in hex.
+
+       The file is read again whenever it changes, so tokens issued while
+       the server runs are accepted right away. Without the file, no token
+       is accepted.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self._mtime = None
+        self._players = {}
+
+    def player(self, token):
+        '''Return the player token was issued to, or None.'''
+        self._reload()
+        return self._players.get(hash_token(token))
+
+    def add(self, player):
+        '''Issue a new token to player and return it.'''
+        if not self.path:
+            raise Exception('No token file to add the token to')
+        if not player or ':' in player:
+            raise Exception('Invalid player: {}'.format(player))
+
+        token = secrets.token_hex(32)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'a') as tokens:
+            tokens.write('{}:{}\n'.format(player, hash_token(token)))
+        return token
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else None
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+
+        players = {}
+        if mtime is not None:
+            with open(self.path) as tokens:
+                for number, line in enumerate(tokens, 1):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    player, _, digest = line.rpartition(':')
+                    if not player:
+                        raise Exception('Line {} of {}: expected player:sha256'
+                                        .format(number, self.path))
+                    players[digest] = player
+
+        self._players = players
+        self._mtime = mtime
+
+
+def authenticated_player(request):
+    '''Return the player request is authenticated as, or None without
+       credentials.
+    '''
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if not token:
+        return None
+    if scheme.lower() != 'bearer':
+        raise web.HTTPUnauthorized(text='Use a Bearer token')
+
+    player = request.app['tokens'].player(token.strip())
+    if player is None:
+        raise web.HTTPUnauthorized(text='Unknown token')
+    return player
+
+
+def _require_player(request, claimed=None):
+    '''Return the authenticated player of request, which must be claimed
+       if given.
+    '''
+    player = authenticated_player(request)
+    if player is None:
+        raise web.HTTPUnauthorized(text='Authentication required')
+    if claimed is not None and claimed != player:
+        raise web.HTTPForbidden(
+            text='Authenticated as {}, not {}'.format(player, claimed))
+    return player
+
+
+def _mask_board(board):
+    '''Hide the boats of a board, leaving only the shots on it.'''
+    return ''.join('-' if square in ID_BOAT else square for square in board)
+
+
+def _game_to_dict(game_data):
+    name, board_P1, board_P2, state, player1, player2, boat_cases, to_place = game_data
+    return {
+        'name': name,
+        'board_P1': board_P1,
+        'board_P2': board_P2,
+        'state': state,
+        'player1': player1,
+        'player2': player2,
+        'boat_cases': boat_cases,
+        'to_place': to_place,
+    }
+
+
+def render_view(game, player=None):
+    '''Render game as seen by player, or by a spectator if player is None.
+
+       A player sees their own board and the enemy board without its boats,
+       like the show command; a spectator sees both boards without boats.
+    '''
+    view = {
+        'name': game['name'],
+        'player1': game['player1'],
+        'player2': game['player2'],
+        'state': game['state'],
+    }
+
+    if player is None:
+        view['board_P1'] = _mask_board(game['board_P1'])
+        view['board_P2'] = _mask_board(game['board_P2'])
+    elif player == game['player1']:
+        view['board'] = game['board_P1']
+        view['enemy_board'] = _mask_board(game['board_P2'])
+    elif player == game['player2']:
+        view['board'] = game['board_P2']
+        view['enemy_board'] = _mask_board(game['board_P1'])
+    else:
+        raise web.HTTPForbidden(
+            text="Player {} doesn't exist in the game {}".format(
+                player, game['name']))
+
+    return view
+
+
+class GameService(object):
+    '''Cached, coalesced access to the games through BattleshipClient.'''
+
+    def __init__(self, base_url, key_dir):
+        self._base_url = base_url
+        self._key_dir = key_dir
+
+        self._reader = BattleshipClient(base_url=base_url, keyfile=None)
+        self._writers = {}
+
+        self._head = None
+        self._cache = {}
+        self._in_flight = {}
+
+    @property
+    def head(self):
+        return self._head
+
+    def get_game_addresses(self, name):
+        return self._reader.get_game_addresses(name)
+
+    async def spectator_view(self, name):
+        try:
+            game = await self.get_game(name)
+        except Exception:
+            return None
+
+        return None if game is None else render_view(game)
+
+    async def watch_head(self, interval):
+        '''Poll the chain head and drop the cache when it changes.'''
+        while True:
+            try:
+                head = await asyncio.get_event_loop().run_in_executor(
+                    None, self._reader.get_head)
+                if head != self._head:
+                    self._head = head
+                    self._cache.clear()
+            except Exception as err:
+                LOGGER.warning('Failed to read chain head: %s', err)
+
+            await asyncio.sleep(interval)
+
+    async def read(self, key, fn, *args, **kwargs):
+        '''Return fn(*args, **kwargs), cached for the current chain head.
+
+           Concurrent reads of the same key wait on the same call.
+        '''
+        head = self._head
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == head:
+            return entry[1]
+
+        # Reads started at an older head are not joined
+        flight_key = (key, head)
+        future = self._in_flight.get(flight_key)
+        if future is None:
+            future = asyncio.get_event_loop().run_in_executor(
+                None, functools.partial(fn, *args, **kwargs))
+            self._in_flight[flight_key] = future
+            future.add_done_callback(
+                lambda _: self._in_flight.pop(flight_key, None))
+
+        value = await asyncio.shield(future)
+
+        # Only cache what was read at a known head that is still current
+        if head is not None and head == self._head:
+            self._cache[key] = (head, value)
+
+        return value
+
+    async def get_game(self, name):
+        data = await self.read(('game', name), self._reader.show, name)
+        if data is None:
+            return None
+
+        for game_data in deserialize_games(data):
+            if game_data[0] == name:
+                return _game_to_dict(game_data)
+
+        return None
+
+    async def list_games(self, state=None, player=None, limit=None):
+        return await self.read(
+            ('games', state, player, limit),
+            self._list_games, state, player, limit)
+
+    async def my_games(self, player):
+        return await self.read(
+            ('player', player), self._reader.my_games, player)
+
+    async def submit(self, player, name, action, wait=None, **fields):
+        '''Sign a move of player on game name with the key of player and
+           send it.
+
+           A move the client refuses to build is the caller's error, and a
+           move that cannot be sent is an upstream failure.
+        '''
+        loop = asyncio.get_event_loop()
+        client = self._get_writer(player)
+
+        try:
+            spec = await loop.run_in_executor(None, functools.partial(
+                client.txn_spec, name, action, **fields))
+        except TransportError as err:
+            raise web.HTTPBadGateway(text=str(err))
+        except Exception as err:
+            if str(err).startswith('No such game'):
+                raise web.HTTPNotFound(text=str(err))
+            raise web.HTTPBadRequest(text=str(err))
+
+        try:
+            return await loop.run_in_executor(None, functools.partial(
+                client.send_spec, name, spec, wait=wait))
+        except Exception as err:
+            raise web.HTTPBadGateway(text=str(err))
+
+    def _list_games(self, state, player, limit):
+        partitions = GAME_PARTITIONS
+        if state is not None:
+            partitions = [partition_for_state(state)]
+
+        games = []
+        for game_data in self._reader.iter_games(partitions=partitions):
+            if limit is not None and len(games) >= limit:
+                break
+
+            game = _game_to_dict(game_data)
+            if state is not None and game['state'] != state:
+                continue
+            if player is not None and \
+                    player not in (game['player1'], game['player2']):
+                continue
+
+            games.append({
+                'name': game['name'],
+                'player1': game['player1'],
+                'player2': game['player2'],
+                'state': game['state'],
+            })
+
+        return games
+
+    def _get_writer(self, player):
+        if player not in self._writers:
+            keyfile = os.path.join(self._key_dir, '{}.priv'.format(player))
+            try:
+                self._writers[player] = BattleshipClient(
+                    base_url=self._base_url, keyfile=keyfile)
+            except Exception as err:
+                # The player has a token but the server has no key for them
+                raise web.HTTPInternalServerError(text=str(err))
+        return self._writers[player]
+
+
+def _int_field(value, field):
+    '''Return value as an int, for field of a request.'''
+    # bool is an int to Python, but not a number to JSON
+    if isinstance(value, bool):
+        raise web.HTTPBadRequest(text='{} must be an integer'.format(field))
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text='{} must be an integer'.format(field))
+
+
+def _space_from_body(body):
+    '''Read a space (1-100) from either "space" or "row" and "col".'''
+    if 'space' in body:
+        space = _int_field(body['space'], 'space')
+    else:
+        row = body.get('row')
+        if row not in ROWS:
+            raise web.HTTPBadRequest(text='Row has to be between A and J')
+        col = _int_field(body.get('col', 0), 'col')
+        if col < 1 or col > 10:
+            raise web.HTTPBadRequest(text='Column has to be between 1 and 10')
+        space = ROWS.index(row) * 10 + col
+
+    if space < 1 or space > 100:
+        raise web.HTTPBadRequest(text='Space has to be between 1 and 100')
+
+    return space
+
+
+def _wait_from_body(body):
+    wait = body.get('wait')
+    return None if wait is None else _int_field(wait, 'wait')
+
+
+async def _read_body(request, *required):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='Request body must be JSON')
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='Request body must be a JSON object')
+
+    for field in required:
+        if not body.get(field):
+            raise web.HTTPBadRequest(text='Missing field: {}'.format(field))
+        if not isinstance(body[field], str):
+            raise web.HTTPBadRequest(
+                text='{} must be a string'.format(field))
+
+    return body
+
+
+async def _require_game(request, name):
+    try:
+        game = await request.app['service'].get_game(name)
+    except Exception as err:
+        raise web.HTTPBadGateway(text=str(err))
+    if game is None:
+        raise web.HTTPNotFound(text='Game not found: {}'.format(name))
+    return game
+
+
+def _submitted(response):
+    try:
+        return web.json_response(json.loads(response), status=202)
+    except ValueError:
+        return web.json_response({'response': response}, status=202)
+
+
+async def handle_list_games(request):
+    service = request.app['service']
+    limit = request.query.get('limit')
+    if limit:
+        limit = _int_field(limit, 'limit')
+        if limit < 1:
+            raise web.HTTPBadRequest(text='limit must be positive')
+    games = await service.list_games(
+        state=request.query.get('state'),
+        player=request.query.get('player'),
+        limit=limit or None)
+    return web.json_response(games)
+
+
+async def handle_show_game(request):
+    service = request.app['service']
+    game = await _require_game(request, request.match_info['name'])
+
+    # Only the players themselves see their own boats
+    player = authenticated_player(request)
+    claimed = request.query.get('player')
+    if claimed is not None and claimed != player:
+        raise web.HTTPForbidden(
+            text='Authenticate as {} to see their board'.format(claimed))
+    if player not in (game['player1'], game['player2']):
+        player = None
+
+    return web.json_response(render_view(game, player=player))
+
+
+async def handle_player_games(request):
+    service = request.app['service']
+    games = await service.my_games(request.match_info['player'])
+    return web.json_response(
+        [{'name': name, 'state': state} for name, state in games])
+
+
+async def handle_create_game(request):
+    body = await _read_body(request, 'name', 'player1', 'player2')
+    signer = _require_player(request, body.get('signer'))
+    if signer not in (body['player1'], body['player2']):
+        raise web.HTTPForbidden(text='Only the players can create a game')
+
+    response = await request.app['service'].submit(
+        signer, body['name'], 'create',
+        player1=body['player1'],
+        player2=body['player2'],
+        wait=_wait_from_body(body))
+    return _submitted(response)
+
+
+async def handle_place(request):
+    body = await _read_body(request, 'boat', 'direction')
+    player = _require_player(request, body.get('player'))
+    if body['boat'] not in ID_BOAT:
+        raise web.HTTPBadRequest(text='Unknown boat: {}'.format(body['boat']))
+    if body['direction'] not in ('horizontal', 'vertical'):
+        raise web.HTTPBadRequest(
+            text='Direction has to be horizontal or vertical')
+
+    space = _space_from_body(body)
+    name = request.match_info['name']
+    await _require_game(request, name)
+
+    response = await request.app['service'].submit(
+        player, name, 'place',
+        space=space,
+        boat=body['boat'],
+        direction=body['direction'],
+        currentplayer=player,
+        wait=_wait_from_body(body))
+    return _submitted(response)
+
+
+async def handle_shoot(request):
+    body = await _read_body(request)
+    player = _require_player(request, body.get('player'))
+    space = _space_from_body(body)
+    name = request.match_info['name']
+    await _require_game(request, name)
+
+    response = await request.app['service'].submit(
+        player, name, 'shoot',
+        space=space,
+        currentplayer=player,
+        wait=_wait_from_body(body))
+    return _submitted(response)
+
+
+async def _start_background_tasks(app):
+    app['head_watcher'] = asyncio.ensure_future(
+        app['service'].watch_head(app['head_interval']))
+
+
+async def _stop_background_tasks(app):
+    app['head_watcher'].cancel()
+    app['spectators'].close()
+
+
+def _rest_url(base_url):
+    '''Return the first REST API URL of base_url, a comma separated list.'''
+    for url in base_url.split(','):
+        url = url.strip()
+        if url and not url.startswith('tcp://'):
+            return url
+    raise Exception(
+        'Spectators need a REST API URL, set one with --rest-url')
+
+
+def create_app(base_url, key_dir, head_interval=DEFAULT_HEAD_INTERVAL,
+               tokens=None, rest_url=None):
+    app = web.Application()
+    service = GameService(base_url, key_dir)
+    app['service'] = service
+    app['tokens'] = TokenStore() if tokens is None else tokens
+    # Spectators need a single REST API to subscribe to
+    if rest_url is None:
+        rest_url = _rest_url(base_url)
+    app['spectators'] = SpectatorHub(
+        rest_url,
+        addresses_of=service.get_game_addresses,
+        snapshot=service.spectator_view)
+    app['head_interval'] = head_interval
+
+    app.router.add_get('/games', handle_list_games)
+    app.router.add_post('/games', handle_create_game)
+    app.router.add_get('/games/{name}', handle_show_game)
+    app.router.add_post('/games/{name}/place', handle_place)
+    app.router.add_post('/games/{name}/shoot', handle_shoot)
+    app.router.add_get('/games/{name}/watch', handle_watch)
+    app.router.add_get('/players/{player}/games', handle_player_games)
+
+    app.on_startup.append(_start_background_tasks)
+    app.on_cleanup.append(_stop_background_tasks)
+
+    return app
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Serves the battleship games over HTTP.')
+
+    parser.add_argument(
+        '--bind',
+        type=str,
+        default=DEFAULT_BIND,
+        help='specify the host:port to listen on (default: {})'.format(
+            DEFAULT_BIND))
+
+    parser.add_argument(
+        '--url',
+        type=str,
+        default=DEFAULT_URL,
+        help='specify URL of REST API, or comma separated URLs to balance '
+        'the requests over')
+
+    parser.add_argument(
+        '--rest-url',
+        type=str,
+        help='specify URL of the REST API spectators subscribe through '
+        '(default: the first REST API of --url)')
+
+    parser.add_argument(
+        '--key-dir',
+        type=str,
+        default=os.path.join(os.path.expanduser("~"), ".sawtooth", "keys"),
+        help='identify directory of the players\' private key files')
+
+    parser.add_argument(
+        '--head-interval',
+        type=float,
+        default=DEFAULT_HEAD_INTERVAL,
+        help='set time, in seconds, between two chain head checks')
+
+    parser.add_argument(
+        '--tokens',
+        type=str,
+        help='identify file of the players\' token hashes; without it, '
+        'moves are refused and only spectator views are served')
+
+    parser.add_argument(
+        '--add-token',
+        type=str,
+        metavar='PLAYER',
+        help='issue a token to PLAYER, add it to the --tokens file, print '
+        'it and exit')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    tokens = TokenStore(args.tokens)
+    if args.add_token is not None:
+        print(tokens.add(args.add_token))
+        return
+
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+
+    host, port = args.bind.rsplit(':', 1)
+    web.run_app(
+        create_app(args.url, args.key_dir, head_interval=args.head_interval,
+                   tokens=tokens, rest_url=args.rest_url),
+        host=host,
+        port=int(port))
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,180 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Signing of battleship transactions, inline or in a pool of processes.
+
+A TransactionSpec holds everything needed to build a transaction except the
+signatures. BattleshipClient signs its specs inline; bulk jobs hand them to a
+SigningPool, which spreads the secp256k1 work over several processes and
+returns the signed batches in the order of the specs.
+'''
+
+import asyncio
+import collections
+import hashlib
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
+from sawtooth_sdk.protobuf.batch_pb2 import BatchHeader
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+
+from battleship_family.battleship_keystore import get_keystore
+
+FAMILY_NAME = 'battleship'
+FAMILY_VERSION = '1.0'
+
+# private_key is the hex encoded key of the signer, payload the encoded
+# payload, addresses the inputs and outputs of the transaction, and
+# family_version the version the payload is encoded for
+TransactionSpec = collections.namedtuple(
+    'TransactionSpec',
+    ['private_key', 'payload', 'addresses', 'dependencies', 'family_version'])
+TransactionSpec.__new__.__defaults__ = (FAMILY_VERSION,)
+
+
+def _hash(data):
+    return hashlib.sha512(data).hexdigest()
+
+
+def sign_spec(spec):
+    '''Build the transaction of spec and wrap it in a signed batch.'''
+    keystore = get_keystore()
+    signer = keystore.signer(spec.private_key)
+    public_key = keystore.public_key(spec.private_key)
+
+    header = TransactionHeader(
+        signer_public_key=public_key,
+        family_name=FAMILY_NAME,
+        family_version=spec.family_version,
+        inputs=spec.addresses,
+        outputs=spec.addresses,
+        dependencies=spec.dependencies,
+        payload_sha512=_hash(spec.payload),
+        batcher_public_key=public_key,
+        nonce=hex(random.randint(0, 2**64))
+    ).SerializeToString()
+
+    transaction = Transaction(
+        header=header,
+        payload=spec.payload,
+        header_signature=signer.sign(header))
+
+    header = BatchHeader(
+        signer_public_key=public_key,
+        transaction_ids=[transaction.header_signature]
+    ).SerializeToString()
+
+    return Batch(
+        header=header,
+        transactions=[transaction],
+        header_signature=signer.sign(header))
+
+
+def _sign_to_bytes(specs):
+    # Runs in the workers; serialized batches are cheaper to send back
+    return [sign_spec(spec).SerializeToString() for spec in specs]
+
+
+def _parse_batch(data):
+    batch = Batch()
+    batch.ParseFromString(data)
+    return batch
+
+
+class SigningPool(object):
+    '''A pool of processes signing transaction specs into batches.
+
+       sign() blocks the caller; sign_async() is awaitable from an event
+       loop. Both return the batches in the order of the specs.
+    '''
+
+    def __init__(self, workers=None, chunksize=16):
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._chunksize = chunksize
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def sign(self, specs):
+        return [
+            _parse_batch(data)
+            for chunk in self._executor.map(
+                _sign_to_bytes, self._chunks(specs))
+            for data in chunk
+        ]
+
+    def sign_chained(self, keyed_specs):
+        '''Sign (key, spec) pairs, each transaction depending on the one
+           before it with the same key, and return the batches in the order
+           of the pairs.
+
+           A dependency names the signature of the transaction it depends
+           on, so the specs of a key are signed one round after the other;
+           the specs of different keys are signed together in each round.
+        '''
+        keyed_specs = list(keyed_specs)
+
+        positions = collections.OrderedDict()
+        for index, (key, _) in enumerate(keyed_specs):
+            positions.setdefault(key, []).append(index)
+
+        batches = [None] * len(keyed_specs)
+        previous = {}
+        for step in range(max(map(len, positions.values()), default=0)):
+            indexes = [
+                chain[step] for chain in positions.values()
+                if step < len(chain)
+            ]
+
+            specs = []
+            for index in indexes:
+                key, spec = keyed_specs[index]
+                if key in previous:
+                    spec = spec._replace(
+                        dependencies=list(spec.dependencies) + [previous[key]])
+                specs.append(spec)
+
+            for index, batch in zip(indexes, self.sign(specs)):
+                batches[index] = batch
+                previous[keyed_specs[index][0]] = \
+                    batch.transactions[0].header_signature
+
+        return batches
+
+    async def sign_async(self, specs):
+        futures = [
+            asyncio.wrap_future(self._executor.submit(_sign_to_bytes, chunk))
+            for chunk in self._chunks(specs)
+        ]
+        return [
+            _parse_batch(data)
+            for chunk in await asyncio.gather(*futures)
+            for data in chunk
+        ]
+
+    def _chunks(self, specs):
+        specs = list(specs)
+        return [
+            specs[i:i + self._chunksize]
+            for i in range(0, len(specs), self._chunksize)
+        ]
@@ -0,0 +1,305 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+WebSocket fan-out of battleship games to spectators.
+
+Each watched game has a single upstream subscription to the state changes of
+its addresses on the REST API. Every block touching the game becomes one
+compact delta message, serialized once and queued to all of its spectators;
+a spectator whose queue fills up is disconnected instead of slowing the
+others down.
+'''
+
+import asyncio
+import base64
+import json
+import logging
+
+import aiohttp
+from aiohttp import web
+
+from battleship_family.battleship_client import PARTITION_RESULTS
+from battleship_family.battleship_client import deserialize_games
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 64
+
+# WebSocket close code sent to dropped slow consumers (Try Again Later)
+CLOSE_SLOW_CONSUMER = 1013
+
+MAX_RECONNECT_DELAY = 30
+
+
+def subscriptions_url(base_url):
+    '''Return the REST API WebSocket URL for a REST API base URL.
+
+       As for the REST transport, a URL without a scheme is an http one;
+       other schemes, such as the tcp:// of a validator, are refused.
+    '''
+    if base_url.startswith('https://'):
+        return 'wss://{}/subscriptions'.format(base_url[len('https://'):])
+    if base_url.startswith('http://'):
+        return 'ws://{}/subscriptions'.format(base_url[len('http://'):])
+    if '://' in base_url:
+        raise Exception(
+            'Spectators need a REST API URL, not {}'.format(base_url))
+    return 'ws://{}/subscriptions'.format(base_url)
+
+
+def _board_deltas(old_board, new_board, board):
+    '''Return the shots on new_board that were not on old_board.'''
+    return [
+        {
+            'board': board,
+            'cell': index + 1,
+            'result': 'hit' if new == 'O' else 'miss',
+        }
+        for index, (old, new) in enumerate(zip(old_board, new_board))
+        if old != new and new in ('X', 'O')
+    ]
+
+
+class Spectator(object):
+    '''A WebSocket client watching one game, with its bounded queue.'''
+
+    def __init__(self, ws, queue_size):
+        self.ws = ws
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    async def run(self):
+        while True:
+            message = await self.queue.get()
+            await self.ws.send_str(message)
+
+
+class GameFeed(object):
+    '''The upstream subscription of one game and its spectators.'''
+
+    def __init__(self, name, addresses, ws_url, snapshot):
+        self._name = name
+        self._addresses = addresses
+        self._results_addresses = [
+            address for address in addresses
+            if address[6:8] == PARTITION_RESULTS
+        ]
+        self._ws_url = ws_url
+        self._snapshot = snapshot
+
+        self._spectators = set()
+        self._boards = None
+        self._task = None
+
+    @property
+    def spectators(self):
+        return self._spectators
+
+    @property
+    def synced(self):
+        '''Whether the snapshot of the game was published.'''
+        return self._boards is not None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._follow())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def add(self, spectator):
+        self._spectators.add(spectator)
+
+    def remove(self, spectator):
+        self._spectators.discard(spectator)
+
+    def publish(self, message):
+        data = json.dumps(message)
+        for spectator in list(self._spectators):
+            self.send(spectator, data)
+
+    def send(self, spectator, data):
+        try:
+            spectator.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            LOGGER.info('Dropping slow spectator of %s', self._name)
+            self._spectators.discard(spectator)
+            asyncio.ensure_future(spectator.ws.close(
+                code=CLOSE_SLOW_CONSUMER, message=b'slow consumer'))
+
+    async def _follow(self):
+        delay = 1
+        while True:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self._ws_url) as upstream:
+                        await upstream.send_str(json.dumps({
+                            'action': 'subscribe',
+                            'address_prefixes': self._addresses,
+                        }))
+
+                        # Subscribed first, so no block falls between the
+                        # snapshot and the first delta
+                        await self._resync()
+                        delay = 1
+
+                        async for msg in upstream:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._on_block(json.loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED,
+                                              aiohttp.WSMsgType.ERROR):
+                                break
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                LOGGER.warning('Subscription for %s failed: %s',
+                               self._name, err)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _resync(self):
+        view = await self._snapshot(self._name)
+        if view is None:
+            return
+
+        self._boards = (view['board_P1'], view['board_P2'])
+        self.publish(dict(view, type='snapshot'))
+
+    def _on_block(self, block):
+        changes = [
+            change for change in block.get('state_changes', [])
+            if change['address'] in self._addresses
+        ]
+        if not changes:
+            return
+
+        sets = [change for change in changes if change['type'] == 'SET']
+        if not sets:
+            self.publish({'type': 'deleted', 'name': self._name})
+            return
+
+        for change in sets:
+            value = base64.b64decode(change['value'])
+
+            if change['address'] in self._results_addresses:
+                for result in value.decode().split('|'):
+                    name, player1, player2, winner, moves, _ = \
+                        result.split(',')
+                    if name == self._name:
+                        self.publish({
+                            'type': 'archived',
+                            'block_num': block.get('block_num'),
+                            'winner': winner,
+                            'moves': int(moves),
+                        })
+                continue
+
+            for game_data in deserialize_games(value):
+                if game_data[0] == self._name:
+                    self._on_game(block, game_data)
+
+    def _on_game(self, block, game_data):
+        board_P1, board_P2, state = game_data[1:4]
+
+        moves = []
+        if self._boards is not None:
+            moves = _board_deltas(self._boards[0], board_P1, 1) + \
+                _board_deltas(self._boards[1], board_P2, 2)
+        self._boards = (board_P1, board_P2)
+
+        self.publish({
+            'type': 'delta',
+            'block_num': block.get('block_num'),
+            'state': state,
+            'moves': moves,
+        })
+
+
+class SpectatorHub(object):
+    '''The game feeds of a server, started and stopped on demand.'''
+
+    def __init__(self, base_url, addresses_of, snapshot,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        '''addresses_of(name) lists the addresses of a game; snapshot(name)
+           is a coroutine returning its spectator view, or None.
+        '''
+        self._ws_url = subscriptions_url(base_url)
+        self._addresses_of = addresses_of
+        self._snapshot = snapshot
+        self._queue_size = queue_size
+        self._feeds = {}
+
+    async def watch(self, name, ws):
+        feed = self._feeds.get(name)
+        if feed is None:
+            feed = GameFeed(
+                name, self._addresses_of(name), self._ws_url, self._snapshot)
+            self._feeds[name] = feed
+            feed.start()
+
+        spectator = Spectator(ws, self._queue_size)
+        feed.add(spectator)
+
+        # Until the feed is synced, its pending resync sends the snapshot
+        if not feed.synced:
+            return spectator
+
+        view = await self._snapshot(name)
+        if view is not None and spectator in feed.spectators:
+            feed.send(spectator, json.dumps(dict(view, type='snapshot')))
+
+        return spectator
+
+    def unwatch(self, name, spectator):
+        feed = self._feeds.get(name)
+        if feed is None:
+            return
+
+        feed.remove(spectator)
+        if not feed.spectators:
+            feed.stop()
+            del self._feeds[name]
+
+    def close(self):
+        for feed in self._feeds.values():
+            feed.stop()
+        self._feeds.clear()
+
+
+async def handle_watch(request):
+    hub = request.app['spectators']
+    name = request.match_info['name']
+
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+
+    spectator = await hub.watch(name, ws)
+    sender = asyncio.ensure_future(spectator.run())
+    try:
+        # Spectators only listen; incoming messages are ignored
+        async for _ in ws:
+            pass
+    finally:
+        hub.unwatch(name, spectator)
+        sender.cancel()
+        try:
+            await sender
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            LOGGER.exception('Sending to a spectator of %s failed', name)
+
+    return ws
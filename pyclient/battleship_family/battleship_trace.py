@@ -0,0 +1,204 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Tracing of battleship transactions, from the client to the processor.
+
+With BATTLESHIP_TRACE set to a file, the client and the transaction
+processor append timed spans to it in the Chrome trace event format, which
+chrome://tracing and Perfetto open. Every span of a transaction carries its
+trace id, the first 32 hex digits of its header signature, which both sides
+know without any change to the transaction.
+
+The client traces the build, sign, submit and commit stages of a move; the
+processor its apply and state get/set/delete calls. summarize() puts the
+spans of each move back together, the time between the end of the submit
+and the start of the apply being the time the move was queued.
+'''
+
+import collections
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = 'BATTLESHIP_TRACE'
+
+TRACE_ID_LENGTH = 32
+
+# Stages of a move, in order, as shown by summarize()
+STAGES = ('build', 'sign', 'submit', 'queue', 'apply', 'get_state',
+          'set_state', 'delete_state', 'commit')
+
+STATE_CALLS = ('get_state', 'set_state', 'delete_state')
+
+
+def trace_id(transaction):
+    '''Return the trace id of a signed transaction.'''
+    return transaction.header_signature[:TRACE_ID_LENGTH]
+
+
+def _microseconds(seconds):
+    return int(round(seconds * 1e6))
+
+
+class Tracer(object):
+    '''Appends trace events to path; does nothing without a path.
+
+       Several processes can share the file: each event is appended in a
+       single write. The file is left as an unterminated JSON array, which
+       the trace viewers accept.
+    '''
+
+    def __init__(self, path=None, process_name='battleship'):
+        self.path = path
+        self._fd = None
+        self._lock = threading.Lock()
+        if not path:
+            return
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            os.write(fd, b'[\n')
+            os.close(fd)
+        except FileExistsError:
+            pass
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+        self._write({
+            'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+            'args': {'name': process_name},
+        })
+
+    @property
+    def enabled(self):
+        return self._fd is not None
+
+    @staticmethod
+    def now():
+        return time.time()
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _write(self, event):
+        data = (json.dumps(event, separators=(',', ':')) + ',\n').encode()
+        with self._lock:
+            if self._fd is not None:
+                os.write(self._fd, data)
+
+    def span(self, name, start, end, trace, **args):
+        '''Record stage name of transaction trace, from start to end, as
+           returned by now().
+        '''
+        if self._fd is None:
+            return
+        args['trace_id'] = trace
+        self._write({
+            'name': name, 'cat': 'battleship', 'ph': 'X',
+            'ts': _microseconds(start),
+            'dur': _microseconds(end - start),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def flow_start(self, at, trace):
+        '''Start the arrow leading the viewers from the client to the
+           processor spans of trace.
+        '''
+        if self._fd is None:
+            return
+        self._write({
+            'name': 'transaction', 'cat': 'battleship', 'ph': 's',
+            'id': trace, 'ts': _microseconds(at),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+        })
+
+
+_TRACER = None
+_TRACER_LOCK = threading.Lock()
+
+
+def get_tracer():
+    '''Return the tracer of the process, writing to BATTLESHIP_TRACE.'''
+    global _TRACER
+    with _TRACER_LOCK:
+        if _TRACER is None:
+            _TRACER = Tracer(
+                os.environ.get(TRACE_ENV), process_name='battleship client')
+        return _TRACER
+
+
+def read_trace(path):
+    '''Return the events of a trace file.'''
+    with open(path) as fd:
+        text = fd.read().strip()
+    if not text.endswith(']'):
+        text = text.rstrip(',') + ']'
+    return json.loads(text)
+
+
+def _move(spans):
+    '''Return the stages of one move: stage -> [start, duration, count],
+       in microseconds.
+
+       A transaction is applied again by every node and on retries; only
+       the first apply and its state calls are counted, along with the
+       number of applies.
+    '''
+    spans = sorted(spans, key=lambda span: span['ts'])
+    applies = [span for span in spans if span['name'] == 'apply']
+    first = applies[0] if applies else None
+
+    stages = {}
+    for span in spans:
+        if span['name'] == 'apply' and span is not first:
+            continue
+        if span['name'] in STATE_CALLS and (
+                first is None or span['pid'] != first['pid'] or
+                not first['ts'] <= span['ts'] <= first['ts'] + first['dur']):
+            continue
+        stage = stages.setdefault(span['name'], [span['ts'], 0, 0])
+        stage[1] += span['dur']
+        stage[2] += 1
+
+    if first is not None:
+        stages['apply'][2] = len(applies)
+        if 'submit' in stages:
+            submitted = stages['submit'][0] + stages['submit'][1]
+            stages['queue'] = [submitted, first['ts'] - submitted, 1]
+    return stages
+
+
+def summarize(events):
+    '''Group the spans of events by trace id; return trace id -> (start,
+       end, stages), with stages as returned by _move, slowest move first.
+    '''
+    spans = collections.defaultdict(list)
+    for event in events:
+        if event.get('ph') == 'X' and 'trace_id' in event.get('args', {}):
+            spans[event['args']['trace_id']].append(event)
+
+    moves = {}
+    for trace, trace_spans in spans.items():
+        start = min(span['ts'] for span in trace_spans)
+        end = max(span['ts'] + span['dur'] for span in trace_spans)
+        moves[trace] = (start, end, _move(trace_spans))
+
+    return collections.OrderedDict(sorted(
+        moves.items(), key=lambda item: item[1][0] - item[1][1]))
@@ -0,0 +1,681 @@
+# Copyright 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Transports used by BattleshipClient to reach the validator.
+
+RestTransport goes through the REST API. ZmqTransport, selected with a
+tcp:// URL, speaks the validator's client protocol directly over one
+persistent ZMQ connection, which saves the REST API hop for clients running
+next to a validator. MultiTransport spreads the requests over several of
+them and fails over when one cannot be reached.
+'''
+
+import base64
+import itertools
+import json
+import logging
+import threading
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+LOGGER = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 300
+
+# Seconds to wait for a connection to a REST API before failing over
+CONNECT_TIMEOUT = 5
+
+# Number of state reads of one get_states() call sent to a REST API at once
+READ_CONCURRENCY = 16
+
+DEFAULT_HEALTH_INTERVAL = 5
+DEFAULT_MAX_LATENCY = 2
+
+
+class TransportError(Exception):
+    '''The endpoint could not be reached or could not serve the request.'''
+
+
+def make_transport(url):
+    '''Return the transport matching the scheme of url.
+
+       url may also be a comma separated list, or a list, of endpoints.
+    '''
+    if isinstance(url, str):
+        urls = [u.strip() for u in url.split(',') if u.strip()]
+    else:
+        urls = list(url)
+
+    if len(urls) > 1:
+        return MultiTransport(urls)
+    return _make_endpoint(urls[0])
+
+
+def _make_endpoint(url, connect_timeout=None):
+    if url.startswith('tcp://'):
+        return ZmqTransport(url)
+    return RestTransport(url, connect_timeout=connect_timeout)
+
+
+class RestTransport(object):
+    '''Reaches the validator through the REST API at base_url.'''
+
+    def __init__(self, base_url, connect_timeout=None):
+        if base_url.startswith("http://") or base_url.startswith("https://"):
+            self._base_url = base_url
+        else:
+            self._base_url = "http://{}".format(base_url)
+
+        # Responses may take long (batch status waits), connections should not
+        self._timeout = (connect_timeout, None) if connect_timeout else None
+
+        # Connections are kept alive and shared by concurrent reads
+        self._session = requests.Session()
+        self._session.mount('http://', requests.adapters.HTTPAdapter(
+            pool_maxsize=READ_CONCURRENCY))
+        self._session.mount('https://', requests.adapters.HTTPAdapter(
+            pool_maxsize=READ_CONCURRENCY))
+        self._executor = None
+
+    def __str__(self):
+        return self._base_url
+
+    def submit_batches(self, batch_list, key=None,
+                       auth_user=None, auth_password=None):
+        '''Submit a serialized BatchList and return the response text.
+
+           key, the game the batches are about, only matters to
+           MultiTransport.
+        '''
+        return self.send_request(
+            "batches", batch_list,
+            'application/octet-stream',
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def get_batch_status(self, batch_id, wait,
+                         auth_user=None, auth_password=None):
+        result = self.send_request(
+            'batch_statuses?id={}&wait={}'.format(batch_id, wait),
+            auth_user=auth_user,
+            auth_password=auth_password)
+        return json.loads(result)['data'][0]['status']
+
+    def get_batch_statuses(self, batch_ids, wait=0,
+                           auth_user=None, auth_password=None):
+        '''Return the status of each of batch_ids, by batch id.'''
+        # Posted as JSON, as many ids do not fit in a query string
+        suffix = 'batch_statuses'
+        if wait:
+            suffix += '?wait={}'.format(wait)
+        result = self.send_request(
+            suffix,
+            json.dumps(list(batch_ids)),
+            'application/json',
+            auth_user=auth_user,
+            auth_password=auth_password)
+        return {
+            status['id']: status['status']
+            for status in json.loads(result)['data']
+        }
+
+    def get_state(self, address, auth_user=None, auth_password=None):
+        '''Return the data stored at address, or None if there is none.'''
+        result = self.send_request(
+            "state/{}".format(address),
+            allow_missing=True,
+            auth_user=auth_user,
+            auth_password=auth_password)
+        if result is None:
+            return None
+
+        return base64.b64decode(json.loads(result)["data"])
+
+    def get_states(self, addresses, auth_user=None, auth_password=None):
+        '''Return the data stored at each of addresses, None where there
+           is none, by address.
+
+           The addresses are read concurrently, so the call takes about as
+           long as the slowest read.
+        '''
+        addresses = list(addresses)
+        if len(addresses) < 2:
+            return {
+                address: self.get_state(
+                    address,
+                    auth_user=auth_user,
+                    auth_password=auth_password)
+                for address in addresses
+            }
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=READ_CONCURRENCY)
+
+        futures = [
+            (address, self._executor.submit(
+                self.get_state, address,
+                auth_user=auth_user,
+                auth_password=auth_password))
+            for address in addresses
+        ]
+        return {address: future.result() for address, future in futures}
+
+    def list_state(self, prefix, page_size=None,
+                   auth_user=None, auth_password=None):
+        '''Yield the data of every entry under prefix, one page at a time.'''
+        query = "state?address={}".format(prefix)
+        if page_size:
+            query += "&limit={}".format(page_size)
+
+        suffix = query
+        while suffix is not None:
+            result = self.send_request(
+                suffix,
+                auth_user=auth_user,
+                auth_password=auth_password)
+
+            page = json.loads(result)
+            for entry in page["data"]:
+                yield base64.b64decode(entry["data"])
+
+            next_position = page.get("paging", {}).get("next_position")
+            if next_position:
+                suffix = "{}&start={}".format(query, next_position)
+            else:
+                suffix = None
+
+    def get_head(self, auth_user=None, auth_password=None):
+        result = self.send_request(
+            "blocks?limit=1",
+            auth_user=auth_user,
+            auth_password=auth_password)
+        return json.loads(result)["head"]
+
+    def send_request(self,
+                     suffix,
+                     data=None,
+                     content_type=None,
+                     name=None,
+                     allow_missing=False,
+                     auth_user=None,
+                     auth_password=None):
+        '''Send a REST command to the Validator via the REST API.
+
+           With allow_missing, a 404 response returns None instead of
+           raising.
+        '''
+
+        url = "{}/{}".format(self._base_url, suffix)
+
+        headers = {}
+
+        if auth_user is not None:
+            auth_string = "{}:{}".format(auth_user, auth_password)
+            b64_string = b64encode(auth_string.encode()).decode()
+            auth_header = 'Basic {}'.format(b64_string)
+            headers['Authorization'] = auth_header
+
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+
+        try:
+            if data is not None:
+                result = self._session.post(
+                    url, headers=headers, data=data, timeout=self._timeout)
+            else:
+                result = self._session.get(
+                    url, headers=headers, timeout=self._timeout)
+
+            if result.status_code == 404:
+                if allow_missing:
+                    return None
+                raise Exception("No such game: {}".format(name))
+
+            # The REST API answers 502-504 when its validator is unavailable
+            if result.status_code in (502, 503, 504):
+                raise TransportError("Error {}: {}".format(
+                    result.status_code, result.reason))
+
+            if not result.ok:
+                raise Exception("Error {}: {}".format(
+                    result.status_code, result.reason))
+
+        except TransportError:
+            raise
+
+        except (requests.ConnectionError, requests.Timeout) as err:
+            raise TransportError(
+                'Failed to connect to {}: {}'.format(url, str(err))) from err
+
+        except BaseException as err:
+            raise Exception(err)
+
+        return result.text
+
+
+class ZmqTransport(object):
+    '''Reaches the validator directly on its client ZMQ endpoint.
+
+       Authentication arguments are accepted for symmetry with
+       RestTransport and ignored: the validator endpoint has no Basic Auth.
+    '''
+
+    def __init__(self, url):
+        # Imported here so REST-only clients do not need a ZMQ stack
+        from sawtooth_sdk.messaging.stream import Stream
+
+        self._url = url
+        self._stream = Stream(url)
+
+    def __str__(self):
+        return self._url
+
+    def close(self):
+        self._stream.close()
+
+    def submit_batches(self, batch_list, key=None,
+                       auth_user=None, auth_password=None):
+        from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+        from sawtooth_sdk.protobuf.client_batch_submit_pb2 import \
+            ClientBatchSubmitRequest
+        from sawtooth_sdk.protobuf.client_batch_submit_pb2 import \
+            ClientBatchSubmitResponse
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        batches = BatchList()
+        batches.ParseFromString(batch_list)
+
+        response = self._send(
+            Message.CLIENT_BATCH_SUBMIT_REQUEST,
+            ClientBatchSubmitRequest(batches=batches.batches),
+            ClientBatchSubmitResponse())
+
+        if response.status != ClientBatchSubmitResponse.OK:
+            raise Exception("Error {}: batch submission failed".format(
+                ClientBatchSubmitResponse.Status.Name(response.status)))
+
+        return json.dumps({
+            "batch_ids": [batch.header_signature for batch in batches.batches]
+        })
+
+    def get_batch_status(self, batch_id, wait,
+                         auth_user=None, auth_password=None):
+        return self.get_batch_statuses([batch_id], wait)[batch_id]
+
+    def get_batch_statuses(self, batch_ids, wait=0,
+                           auth_user=None, auth_password=None):
+        from sawtooth_sdk.protobuf.client_batch_submit_pb2 import \
+            ClientBatchStatus
+        from sawtooth_sdk.protobuf.client_batch_submit_pb2 import \
+            ClientBatchStatusRequest
+        from sawtooth_sdk.protobuf.client_batch_submit_pb2 import \
+            ClientBatchStatusResponse
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        wait = min(int(wait), REQUEST_TIMEOUT)
+        response = self._send(
+            Message.CLIENT_BATCH_STATUS_REQUEST,
+            ClientBatchStatusRequest(
+                batch_ids=batch_ids, wait=wait > 0, timeout=wait),
+            ClientBatchStatusResponse(),
+            timeout=wait + REQUEST_TIMEOUT)
+
+        if response.status != ClientBatchStatusResponse.OK:
+            raise Exception("Error {}: batch status failed".format(
+                ClientBatchStatusResponse.Status.Name(response.status)))
+
+        return {
+            status.batch_id: ClientBatchStatus.Status.Name(status.status)
+            for status in response.batch_statuses
+        }
+
+    def get_state(self, address, auth_user=None, auth_password=None):
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateGetRequest
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateGetResponse
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        # An empty state root reads the state at the current chain head
+        response = self._send(
+            Message.CLIENT_STATE_GET_REQUEST,
+            ClientStateGetRequest(address=address),
+            ClientStateGetResponse())
+
+        return self._state_value(response)
+
+    def get_states(self, addresses, auth_user=None, auth_password=None):
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateGetRequest
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateGetResponse
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        # All the requests are sent before the first response is awaited,
+        # and read at the same state root so they see the same block
+        addresses = list(addresses)
+        if not addresses:
+            return {}
+
+        first = self._send(
+            Message.CLIENT_STATE_GET_REQUEST,
+            ClientStateGetRequest(address=addresses[0]),
+            ClientStateGetResponse())
+        values = {addresses[0]: self._state_value(first)}
+
+        futures = [
+            (address, self._submit(
+                Message.CLIENT_STATE_GET_REQUEST,
+                ClientStateGetRequest(
+                    state_root=first.state_root,
+                    address=address)))
+            for address in addresses[1:]
+        ]
+        for address, future in futures:
+            values[address] = self._state_value(
+                self._result(future, ClientStateGetResponse()))
+
+        return values
+
+    def _state_value(self, response):
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateGetResponse
+
+        if response.status == ClientStateGetResponse.NO_RESOURCE:
+            return None
+        if response.status != ClientStateGetResponse.OK:
+            raise Exception("Error {}: state read failed".format(
+                ClientStateGetResponse.Status.Name(response.status)))
+
+        return response.value
+
+    def list_state(self, prefix, page_size=None,
+                   auth_user=None, auth_password=None):
+        from sawtooth_sdk.protobuf.client_list_control_pb2 import \
+            ClientPagingControls
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateListRequest
+        from sawtooth_sdk.protobuf.client_state_pb2 import \
+            ClientStateListResponse
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        # Every page is read from the state root of the first one
+        state_root = ''
+        start = ''
+        while True:
+            response = self._send(
+                Message.CLIENT_STATE_LIST_REQUEST,
+                ClientStateListRequest(
+                    state_root=state_root,
+                    address=prefix,
+                    paging=ClientPagingControls(
+                        start=start, limit=page_size or 0)),
+                ClientStateListResponse())
+
+            if response.status == ClientStateListResponse.NO_RESOURCE:
+                return
+            if response.status != ClientStateListResponse.OK:
+                raise Exception("Error {}: state list failed".format(
+                    ClientStateListResponse.Status.Name(response.status)))
+
+            for entry in response.entries:
+                yield entry.data
+
+            state_root = response.state_root
+            start = response.paging.next
+            if not start:
+                return
+
+    def get_head(self, auth_user=None, auth_password=None):
+        from sawtooth_sdk.protobuf.client_block_pb2 import \
+            ClientBlockListRequest
+        from sawtooth_sdk.protobuf.client_block_pb2 import \
+            ClientBlockListResponse
+        from sawtooth_sdk.protobuf.client_list_control_pb2 import \
+            ClientPagingControls
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        response = self._send(
+            Message.CLIENT_BLOCK_LIST_REQUEST,
+            ClientBlockListRequest(paging=ClientPagingControls(limit=1)),
+            ClientBlockListResponse())
+
+        if response.status != ClientBlockListResponse.OK:
+            raise Exception("Error {}: block list failed".format(
+                ClientBlockListResponse.Status.Name(response.status)))
+
+        return response.head_id
+
+    def _send(self, message_type, request, response,
+              timeout=REQUEST_TIMEOUT):
+        future = self._submit(message_type, request)
+        return self._result(future, response, timeout=timeout)
+
+    def _submit(self, message_type, request):
+        # Stream.send raises ValidatorConnectionError while disconnected
+        try:
+            return self._stream.send(
+                message_type, request.SerializeToString())
+        except Exception as err:
+            raise TransportError(
+                'Failed to reach validator at {}: {}'.format(self._url, err))
+
+    def _result(self, future, response, timeout=REQUEST_TIMEOUT):
+        try:
+            content = future.result(timeout=timeout).content
+        except Exception as err:
+            raise TransportError(
+                'Failed to reach validator at {}: {}'.format(self._url, err))
+
+        response.ParseFromString(content)
+        return response
+
+
+class MultiTransport(object):
+    '''Spreads the requests of a client over several endpoints.
+
+       Reads go round-robin over the healthy endpoints. Submissions with a
+       key (the game name) stick to one endpoint, so the moves of a game are
+       received in order. An endpoint that cannot be reached is marked down
+       and the request is retried on the next one; a background thread
+       checks every endpoint and brings it back once it answers in time.
+    '''
+
+    def __init__(self, urls,
+                 health_interval=DEFAULT_HEALTH_INTERVAL,
+                 max_latency=DEFAULT_MAX_LATENCY):
+        self._endpoints = [
+            _make_endpoint(url, connect_timeout=CONNECT_TIMEOUT)
+            for url in urls
+        ]
+        self._healthy = [True] * len(self._endpoints)
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+        self._health_interval = health_interval
+        self._max_latency = max_latency
+        self._checks = [None] * len(self._endpoints)
+        self._stop = threading.Event()
+        self._checker = ThreadPoolExecutor(max_workers=len(self._endpoints))
+        self._health_thread = threading.Thread(
+            target=self._check_health, daemon=True)
+        self._health_thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._checker.shutdown(wait=False)
+        for endpoint in self._endpoints:
+            if hasattr(endpoint, 'close'):
+                endpoint.close()
+
+    @property
+    def healthy(self):
+        '''The endpoints currently considered healthy.'''
+        with self._lock:
+            return [
+                str(endpoint)
+                for endpoint, healthy in zip(self._endpoints, self._healthy)
+                if healthy
+            ]
+
+    def submit_batches(self, batch_list, key=None,
+                       auth_user=None, auth_password=None):
+        return self._call(
+            self._write_order(key), key, 'submit_batches', batch_list,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def get_batch_status(self, batch_id, wait,
+                         auth_user=None, auth_password=None):
+        return self._call(
+            self._read_order(), None, 'get_batch_status', batch_id, wait,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def get_batch_statuses(self, batch_ids, wait=0,
+                           auth_user=None, auth_password=None):
+        return self._call(
+            self._read_order(), None, 'get_batch_statuses', batch_ids,
+            wait=wait,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def get_state(self, address, auth_user=None, auth_password=None):
+        return self._call(
+            self._read_order(), None, 'get_state', address,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def get_states(self, addresses, auth_user=None, auth_password=None):
+        return self._call(
+            self._read_order(), None, 'get_states', addresses,
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def get_head(self, auth_user=None, auth_password=None):
+        return self._call(
+            self._read_order(), None, 'get_head',
+            auth_user=auth_user,
+            auth_password=auth_password)
+
+    def list_state(self, prefix, page_size=None,
+                   auth_user=None, auth_password=None):
+        # Only fails over until the first entry, as the pages of two
+        # endpoints may not line up
+        error = None
+        for index in self._read_order():
+            entries = self._endpoints[index].list_state(
+                prefix,
+                page_size=page_size,
+                auth_user=auth_user,
+                auth_password=auth_password)
+            try:
+                first = next(entries)
+            except StopIteration:
+                return
+            except TransportError as err:
+                self._mark_down(index, err)
+                error = err
+                continue
+
+            yield first
+            for data in entries:
+                yield data
+            return
+
+        raise error
+
+    def _read_order(self):
+        '''Endpoint indexes to try for a read: the healthy ones starting
+           with the next in turn, then the others as a last resort.
+        '''
+        count = len(self._endpoints)
+        start = next(self._counter) % count
+        order = [(start + i) % count for i in range(count)]
+        with self._lock:
+            return [i for i in order if self._healthy[i]] + \
+                [i for i in order if not self._healthy[i]]
+
+    def _write_order(self, key):
+        order = self._read_order()
+        if key is None:
+            return order
+
+        with self._lock:
+            pinned = self._pins.get(key)
+            if pinned is None or not self._healthy[pinned]:
+                pinned = order[0]
+                self._pins[key] = pinned
+
+        return [pinned] + [i for i in order if i != pinned]
+
+    def _call(self, order, key, method, *args, **kwargs):
+        error = None
+        for index in order:
+            try:
+                result = getattr(self._endpoints[index], method)(
+                    *args, **kwargs)
+            except TransportError as err:
+                self._mark_down(index, err)
+                error = err
+                continue
+
+            if key is not None:
+                with self._lock:
+                    self._pins[key] = index
+            return result
+
+        raise error
+
+    def _mark_down(self, index, err):
+        with self._lock:
+            if self._healthy[index]:
+                LOGGER.warning('Endpoint %s is down: %s',
+                               self._endpoints[index], err)
+            self._healthy[index] = False
+
+    def _check_health(self):
+        while not self._stop.wait(self._health_interval):
+            for index, endpoint in enumerate(self._endpoints):
+                # An endpoint still busy with its previous check is too slow
+                if self._checks[index] is not None and \
+                        not self._checks[index].done():
+                    self._mark_down(index, 'health check timed out')
+                    continue
+                self._checks[index] = self._checker.submit(
+                    self._check_endpoint, index, endpoint)
+
+    def _check_endpoint(self, index, endpoint):
+        start = time.time()
+        try:
+            endpoint.get_head()
+        except Exception as err:
+            self._mark_down(index, err)
+            return
+
+        latency = time.time() - start
+        if latency > self._max_latency:
+            self._mark_down(
+                index, 'answered in {:.1f}s'.format(latency))
+            return
+
+        with self._lock:
+            if not self._healthy[index]:
+                LOGGER.info('Endpoint %s is back up', endpoint)
+            self._healthy[index] = True
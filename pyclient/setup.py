@@ -33,6 +33,7 @@ setup(
     install_requires=[
         'aiohttp',
         'colorlog',
+        'numpy',
         'protobuf',
         'sawtooth-sdk',
         'sawtooth-signing',
@@ -42,6 +43,12 @@ setup(
     entry_points={
         'console_scripts': [
             'battleship = battleship_cli:main_wrapper',
+            'battleship-indexer = '
+            'battleship_family.battleship_indexer:main_wrapper',
+            'battleship-server = '
+            'battleship_family.battleship_server:main_wrapper',
+            'battleship-load = '
+            'battleship_family.battleship_load:main_wrapper',
         ]
     })
 
@@ -0,0 +1,385 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Tests of the transaction handler run against in-memory state.
+
+The transactions are built and signed by BattleshipClient, then executed by
+processor.memory_context.apply_batch, which refuses the addresses a
+transaction did not declare, as a validator does.
+'''
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'pyprocessor'))
+
+from processor.battleship_state import BattleshipState
+from processor.battleship_state import GAME_PARTITIONS
+from processor.battleship_state import PARTITION_FINISHED
+from processor.battleship_state import PARTITION_IN_PLAY
+from processor.battleship_state import PARTITION_PLACING
+from processor.battleship_state import PARTITION_PLAYERS
+from processor.battleship_state import _make_battleship_address
+from processor.battleship_state import _make_player_game_address
+from processor.battleship_state import _make_player_index_prefix
+from processor.battleship_tp import BattleshipTransactionHandler
+from processor.battleship_tp import bs_namespace
+from processor.memory_context import MemoryContext
+from processor.memory_context import MemoryState
+from processor.memory_context import apply_batch
+
+from battleship_family.battleship_client import BattleshipClient
+from battleship_family.battleship_signing import sign_spec
+
+# Nothing is sent: the transactions are applied in-process
+UNUSED_URL = 'http://127.0.0.1:1'
+
+PRIVATE_KEY = '1' * 64
+
+# One boat per row from A1, horizontal, and the squares they take
+FLEET = [(1, 'L', 5), (11, 'M', 4), (21, 'N', 3), (31, 'Q', 3), (41, 'P', 2)]
+FLEET_SQUARES = [
+    space + offset for space, _, length in FLEET for offset in range(length)
+]
+# Squares of rows F to J, where no boat is
+MISSES = list(range(51, 100))
+
+
+class MemoryTransport(object):
+    '''The reads of a client transport, served from a MemoryState.'''
+
+    def __init__(self, state):
+        self._state = state
+
+    def get_state(self, address, auth_user=None, auth_password=None):
+        return self._state.get(address)
+
+    def get_states(self, addresses, auth_user=None, auth_password=None):
+        return {address: self._state.get(address) for address in addresses}
+
+    def list_state(self, prefix, page_size=None,
+                   auth_user=None, auth_password=None):
+        for _, data in self._state.list(prefix):
+            yield data
+
+
+class NoReads(object):
+    '''A client transport failing the test on any read.'''
+
+    def __getattr__(self, name):
+        raise AssertionError('Unexpected read: {}'.format(name))
+
+
+class BattleshipHandlerTest(unittest.TestCase):
+
+    family_version = '1.0'
+    auto_archive = False
+
+    def setUp(self):
+        self.state = MemoryState()
+        self.handler = BattleshipTransactionHandler(
+            bs_namespace, auto_archive=self.auto_archive)
+        self.client = BattleshipClient(
+            base_url=UNUSED_URL, family_version=self.family_version)
+        self.client._transport = MemoryTransport(self.state)
+
+    def send(self, name, action, **fields):
+        '''Apply one transaction; return None or the id and error of the
+           rejected transaction.
+        '''
+        spec = self.client.txn_spec(
+            name, action, private_key=PRIVATE_KEY, **fields)
+        # The handler prints every hit and miss
+        with contextlib.redirect_stdout(io.StringIO()):
+            return apply_batch(self.handler, self.state, sign_spec(spec))
+
+    def assert_valid(self, name, action, **fields):
+        rejected = self.send(name, action, **fields)
+        self.assertIsNone(
+            rejected, '{} of {} rejected: {}'.format(action, name, rejected))
+
+    def assert_invalid(self, name, action, **fields):
+        self.assertIsNotNone(self.send(name, action, **fields))
+
+    def reader(self):
+        return BattleshipState(MemoryContext(self.state, [bs_namespace], []))
+
+    def partitions(self, name):
+        return [
+            partition for partition in GAME_PARTITIONS
+            if self.state.get(_make_battleship_address(name, partition))
+        ]
+
+    def indexed(self, player):
+        names = set()
+        for _, data in self.state.list(_make_player_index_prefix(player)):
+            names.update(data.decode().split('|'))
+        return names
+
+    def create(self, name, player1='jack', player2='jill'):
+        self.assert_valid(name, 'create', player1=player1, player2=player2)
+
+    def place_fleets(self, name, player1='jack', player2='jill'):
+        for player in (player1, player2):
+            for space, boat, _ in FLEET:
+                self.assert_valid(
+                    name, 'place', space=space, boat=boat,
+                    direction='horizontal', currentplayer=player)
+
+    def play_to_win(self, name, player1='jack', player2='jill'):
+        '''Have player1 sink the fleet of player2, who only misses.'''
+        misses = iter(MISSES)
+        for square in FLEET_SQUARES:
+            self.assert_valid(
+                name, 'shoot', space=square, currentplayer=player1)
+            if square != FLEET_SQUARES[-1]:
+                self.assert_valid(
+                    name, 'shoot', space=next(misses), currentplayer=player2)
+
+
+class TestGame(BattleshipHandlerTest):
+
+    def test_create(self):
+        self.create('g1')
+
+        game = self.reader().get_game('g1')
+        self.assertEqual(game.state, 'PLACE')
+        self.assertEqual((game.player1, game.player2), ('jack', 'jill'))
+
+    def test_create_already_created(self):
+        self.create('g1')
+
+        self.assert_invalid('g1', 'create', player1='jack', player2='jill')
+
+    def test_place_starts_the_game(self):
+        self.create('g1')
+        self.place_fleets('g1')
+
+        self.assertEqual(self.reader().get_game('g1').state, 'P1-NEXT')
+
+    def test_shoot_out_of_turn(self):
+        self.create('g1')
+        self.place_fleets('g1')
+
+        self.assert_invalid('g1', 'shoot', space=60, currentplayer='jill')
+
+    def test_win(self):
+        self.create('g1')
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+
+        game = self.reader().get_game('g1')
+        self.assertEqual(game.state, 'P1-WIN')
+        self.assertIsNone(self.reader().get_result('g1'))
+
+        self.assert_invalid('g1', 'shoot', space=99, currentplayer='jill')
+
+
+class TestAutoArchive(BattleshipHandlerTest):
+
+    auto_archive = True
+
+    def test_win_archives_the_game(self):
+        self.create('g1')
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+
+        self.assertIsNone(self.reader().get_game('g1'))
+        self.assertEqual(self.partitions('g1'), [])
+        result = self.reader().get_result('g1')
+        self.assertEqual(result.winner, 'jack')
+        self.assertEqual(result.moves, 2 * len(FLEET_SQUARES) - 1)
+
+        self.assertIsNone(self.client.show('g1'))
+        self.assertIsNotNone(self.client.show_result('g1'))
+
+    def test_win_removes_the_index_entries(self):
+        self.create('g1')
+        self.create('g2')
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+
+        self.assertEqual(self.indexed('jack'), {'g2'})
+        self.assertEqual(self.indexed('jill'), {'g2'})
+        self.assertEqual(self.client.my_games('jack'), [('g2', 'PLACE')])
+
+    def test_shots_of_a_client_without_the_players(self):
+        self.create('g1')
+        self.create('g2')
+        self.place_fleets('g1')
+
+        # As the CLI does, with a new client for each command
+        self.client = BattleshipClient(
+            base_url=UNUSED_URL, family_version=self.family_version)
+        self.client._transport = NoReads()
+        self.play_to_win('g1')
+
+        self.assertEqual(self.reader().get_result('g1').winner, 'jack')
+        self.assertEqual(self.indexed('jack'), {'g2'})
+        self.assertEqual(self.indexed('jill'), {'g2'})
+
+    def test_archived_game_cannot_be_created_again(self):
+        self.create('g1')
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+
+        self.assert_invalid('g1', 'create', player1='jack', player2='jill')
+
+
+class TestArchive(BattleshipHandlerTest):
+
+    def test_archive(self):
+        self.create('g1')
+        self.create('g2')
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+
+        self.assert_valid('g1', 'archive')
+
+        self.assertIsNone(self.reader().get_game('g1'))
+        self.assertEqual(self.reader().get_result('g1').winner, 'jack')
+        self.assertEqual(self.indexed('jack'), {'g2'})
+        self.assertEqual(self.indexed('jill'), {'g2'})
+
+    def test_archive_unfinished_game(self):
+        self.create('g1')
+        self.place_fleets('g1')
+
+        self.assert_invalid('g1', 'archive')
+        self.assertEqual(self.indexed('jack'), {'g1'})
+
+    def test_delete_archived_game(self):
+        self.create('g1')
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+        self.assert_valid('g1', 'archive')
+
+        self.assert_invalid('g1', 'delete')
+
+
+class TestPartitions(BattleshipHandlerTest):
+
+    def test_game_moves_with_its_state(self):
+        self.create('g1')
+        self.assertEqual(self.partitions('g1'), [PARTITION_PLACING])
+
+        self.place_fleets('g1')
+        self.assertEqual(self.partitions('g1'), [PARTITION_IN_PLAY])
+
+        self.play_to_win('g1')
+        self.assertEqual(self.partitions('g1'), [PARTITION_FINISHED])
+
+    def test_show(self):
+        self.create('g1')
+        self.place_fleets('g1')
+
+        fields = self.client.show('g1').decode().split(',')
+        self.assertEqual(fields[0], 'g1')
+        self.assertEqual(fields[3], 'P1-NEXT')
+
+    def test_show_missing_game(self):
+        self.assertIsNone(self.client.show('missing'))
+
+    def test_move_on_missing_game(self):
+        with self.assertRaisesRegex(Exception, 'No such game'):
+            self.client.txn_spec('missing', 'delete')
+
+
+class TestPlayerIndex(BattleshipHandlerTest):
+
+    def test_create_indexes_both_players(self):
+        self.create('g1')
+        self.create('g2', player1='jill', player2='joe')
+
+        self.assertEqual(self.indexed('jack'), {'g1'})
+        self.assertEqual(self.indexed('jill'), {'g1', 'g2'})
+        self.assertEqual(self.indexed('joe'), {'g2'})
+
+    def test_delete_removes_the_entries(self):
+        self.create('g1')
+        self.create('g2')
+
+        self.assert_valid('g1', 'delete')
+
+        self.assertEqual(self.indexed('jack'), {'g2'})
+        self.assertEqual(self.indexed('jill'), {'g2'})
+
+    def test_my_games(self):
+        self.create('g1')
+        self.create('g2', player1='jill', player2='joe')
+        self.place_fleets('g1')
+
+        self.assertEqual(
+            self.client.my_games('jill'), [('g1', 'P1-NEXT'), ('g2', 'PLACE')])
+        self.assertEqual(self.client.my_games('nobody'), [])
+
+    def test_moves_leave_the_index(self):
+        self.create('g1')
+        entries = self.state.list(_make_player_index_prefix('jack'))
+
+        self.place_fleets('g1')
+        self.play_to_win('g1')
+
+        self.assertEqual(
+            self.state.list(_make_player_index_prefix('jack')), entries)
+
+    def test_shot_declares_the_index_without_reading(self):
+        self.create('g1')
+
+        spec = self.client.txn_spec('g1', 'shoot', space=1, currentplayer='jack')
+        self.assertIn(
+            _make_player_game_address('jill', 'g1'), spec.addresses)
+
+        client = BattleshipClient(
+            base_url=UNUSED_URL, family_version=self.family_version)
+        client._transport = NoReads()
+        spec = client.txn_spec('g1', 'shoot', space=1, currentplayer='jack')
+        self.assertIn(bs_namespace + PARTITION_PLAYERS, spec.addresses)
+
+    def test_games_sharing_a_player_do_not_conflict(self):
+        self.create('g1')
+        self.create('g2')
+
+        for action, fields in (
+                ('place', dict(space=1, boat='L', direction='horizontal',
+                               currentplayer='jack')),
+                ('shoot', dict(space=1, currentplayer='jack'))):
+            first = self.client.txn_spec('g1', action, **fields)
+            second = self.client.txn_spec('g2', action, **fields)
+            self.assertFalse(
+                set(first.addresses) & set(second.addresses), action)
+
+
+# The same games with binary payloads
+
+class TestGameV2(TestGame):
+
+    family_version = '2.0'
+
+
+class TestAutoArchiveV2(TestAutoArchive):
+
+    family_version = '2.0'
+
+
+class TestPlayerIndexV2(TestPlayerIndex):
+
+    family_version = '2.0'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Tests of the indexer, replaying JSON lines event files into a temporary
+SQLite database and reading the query and stats output.
+'''
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from battleship_family.battleship_client import NAMESPACE
+from battleship_family.battleship_indexer import _block_to_json
+from battleship_family.battleship_indexer import main
+
+EMPTY_BOARD = '?' * 100
+
+
+def _address(partition, name):
+    return NAMESPACE + partition + hashlib.sha512(
+        name.encode('utf-8')).hexdigest()[:62]
+
+
+def _game(name, state, player1='jack', player2='jill', shots=0):
+    board = 'X' * shots + EMPTY_BOARD[shots:]
+    return ','.join(
+        [name, board, EMPTY_BOARD, state, player1, player2]).encode()
+
+
+def _set(address, value):
+    return (address, value, False)
+
+
+def _delete(address):
+    return (address, b'', True)
+
+
+class TestIndexer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.db = os.path.join(self.tmp, 'index.sqlite')
+
+    def replay(self, blocks):
+        path = os.path.join(self.tmp, 'blocks.jsonl')
+        with open(path, 'w') as fd:
+            for block in blocks:
+                fd.write(_block_to_json(*block))
+                fd.write('\n')
+        main('battleship-indexer', ['--db', self.db, 'replay', path])
+
+    def output(self, *args):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main('battleship-indexer', ['--db', self.db] + list(args))
+        return out.getvalue()
+
+    def query(self, *args):
+        return [json.loads(line)
+                for line in self.output('query', *args).splitlines()]
+
+    def games(self):
+        return {game['name']: game for game in self.query()}
+
+    def test_replay(self):
+        self.replay([
+            (1, 'b1', None, [
+                _set(_address('00', 'g1'), _game('g1', 'NEW')),
+                _set(_address('00', 'g2'), _game('g2', 'NEW', 'jill', 'joe')),
+                _set(_address('00', 'g3'), _game('g3', 'NEW')),
+            ]),
+            (2, 'b2', 'b1', [
+                _set(_address('01', 'g1'), _game('g1', 'P1-NEXT', shots=3)),
+                _delete(_address('00', 'g1')),
+                _delete(_address('00', 'g3')),
+            ]),
+            (3, 'b3', 'b2', [
+                _set(_address('02', 'g1'), _game('g1', 'P1-WIN', shots=17)),
+                _delete(_address('01', 'g1')),
+            ]),
+        ])
+
+        games = self.games()
+        self.assertEqual(sorted(games), ['g1', 'g2'])
+        self.assertEqual(games['g1']['state'], 'P1-WIN')
+        self.assertEqual(games['g1']['address'], _address('02', 'g1'))
+        self.assertEqual(games['g1']['moves'], 17)
+        self.assertEqual(games['g1']['winner'], 'jack')
+        self.assertEqual(games['g1']['block_num'], 3)
+
+        self.assertEqual(
+            [game['name'] for game in self.query('--player', 'jill')],
+            ['g1', 'g2'])
+        self.assertEqual(
+            [game['name'] for game in self.query('--state', 'NEW')], ['g2'])
+        self.assertEqual(len(self.query('--limit', '1')), 1)
+
+        stats = json.loads(self.output('stats'))
+        self.assertEqual(stats['states'], {'NEW': 1, 'P1-WIN': 1})
+        self.assertEqual(stats['average_moves_to_win'], 17)
+        self.assertEqual(stats['players'], [
+            {'player': 'jack', 'games': 1, 'wins': 1},
+            {'player': 'jill', 'games': 2, 'wins': 0},
+            {'player': 'joe', 'games': 1, 'wins': 0},
+        ])
+
+    def test_results(self):
+        self.replay([
+            (1, 'b1', None, [
+                _set(_address('03', 'g1'), b'g1,jack,jill,jill,40,1'),
+            ]),
+        ])
+
+        game = self.games()['g1']
+        self.assertEqual(game['state'], 'P2-WIN')
+        self.assertEqual(game['winner'], 'jill')
+        self.assertEqual(game['archived'], 1)
+
+    def test_fork_reads_the_orphaned_games_again(self):
+        self.replay([
+            (1, 'b1', None, [
+                _set(_address('00', 'g1'), _game('g1', 'NEW')),
+            ]),
+            # Orphaned: g1 starts, g2 is created
+            (2, 'b2', 'b1', [
+                _set(_address('01', 'g1'), _game('g1', 'P1-NEXT', shots=1)),
+                _delete(_address('00', 'g1')),
+                _set(_address('00', 'g2'), _game('g2', 'NEW')),
+            ]),
+            (3, 'b3', 'b2', [
+                _set(_address('01', 'g1'), _game('g1', 'P2-NEXT', shots=2)),
+            ]),
+            # The fork from b1, with the state read when it was received
+            (2, 'c2', 'b1', [
+                _set(_address('00', 'g3'), _game('g3', 'NEW')),
+            ], {
+                _address('00', 'g1'): _game('g1', 'NEW'),
+                _address('01', 'g1'): None,
+                _address('00', 'g2'): None,
+            }),
+        ])
+
+        games = self.games()
+        self.assertEqual(sorted(games), ['g1', 'g3'])
+        self.assertEqual(games['g1']['state'], 'NEW')
+        self.assertEqual(games['g1']['address'], _address('00', 'g1'))
+
+        # The orphaned blocks are forgotten: the next block follows c2
+        self.replay([
+            (3, 'c3', 'c2', [
+                _set(_address('00', 'g4'), _game('g4', 'NEW')),
+            ]),
+        ])
+        self.assertEqual(sorted(self.games()), ['g1', 'g3', 'g4'])
+
+    def test_fork_without_the_state(self):
+        with self.assertRaises(Exception):
+            self.replay([
+                (1, 'b1', None, [
+                    _set(_address('00', 'g1'), _game('g1', 'NEW')),
+                ]),
+                (2, 'b2', 'b1', [
+                    _set(_address('00', 'g2'), _game('g2', 'NEW')),
+                ]),
+                (2, 'c2', 'b1', []),
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Parity tests of the payload encodings of the client and the processor.
+
+Payloads are encoded by battleship_family.battleship_payload, for the
+clients and the processor's tools alike, and decoded by
+processor.battleship_payload: both have to use the same tables, and every
+move has to decode the same in 1.0 and 2.0.
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'pyprocessor'))
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from processor import battleship_payload as processor_payload
+from processor.battleship_payload import BattleshipPayload
+
+from battleship_family import battleship_payload as client_payload
+from battleship_family.battleship_payload import encode_payload
+from battleship_family.battleship_payload import payload_action
+
+FIELDS = ('name', 'action', 'space', 'boat', 'direction', 'player1',
+          'player2', 'currentplayer')
+
+MOVES = [
+    dict(name='g1', action='create', player1='jack', player2='jill'),
+    dict(name='g1', action='place', space=1, boat='L',
+         direction='horizontal', currentplayer='jack'),
+    dict(name='g1', action='place', space=57, boat='P',
+         direction='vertical', currentplayer='jill'),
+    dict(name='g1', action='shoot', space=99, currentplayer='jack'),
+    dict(name='g1', action='delete'),
+    dict(name='g1', action='archive'),
+    dict(name='jeu é', action='create', player1='joueur ü',
+         player2='j' * 255),
+]
+
+
+def _decode(payload, family_version):
+    decoded = BattleshipPayload.from_bytes(payload, family_version)
+    return {field: getattr(decoded, field) for field in FIELDS}
+
+
+class TestTables(unittest.TestCase):
+
+    def test_opcodes(self):
+        self.assertEqual(
+            client_payload.V2_ACTIONS, processor_payload.V2_OPCODES)
+
+    def test_boats(self):
+        self.assertEqual(client_payload.V2_BOATS, processor_payload.V2_BOATS)
+
+    def test_no_cell(self):
+        self.assertEqual(client_payload.NO_CELL, processor_payload.NO_CELL)
+
+
+class TestRoundTrip(unittest.TestCase):
+
+    def test_round_trip(self):
+        for family_version in client_payload.FAMILY_VERSIONS:
+            for move in MOVES:
+                decoded = _decode(
+                    encode_payload(family_version, **move), family_version)
+                expected = dict({field: '' for field in FIELDS}, **move)
+                self.assertEqual(decoded, expected, family_version)
+
+    def test_versions_decode_the_same(self):
+        for move in MOVES:
+            self.assertEqual(
+                _decode(encode_payload('1.0', **move), '1.0'),
+                _decode(encode_payload('2.0', **move), '2.0'))
+
+    def test_payload_action(self):
+        for family_version in client_payload.FAMILY_VERSIONS:
+            for move in MOVES:
+                payload = encode_payload(family_version, **move)
+                self.assertEqual(
+                    payload_action(payload, family_version), move['action'])
+
+
+class TestInvalidV2(unittest.TestCase):
+
+    def assert_invalid(self, payload):
+        with self.assertRaises(InvalidTransaction):
+            BattleshipPayload.from_bytes(payload, '2.0')
+
+    def shot(self):
+        return bytearray(encode_payload(
+            '2.0', 'g1', 'shoot', space=5, currentplayer='jack'))
+
+    def test_valid_shot(self):
+        self.assertEqual(
+            BattleshipPayload.from_bytes(bytes(self.shot()), '2.0').space, 5)
+
+    def test_invalid_opcode(self):
+        for opcode in (0, max(processor_payload.V2_OPCODES) + 1, 0xFF):
+            payload = self.shot()
+            payload[0] = opcode
+            self.assert_invalid(bytes(payload))
+
+    def test_invalid_cell(self):
+        for cell in (99, 100, processor_payload.NO_CELL):
+            payload = self.shot()
+            payload[1] = cell
+            self.assert_invalid(bytes(payload))
+
+    def test_invalid_boat(self):
+        for boat in (len(processor_payload.V2_BOATS) + 1, 0x7F):
+            payload = bytearray(encode_payload(
+                '2.0', 'g1', 'place', space=1, boat='L',
+                direction='horizontal', currentplayer='jack'))
+            payload[2] = boat << 1
+            self.assert_invalid(bytes(payload))
+
+    def test_truncated(self):
+        payload = bytes(self.shot())
+        self.assert_invalid(payload[:2])
+        self.assert_invalid(payload[:-1])
+
+    def test_missing_name(self):
+        self.assert_invalid(bytes(self.shot()[:3]))
+
+    def test_too_many_fields(self):
+        self.assert_invalid(bytes(self.shot()) + b'\x01a' * 4)
+
+    def test_separator_in_field(self):
+        self.assert_invalid(encode_payload('2.0', 'g,1', 'delete'))
+        self.assert_invalid(encode_payload('2.0', 'g|1', 'delete'))
+
+    def test_not_utf8(self):
+        self.assert_invalid(bytes(self.shot()[:3]) + b'\x01\xff')
+
+    def test_unsupported_version(self):
+        with self.assertRaises(InvalidTransaction):
+            BattleshipPayload.from_bytes(bytes(self.shot()), '3.0')
+
+
+class TestInvalidClientMoves(unittest.TestCase):
+
+    def test_invalid_action(self):
+        with self.assertRaises(Exception):
+            encode_payload('2.0', 'g1', 'show')
+
+    def test_invalid_boat(self):
+        with self.assertRaises(Exception):
+            encode_payload('2.0', 'g1', 'place', space=1, boat='Z',
+                           direction='horizontal')
+
+    def test_long_name(self):
+        with self.assertRaises(Exception):
+            encode_payload('2.0', 'g' * 256, 'delete')
+
+    def test_unsupported_version(self):
+        with self.assertRaises(Exception):
+            encode_payload('3.0', 'g1', 'delete')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,345 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Tests of the client against the REST API stand-in.
+
+Each test starts processor.battleship_rest.RestStandIn on a free port and
+talks to it over HTTP, as to a validator's REST API.
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'pyprocessor'))
+
+from processor.battleship_rest import RestStandIn
+
+from battleship_family.battleship_batchfile import iter_batch_file
+from battleship_family.battleship_batchfile import submit_file
+from battleship_family.battleship_batchfile import write_batch_file
+from battleship_family.battleship_bot import BotDriver
+from battleship_family.battleship_client import BattleshipClient
+from battleship_family.battleship_client import deserialize_games
+from battleship_family.battleship_load import LoadGenerator
+from battleship_family.battleship_signing import SigningPool
+from battleship_family.battleship_signing import sign_spec
+
+PRIVATE_KEYS = {'jack': '1' * 64, 'jill': '2' * 64}
+
+# One boat per row from A1, horizontal
+FLEET = [(1, 'L'), (11, 'M'), (21, 'N'), (31, 'Q'), (41, 'P')]
+
+WAIT = 10
+
+
+class StandInTest(unittest.TestCase):
+    '''Starts a stand-in, and writes the keys of the players.'''
+
+    block_interval = 0
+
+    def setUp(self):
+        self.key_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.key_dir)
+        for player, private_key in PRIVATE_KEYS.items():
+            with open(self.keyfile(player), 'w') as fd:
+                fd.write(private_key)
+
+        self.rest = RestStandIn(
+            bind='127.0.0.1:0', block_interval=self.block_interval).start()
+        self.addCleanup(self.rest.stop)
+
+    def keyfile(self, player):
+        return os.path.join(self.key_dir, '{}.priv'.format(player))
+
+    def client(self, player=None, **kwargs):
+        return BattleshipClient(
+            self.rest.url,
+            keyfile=None if player is None else self.keyfile(player),
+            **kwargs)
+
+    def specs(self, client, name):
+        '''Return the (name, spec) pairs creating game name and placing
+           both fleets, signed with the keys of the players.
+        '''
+        specs = [(name, client.txn_spec(
+            name, 'create', player1='jack', player2='jill',
+            private_key=PRIVATE_KEYS['jack']))]
+        for player in ('jack', 'jill'):
+            for space, boat in FLEET:
+                specs.append((name, client.txn_spec(
+                    name, 'place', space, boat=boat, direction='horizontal',
+                    currentplayer=player, private_key=PRIVATE_KEYS[player])))
+        return specs
+
+    def game(self, client, name):
+        data = client.show(name)
+        if data is None:
+            return None
+        return [game for game in deserialize_games(data) if game[0] == name][0]
+
+
+class TestClient(StandInTest):
+
+    def start_game(self, name):
+        '''Create game name and place the fleets; return the clients.'''
+        jack, jill = self.client('jack'), self.client('jill')
+        jack.create(name, 'jack', 'jill', wait=WAIT)
+        for client, player in ((jack, 'jack'), (jill, 'jill')):
+            for space, boat in FLEET:
+                client.place(
+                    name, space, boat, 'horizontal', player, wait=WAIT)
+        return jack, jill
+
+    def test_create(self):
+        jack = self.client('jack')
+        jack.create('g1', 'jack', 'jill', wait=WAIT)
+
+        game = self.game(jack, 'g1')
+        self.assertEqual(game[3], 'PLACE')
+        self.assertEqual(game[4:6], ['jack', 'jill'])
+
+    def test_place_and_shoot(self):
+        jack, jill = self.start_game('g1')
+        self.assertEqual(self.game(jack, 'g1')[3], 'P1-NEXT')
+
+        # A hit on the boat of jill at A1, then a miss on J1
+        jack.shoot('g1', 1, 'jack', wait=WAIT)
+        jill.shoot('g1', 91, 'jill', wait=WAIT)
+
+        game = self.game(jill, 'g1')
+        self.assertEqual(game[3], 'P1-NEXT')
+        self.assertEqual(game[2][0], 'O')
+        self.assertEqual(game[1][90], 'X')
+
+    def test_rejected_shot(self):
+        jack, jill = self.start_game('g1')
+
+        # Not the turn of jill: the game does not change
+        jill.shoot('g1', 1, 'jill', wait=WAIT)
+
+        game = self.game(jack, 'g1')
+        self.assertEqual(game[3], 'P1-NEXT')
+        self.assertNotIn('O', game[1] + game[2])
+
+    def test_show_missing_game(self):
+        self.assertIsNone(self.client().show('missing'))
+
+
+class TestSigningPool(StandInTest):
+
+    def test_sign_chained(self):
+        client = self.client()
+        specs = self.specs(client, 'g1') + self.specs(client, 'g2')
+
+        with SigningPool(workers=2, chunksize=4) as pool:
+            batches = pool.sign_chained(specs)
+
+        # Each transaction depends on the one before it in its game
+        for name in ('g1', 'g2'):
+            chain = [batch.transactions[0] for (key, _), batch
+                     in zip(specs, batches) if key == name]
+            for previous, transaction in zip(chain, chain[1:]):
+                self.assertIn(
+                    previous.header_signature,
+                    TransactionHeader.FromString(
+                        transaction.header).dependencies)
+
+        client.send_batches(batches, wait=WAIT)
+        for name in ('g1', 'g2'):
+            self.assertEqual(self.game(client, name)[3], 'P1-NEXT')
+
+
+class TestBatchFile(StandInTest):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.key_dir, 'batches.bin')
+
+    def chained_batches(self, client, name):
+        with SigningPool(workers=1) as pool:
+            return pool.sign_chained(self.specs(client, name))
+
+    def test_round_trip(self):
+        client = self.client()
+        batches = self.chained_batches(client, 'g1')
+
+        records = write_batch_file(self.path, batches, batches_per_list=3)
+        self.assertEqual(records, 4)
+        read = [batch for data in iter_batch_file(self.path)
+                for batch in BatchList.FromString(bytes(data)).batches]
+        self.assertEqual(read, batches)
+
+        stats = submit_file(client, self.path, timeout=WAIT)
+        self.assertEqual(
+            (stats.submitted, stats.failed, stats.pending), (4, 0, 0))
+        self.assertEqual(self.game(client, 'g1')[3], 'P1-NEXT')
+
+    def test_out_of_order(self):
+        client = self.client()
+        batches = self.chained_batches(client, 'g1')
+
+        # Every batch arrives before the one it depends on
+        write_batch_file(self.path, batches[::-1])
+        stats = submit_file(client, self.path, in_flight=1, timeout=WAIT)
+
+        self.assertEqual((stats.failed, stats.pending), (0, 0))
+        self.assertEqual(self.game(client, 'g1')[3], 'P1-NEXT')
+
+    def test_dependency_held_back(self):
+        client = self.client()
+        create, place = self.chained_batches(client, 'g1')[:2]
+
+        client.send_batches([place])
+        self.assertEqual(
+            client.get_batch_statuses([place.header_signature]),
+            {place.header_signature: 'PENDING'})
+
+        client.send_batches([create], wait=WAIT)
+        statuses = client.get_batch_statuses(
+            [create.header_signature, place.header_signature], wait=WAIT)
+        self.assertEqual(set(statuses.values()), {'COMMITTED'})
+
+    def test_invalid_dependency(self):
+        client = self.client()
+        first = self.chained_batches(client, 'g1')
+        second = self.chained_batches(client, 'g1')
+
+        client.send_batches(first[:1], wait=WAIT)
+        # Creates the game again: invalid, and so is what depends on it
+        client.send_batches(second[:2], wait=WAIT)
+        statuses = client.get_batch_statuses(
+            [batch.header_signature for batch in second[:2]], wait=WAIT)
+        self.assertEqual(set(statuses.values()), {'INVALID'})
+
+
+class TestPipeline(StandInTest):
+
+    def test_pipelined_moves(self):
+        client = self.client(pipeline=True)
+        for name, spec in self.specs(client, 'g1'):
+            client.send_spec(name, spec)
+        client.send_spec('g1', client.txn_spec(
+            'g1', 'shoot', 1, currentplayer='jack',
+            private_key=PRIVATE_KEYS['jack']))
+
+        self.assertEqual(client.flush(timeout=WAIT), {})
+        self.assertEqual(client.pending, 0)
+        self.assertEqual(self.game(client, 'g1')[3], 'P2-NEXT')
+
+    def test_broken_chain(self):
+        client = self.client(pipeline=True)
+        for name, spec in self.specs(client, 'g1'):
+            client.send_spec(name, spec)
+        # Not the turn of jill
+        client.send_spec('g1', client.txn_spec(
+            'g1', 'shoot', 1, currentplayer='jill',
+            private_key=PRIVATE_KEYS['jill']))
+
+        self.assertIn('g1', client.flush(timeout=WAIT))
+        with self.assertRaises(Exception):
+            client.send_spec('g1', client.txn_spec(
+                'g1', 'shoot', 1, currentplayer='jack',
+                private_key=PRIVATE_KEYS['jack']))
+
+        client.reset_chain('g1')
+        client.send_spec('g1', client.txn_spec(
+            'g1', 'shoot', 1, currentplayer='jack',
+            private_key=PRIVATE_KEYS['jack']))
+        self.assertEqual(client.flush(timeout=WAIT), {})
+
+
+class TestShowMany(StandInTest):
+
+    def test_matches_show(self):
+        client = self.client()
+        with SigningPool(workers=1) as pool:
+            client.send_batches(pool.sign_chained(
+                self.specs(client, 'g1') + self.specs(client, 'g2')),
+                wait=WAIT)
+        client.send_batches([sign_spec(client.txn_spec(
+            'g3', 'create', player1='jack', player2='jill',
+            private_key=PRIVATE_KEYS['jack']))], wait=WAIT)
+
+        names = ['g1', 'g2', 'g3', 'missing']
+        expected = {name: self.game(client, name) for name in names}
+        self.assertEqual(client.show_many(names), expected)
+        self.assertEqual(client.show_many(names, prefix_reads=True), expected)
+        self.assertEqual(expected['g1'][3], 'P1-NEXT')
+        self.assertEqual(expected['g3'][3], 'PLACE')
+
+
+class TestBots(StandInTest):
+
+    block_interval = 0.01
+
+    def driver(self):
+        driver = BotDriver(
+            self.client(), key_dir=self.key_dir, seed=1, poll_interval=0.01)
+        self.addCleanup(driver.close)
+        return driver
+
+    def test_games_are_won(self):
+        driver = self.driver()
+        for name in ('g1', 'g2'):
+            driver.add_game(name, 'jack', 'jill')
+
+        self.assertEqual(driver.run(timeout=60), [])
+        for game in driver.games.values():
+            self.assertIsNone(game.error)
+            self.assertIn(game.winner, ('jack', 'jill'))
+            self.assertEqual(
+                self.game(self.client(), game.name)[3],
+                'P1-WIN' if game.winner == 'jack' else 'P2-WIN')
+
+    def test_invalid_placement(self):
+        driver = self.driver()
+        # Every boat on A1
+        driver._bot.place_fleet = lambda: [
+            (1, boat, 'horizontal') for _, boat in FLEET]
+        game = driver.add_game('g1', 'jack', 'jill')
+
+        self.assertEqual(driver.run(timeout=WAIT), [])
+        self.assertIsNone(game.winner)
+        self.assertIn('INVALID', game.error)
+
+
+class TestLoad(StandInTest):
+
+    block_interval = 0.01
+
+    def test_run(self):
+        with LoadGenerator(
+                self.client(), ['jack', 'jill'], games=2,
+                key_dir=self.key_dir, poll_interval=0.01,
+                seed=1) as generator:
+            summary = generator.run(duration=1, drain_timeout=WAIT)
+
+        counts = summary['counts']
+        self.assertGreater(counts['committed'], 0)
+        self.assertEqual(counts['committed'], counts['submitted'])
+        self.assertEqual(
+            (counts['invalid'], counts['rejected'], counts['lost'],
+             counts['pending']), (0, 0, 0, 0))
+        self.assertEqual(
+            summary['latency']['all']['count'], counts['committed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
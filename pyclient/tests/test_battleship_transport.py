@@ -0,0 +1,114 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Tests of the failover of MultiTransport over ZmqTransport endpoints.
+
+The SDK Stream of each endpoint is replaced by a fake validator connection:
+one endpoint is disconnected, and Stream.send raises, as the SDK does.
+'''
+
+import json
+import unittest
+from unittest import mock
+
+from sawtooth_sdk.messaging.exceptions import ValidatorConnectionError
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.client_batch_submit_pb2 import \
+    ClientBatchSubmitResponse
+from sawtooth_sdk.protobuf.client_state_pb2 import ClientStateGetResponse
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+from battleship_family.battleship_transport import MultiTransport
+from battleship_family.battleship_transport import TransportError
+from battleship_family.battleship_transport import ZmqTransport
+
+UP = 'tcp://up:4004'
+DOWN = 'tcp://down:4004'
+
+RESPONSES = {
+    Message.CLIENT_STATE_GET_REQUEST: ClientStateGetResponse(
+        status=ClientStateGetResponse.OK, value=b'game'),
+    Message.CLIENT_BATCH_SUBMIT_REQUEST: ClientBatchSubmitResponse(
+        status=ClientBatchSubmitResponse.OK),
+}
+
+
+class FakeFuture(object):
+
+    def __init__(self, content):
+        self._content = content
+
+    def result(self, timeout=None):
+        return mock.Mock(content=self._content)
+
+
+class FakeStream(object):
+    '''Answers every request when up; raises from send() when down.'''
+
+    def __init__(self, url):
+        self.url = url
+        self.sent = []
+
+    def send(self, message_type, content):
+        if self.url == DOWN:
+            raise ValidatorConnectionError()
+        self.sent.append(message_type)
+        return FakeFuture(RESPONSES[message_type].SerializeToString())
+
+    def close(self):
+        pass
+
+
+class TestFailover(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch(
+            'sawtooth_sdk.messaging.stream.Stream', FakeStream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def multi(self, urls):
+        # No health check runs during a test
+        transport = MultiTransport(urls, health_interval=3600)
+        self.addCleanup(transport.close)
+        return transport
+
+    def test_disconnected_endpoint_raises_transport_error(self):
+        with self.assertRaises(TransportError):
+            ZmqTransport(DOWN).get_state('00')
+
+    def test_reads_fail_over(self):
+        transport = self.multi([DOWN, UP])
+
+        for _ in range(3):
+            self.assertEqual(transport.get_state('00'), b'game')
+        self.assertEqual(transport.healthy, [UP])
+
+    def test_submissions_fail_over_and_stick(self):
+        transport = self.multi([DOWN, UP])
+        batch_list = BatchList().SerializeToString()
+
+        for _ in range(3):
+            response = transport.submit_batches(batch_list, key='g1')
+            self.assertEqual(json.loads(response), {'batch_ids': []})
+        self.assertEqual(transport.healthy, [UP])
+
+    def test_every_endpoint_down(self):
+        transport = self.multi([DOWN, DOWN])
+
+        with self.assertRaises(TransportError):
+            transport.get_state('00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,37 +1,142 @@
+import struct
+
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
 
-class BattleshipPayload:
+# Actions that only read state are served by the REST API and must never be
+# put on chain, where they would cost validator execution time for nothing
+READ_ONLY_ACTIONS = ('list', 'show')
 
-    def __init__(self, payload):
-        try:
-            # The payload is csv utf-8 encoded string
-            name, action, space, boat, direction, player1, player2, currentplayer = payload.decode().split(",")
-        except ValueError as e:
-            raise InvalidTransaction("Invalid payload serialization") from e
+# Family version 2.0 payloads are binary:
+#   opcode byte, cell byte (space - 1, or NO_CELL), boat/direction byte,
+#   then the optional fields name, currentplayer, player1 and player2, each
+#   as a length byte and UTF-8 text; trailing empty fields can be omitted.
+# The boat/direction byte is 0 without a boat, otherwise
+#   (index of the boat in V2_BOATS + 1) << 1 | 1 if vertical
+# They are encoded by battleship_family.battleship_payload only.
+V2_OPCODES = {1: 'create', 2: 'place', 3: 'shoot', 4: 'delete', 5: 'archive'}
+V2_BOATS = ('L', 'M', 'N', 'Q', 'P')
+NO_CELL = 0xFF
+
+_V2_HEADER = struct.Struct('BBB')
+
+
+def _decode_v1(payload):
+    try:
+        # The payload is csv utf-8 encoded string
+        name, action, space, boat, direction, player1, player2, currentplayer = payload.decode().split(",")
+    except ValueError as e:
+        raise InvalidTransaction("Invalid payload serialization") from e
+
+    if action in READ_ONLY_ACTIONS:
+        raise InvalidTransaction(
+            'Read-only action {} is not a transaction, query the state '
+            'instead'.format(action))
 
-        if not name:
-            raise InvalidTransaction('Name is required')
+    if not name:
+        raise InvalidTransaction('Name is required')
 
-        if '|' in name:
-            raise InvalidTransaction('Name cannot contain "|"')
+    if '|' in name:
+        raise InvalidTransaction('Name cannot contain "|"')
 
-        if not action:
-            raise InvalidTransaction('Action is required')
+    if not action:
+        raise InvalidTransaction('Action is required')
 
-        if action not in ('list', 'create', 'show', 'place', 'shoot', 'delete'):
-            raise InvalidTransaction('Invalid action: {}'.format(action))
+    if action not in ('create', 'place', 'shoot', 'delete', 'archive'):
+        raise InvalidTransaction('Invalid action: {}'.format(action))
 
-        if action == 'shoot' or action == 'place':
+    if action == 'shoot' or action == 'place':
+        ## modified: case name for position as an index 
+        try:
             space = int(space)
-            try:
-                ## modified: case name for position as an index 
-                if int(space) not in range(1, 100):
-                    raise InvalidTransaction(
-                        "Space must be an integer from 1 to 100")
-            except ValueError:
-                raise InvalidTransaction(
-                    'Space must be an integer from 1 to 100') from ValueError
+        except ValueError:
+            raise InvalidTransaction(
+                'Space must be an integer from 1 to 100') from ValueError
+        if space not in range(1, 100):
+            raise InvalidTransaction(
+                "Space must be an integer from 1 to 100")
+
+    return name, action, space, boat, direction, player1, player2, currentplayer
+
+
+def _decode_v2(payload):
+    # The layout already rules out most of what _decode_v1 checks: the
+    # action is an opcode, the space a byte and no field holds a ","
+    size = len(payload)
+    if size < _V2_HEADER.size:
+        raise InvalidTransaction("Invalid payload serialization")
+    opcode, cell, boat_direction = payload[0], payload[1], payload[2]
+
+    action = V2_OPCODES.get(opcode)
+    if action is None:
+        raise InvalidTransaction('Invalid action: opcode {}'.format(opcode))
+
+    # The length prefixed fields are sliced and decoded one at a time: 2.0
+    # trades parse time, about twice the single split() of 1.0 for a
+    # create, for payload size
+    fields = ['', '', '', '']
+    index = 0
+    offset = _V2_HEADER.size
+    try:
+        while offset < size:
+            end = offset + 1 + payload[offset]
+            if end > size:
+                raise InvalidTransaction("Invalid payload serialization")
+            field = payload[offset + 1:end].decode()
+            # Game records are stored as "," and "|" separated text
+            if ',' in field or '|' in field:
+                raise InvalidTransaction('Fields cannot contain "," or "|"')
+            fields[index] = field
+            index += 1
+            offset = end
+    except (IndexError, UnicodeDecodeError) as e:
+        # More than four fields, or not UTF-8
+        raise InvalidTransaction("Invalid payload serialization") from e
+    name, currentplayer, player1, player2 = fields
+
+    if not name:
+        raise InvalidTransaction('Name is required')
+
+    space = ''
+    if action == 'shoot' or action == 'place':
+        # Covers NO_CELL too
+        if cell > 98:
+            raise InvalidTransaction(
+                "Space must be an integer from 1 to 100")
+        space = cell + 1
+    elif cell != NO_CELL:
+        space = cell + 1
+
+    boat = direction = ''
+    if boat_direction:
+        boat_index = (boat_direction >> 1) - 1
+        if not 0 <= boat_index < len(V2_BOATS):
+            raise InvalidTransaction(
+                'Invalid boat: {}'.format(boat_direction >> 1))
+        boat = V2_BOATS[boat_index]
+        direction = 'vertical' if boat_direction & 1 else 'horizontal'
+
+    return name, action, space, boat, direction, player1, player2, currentplayer
+
+
+# Payload decoders by family version
+DECODERS = {
+    '1.0': _decode_v1,
+    '2.0': _decode_v2,
+}
+
+
+class BattleshipPayload:
+
+    def __init__(self, payload, family_version='1.0'):
+        try:
+            decode = DECODERS[family_version]
+        except KeyError:
+            raise InvalidTransaction(
+                'Unsupported family version: {}'.format(family_version))
+
+        # The decoders validate the fields
+        name, action, space, boat, direction, player1, player2, currentplayer = decode(payload)
 
         self._name = name
         self._action = action
@@ -43,8 +148,8 @@ class BattleshipPayload:
         self._currentplayer = currentplayer
 
     @staticmethod
-    def from_bytes(payload):
-        return BattleshipPayload(payload=payload)
+    def from_bytes(payload, family_version='1.0'):
+        return BattleshipPayload(payload=payload, family_version=family_version)
 
     @property
     def name(self):
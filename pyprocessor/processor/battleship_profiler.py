@@ -0,0 +1,205 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Sampling profiler for the apply calls of a running transaction processor.
+
+One in every N calls runs under cProfile, and the statistics of the sampled
+calls accumulate in a single profile. The profile is written on demand, as a
+pstats file and as collapsed stacks for flame graphs, while the processor
+keeps running:
+
+    BATTLESHIP_PROFILE=100      sample one apply call in 100 from the start
+    BATTLESHIP_PROFILE_DIR=...  where the profiles go (default: the temp dir)
+    kill -USR2 <pid>            turn sampling on or off
+    kill -USR1 <pid>            write the profile collected so far
+'''
+
+import collections
+import cProfile
+import functools
+import itertools
+import logging
+import os
+import pstats
+import signal
+import tempfile
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+PROFILE_ENV = 'BATTLESHIP_PROFILE'
+PROFILE_DIR_ENV = 'BATTLESHIP_PROFILE_DIR'
+
+# Sampling rate used when sampling is turned on by signal
+DEFAULT_EVERY = 100
+
+DUMP_SIGNAL = getattr(signal, 'SIGUSR1', None)
+TOGGLE_SIGNAL = getattr(signal, 'SIGUSR2', None)
+
+
+class SamplingProfiler(object):
+    '''Profiles one in every calls of the functions it wraps.
+
+       Sampled calls that would overlap another one are not profiled, as a
+       cProfile profile follows one thread at a time.
+    '''
+
+    def __init__(self, every=0, output_dir=None, name='battleship-tp'):
+        self.every = every
+        self._default_every = every or DEFAULT_EVERY
+        self.output_dir = output_dir or tempfile.gettempdir()
+        self._name = name
+
+        self._calls = itertools.count()
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile()
+        self.sampled = 0
+
+    @classmethod
+    def from_environment(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        try:
+            every = int(environ.get(PROFILE_ENV) or 0)
+        except ValueError:
+            raise Exception('{} must be a number of calls, not {}'.format(
+                PROFILE_ENV, environ[PROFILE_ENV]))
+        return cls(every=max(every, 0), output_dir=environ.get(PROFILE_DIR_ENV))
+
+    @property
+    def enabled(self):
+        return self.every > 0
+
+    def toggle(self):
+        '''Turn sampling off, or back on at the last sampling rate.'''
+        if self.every:
+            self.every = 0
+        else:
+            self.every = self._default_every
+        LOGGER.warning('Profiling %s', 'on, one call in {}'.format(
+            self.every) if self.every else 'off')
+
+    def profiled(self, function):
+        '''Return function, sampled by the profiler.'''
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            every = self.every
+            if not every or next(self._calls) % every:
+                return function(*args, **kwargs)
+            if not self._lock.acquire(blocking=False):
+                return function(*args, **kwargs)
+            try:
+                self.sampled += 1
+                self._profile.enable()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self._profile.disable()
+            finally:
+                self._lock.release()
+        return wrapper
+
+    def dump(self, prefix=None):
+        '''Write the profile collected so far; return the paths of the
+           pstats and collapsed stack files, or None with no samples.
+        '''
+        with self._lock:
+            if not self.sampled:
+                LOGGER.warning('Nothing to dump, no call was profiled')
+                return None
+            stats = pstats.Stats(self._profile)
+            sampled = self.sampled
+
+        if prefix is None:
+            prefix = os.path.join(self.output_dir, '{}-{}-{}'.format(
+                self._name, os.getpid(), time.strftime('%Y%m%d-%H%M%S')))
+        os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+
+        stats.dump_stats(prefix + '.pstats')
+        with open(prefix + '.collapsed', 'w') as fd:
+            for stack, microseconds in sorted(collapse(stats.stats).items()):
+                fd.write('{} {}\n'.format(stack, microseconds))
+
+        LOGGER.warning('Wrote the profile of %s calls to %s.pstats and '
+                       '%s.collapsed', sampled, prefix, prefix)
+        return prefix + '.pstats', prefix + '.collapsed'
+
+    def install_signal_handlers(self):
+        '''Toggle sampling on TOGGLE_SIGNAL and dump on DUMP_SIGNAL.
+
+           Must be called from the main thread. The dump runs in a thread of
+           its own, since the signal may arrive in the middle of a sampled
+           call of the main thread.
+        '''
+        if DUMP_SIGNAL is None or TOGGLE_SIGNAL is None:
+            LOGGER.warning('No profiling signals on this platform')
+            return
+
+        def on_dump(signum, frame):
+            threading.Thread(target=self._dump_quietly, daemon=True).start()
+
+        def on_toggle(signum, frame):
+            self.toggle()
+
+        signal.signal(DUMP_SIGNAL, on_dump)
+        signal.signal(TOGGLE_SIGNAL, on_toggle)
+
+    def _dump_quietly(self):
+        try:
+            self.dump()
+        except Exception:
+            LOGGER.exception('Failed to dump the profile')
+
+
+def _frame_name(key):
+    filename, line, name = key
+    if filename == '~':
+        # Built-in functions
+        return name
+    return '{} ({}:{})'.format(name, os.path.basename(filename), line)
+
+
+def collapse(stats):
+    '''Turn pstats statistics into collapsed stacks, stack -> microseconds.
+
+       cProfile only records caller/callee pairs, not whole stacks, so the
+       time of a function called from several places is split between its
+       callers in proportion of the time each of them spent in it.
+    '''
+    callees = collections.defaultdict(dict)
+    for key, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][key] = edge[3]
+
+    stacks = collections.Counter()
+
+    def walk(key, path, on_path, total):
+        _, _, tt, ct, _ = stats[key]
+        scale = total / ct if ct else 0
+        path = path + [_frame_name(key)]
+        stacks[';'.join(path)] += tt * scale
+        on_path = on_path | {key}
+        for callee, edge_time in callees[key].items():
+            # Recursive calls are already counted in the outer frame
+            if callee not in on_path:
+                walk(callee, path, on_path, edge_time * scale)
+
+    for key, (_, _, _, ct, callers) in stats.items():
+        if not callers:
+            walk(key, [], frozenset(), ct)
+
+    return {
+        stack: int(round(seconds * 1e6))
+        for stack, seconds in stacks.items()
+        if seconds >= 0.5e-6
+    }
@@ -0,0 +1,294 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Replay of battleship transactions outside the chain.
+
+Reads transactions from batch files written by `battleship build`, from
+serialized BatchLists, or from JSONL files of payloads and signers, and
+executes them in order with BattleshipTransactionHandler against a
+MemoryState. Batches stay atomic, as on a validator. The digest of the final
+state and the time taken by each transaction are reported, so a run can be
+reproduced exactly and its costly transactions found.
+'''
+
+import argparse
+import base64
+import contextlib
+import csv
+import json
+import os
+import struct
+import sys
+import traceback
+
+import numpy as np
+
+from google.protobuf.message import DecodeError
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessRequest
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from processor.battleship_payload import BattleshipPayload
+from processor.battleship_tp import BattleshipTransactionHandler
+from processor.battleship_tp import FAMILY_NAME
+from processor.battleship_tp import bs_namespace
+from processor.memory_context import MemoryState
+from processor.memory_context import apply_requests
+from processor.memory_context import process_request
+
+# Batch files of `battleship build`: MAGIC, then BatchLists each preceded
+# by their 4 byte big endian length
+BATCH_FILE_MAGIC = b'BSBATCH1'
+_LENGTH = struct.Struct('>I')
+
+# Signer of the JSONL transactions that do not name one
+DEFAULT_SIGNER = '02' + '00' * 32
+
+PERCENTILES = (50, 95, 99)
+
+
+def _batch_file_lists(data, path):
+    offset = len(BATCH_FILE_MAGIC)
+    while offset < len(data):
+        if offset + _LENGTH.size > len(data):
+            raise Exception('Truncated batch file: {}'.format(path))
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        if offset + length > len(data):
+            raise Exception('Truncated batch file: {}'.format(path))
+        yield data[offset:offset + length]
+        offset += length
+
+
+def read_batches(path):
+    '''Yield the batches of a batch file or of a serialized BatchList, each
+       as a list of TpProcessRequests.
+    '''
+    with open(path, 'rb') as fd:
+        data = fd.read()
+
+    if data.startswith(BATCH_FILE_MAGIC):
+        lists = _batch_file_lists(data, path)
+    else:
+        lists = [data]
+
+    for serialized in lists:
+        batch_list = BatchList()
+        try:
+            batch_list.ParseFromString(serialized)
+        except DecodeError:
+            raise Exception('Not a batch file or BatchList: {}'.format(path))
+        for batch in batch_list.batches:
+            yield [process_request(txn) for txn in batch.transactions]
+
+
+def read_jsonl(path, file_index=0):
+    '''Yield the transactions of a JSONL file, one batch each.
+
+       Each line holds "payload", the payload as text, or "payload_b64",
+       and optionally "signer", a public key, and "family_version". The id
+       of a transaction is made of file_index, the position of the file in
+       the replay, and of its line number.
+    '''
+    with open(path) as fd:
+        for line_number, line in enumerate(fd, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if 'payload_b64' in entry:
+                    payload = base64.b64decode(entry['payload_b64'])
+                else:
+                    payload = entry['payload'].encode()
+            except (ValueError, KeyError) as err:
+                raise Exception('Line {} of {}: {}'.format(
+                    line_number, path, err))
+
+            header = TransactionHeader(
+                family_name=FAMILY_NAME,
+                family_version=entry.get('family_version', '1.0'),
+                inputs=[bs_namespace],
+                outputs=[bs_namespace],
+                signer_public_key=entry.get('signer', DEFAULT_SIGNER))
+            yield [TpProcessRequest(
+                header=header,
+                payload=payload,
+                signature='{:064x}{:064x}'.format(file_index, line_number))]
+
+
+def read_transactions(path, file_index=0):
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return read_jsonl(path, file_index)
+    return read_batches(path)
+
+
+def _action(request):
+    try:
+        return BattleshipPayload.from_bytes(
+            request.payload, request.header.family_version).action
+    except InvalidTransaction:
+        return 'unknown'
+
+
+class Replay(object):
+    '''Executes batches of TpProcessRequests against a MemoryState.'''
+
+    def __init__(self, auto_archive=False, state=None):
+        self.handler = BattleshipTransactionHandler(
+            bs_namespace, auto_archive=auto_archive)
+        self.state = MemoryState() if state is None else state
+
+        # (index, transaction id, action, status, seconds, error) of each
+        # transaction executed
+        self.timings = []
+
+    def apply_batch(self, requests):
+        '''Execute the transactions of one batch; its writes are kept only
+           if they are all valid. Returns True if they were.
+        '''
+        results = []
+
+        def timed(request, seconds, error):
+            results.append([
+                len(self.timings) + len(results), request.signature,
+                _action(request), 'ok' if error is None else 'invalid',
+                seconds, error])
+
+        error = apply_requests(
+            self.handler, self.state, requests, on_transaction=timed)
+
+        # The transactions after an invalid one are not executed
+        for request in requests[len(results):]:
+            results.append([
+                len(self.timings) + len(results), request.signature,
+                _action(request), 'skipped', 0.0, None])
+
+        self.timings.extend(results)
+        return error is None
+
+    def summary(self, slowest=10):
+        executed = [t for t in self.timings if t[3] != 'skipped']
+        by_action = {}
+        for timing in executed:
+            by_action.setdefault(timing[2], []).append(timing[4])
+
+        return {
+            'transactions': len(self.timings),
+            'valid': sum(1 for t in self.timings if t[3] == 'ok'),
+            'invalid': sum(1 for t in self.timings if t[3] == 'invalid'),
+            'skipped': sum(1 for t in self.timings if t[3] == 'skipped'),
+            'seconds': round(sum(t[4] for t in executed), 6),
+            'entries': len(self.state),
+            'digest': self.state.digest(),
+            'by_action': {
+                action: _timing_summary(seconds)
+                for action, seconds in sorted(by_action.items())
+            },
+            'slowest': [
+                {'index': t[0], 'id': t[1], 'action': t[2],
+                 'us': round(t[4] * 1e6, 1)}
+                for t in sorted(executed, key=lambda t: -t[4])[:slowest]
+            ],
+            'errors': [
+                {'index': t[0], 'id': t[1], 'error': t[5]}
+                for t in self.timings if t[3] == 'invalid'
+            ][:slowest],
+        }
+
+
+def _timing_summary(seconds):
+    us = np.array(seconds) * 1e6
+    summary = {
+        'count': len(us),
+        'mean_us': round(float(us.mean()), 1),
+        'max_us': round(float(us.max()), 1),
+    }
+    for percentile, value in zip(PERCENTILES, np.percentile(us, PERCENTILES)):
+        summary['p{}_us'.format(percentile)] = round(float(value), 1)
+    return summary
+
+
+def write_timings(timings, path):
+    '''Write the time of each transaction as CSV.'''
+    with open(path, 'w', newline='') as fd:
+        writer = csv.writer(fd)
+        writer.writerow(['index', 'id', 'action', 'status', 'us', 'error'])
+        for index, txn_id, action, status, seconds, error in timings:
+            writer.writerow([index, txn_id, action, status,
+                             round(seconds * 1e6, 1), error or ''])
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Executes battleship transactions outside the chain '
+        'and reports the digest of the resulting state and the time taken '
+        'by each transaction.')
+
+    parser.add_argument(
+        'files',
+        nargs='+',
+        help='batch files of battleship build, serialized BatchLists, or '
+        '.jsonl files of payloads, replayed in the order given')
+
+    parser.add_argument(
+        '--timings',
+        type=str,
+        help='write the time of each transaction to this CSV file')
+
+    parser.add_argument(
+        '--slowest',
+        type=int,
+        default=10,
+        help='number of slowest transactions listed in the summary')
+
+    parser.add_argument(
+        '--auto-archive',
+        action='store_true',
+        help='archive games on the winning shot, as the network does with '
+        'BATTLESHIP_AUTO_ARCHIVE=1')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    replay = Replay(auto_archive=args.auto_archive)
+
+    # The handler prints every hit and miss
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            for file_index, path in enumerate(args.files):
+                for requests in read_transactions(path, file_index):
+                    replay.apply_batch(requests)
+
+    if args.timings:
+        write_timings(replay.timings, args.timings)
+
+    print(json.dumps(replay.summary(slowest=args.slowest), indent=2))
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
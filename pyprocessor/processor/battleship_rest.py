@@ -0,0 +1,462 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Stand-in for the Sawtooth REST API, running the battleship handler
+in-process.
+
+Serves the parts of the REST API the battleship client uses: /batches,
+/batch_statuses, /state, /state/{address} and /blocks. Submitted batches are
+executed by BattleshipTransactionHandler against a MemoryState, either as
+soon as they arrive or in blocks published every block interval, so the
+client, the CLI and the load tools can run without a validator. Signatures
+are not checked.
+'''
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from google.protobuf.message import DecodeError
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+from processor.battleship_tp import BattleshipTransactionHandler
+from processor.battleship_tp import bs_namespace
+from processor.battleship_trace import Tracer
+from processor.memory_context import MemoryState
+from processor.memory_context import apply_batch
+from processor.memory_context import process_request
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BIND = '127.0.0.1:8008'
+
+# Default and largest page of a state listing, as in the REST API
+DEFAULT_PAGE_SIZE = 1000
+
+# Longest batch status wait, in seconds
+MAX_WAIT = 300
+
+# Returned by Ledger._execute for a batch that has to wait for its
+# dependencies
+_DEFERRED = object()
+
+
+class Ledger(object):
+    '''The state, chain head and batch statuses behind the stand-in.
+
+       Batches wait in a queue until the next block is published; with no
+       block interval, a block is published for every submission.
+    '''
+
+    def __init__(self, handler, block_interval=0):
+        self._handler = handler
+        self._block_interval = block_interval
+        self.state = MemoryState()
+
+        self._cond = threading.Condition()
+        self._queue = []
+
+        # batch id -> (status, invalid transactions)
+        self._statuses = {}
+        self._committed_txns = set()
+        self._invalid_txns = set()
+
+        self.block_num = 0
+        self.head = '0' * 128
+
+        self._stop = threading.Event()
+        if block_interval:
+            threading.Thread(target=self._publish_loop, daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+
+    def submit(self, batches):
+        with self._cond:
+            for batch in batches:
+                if batch.header_signature not in self._statuses:
+                    self._statuses[batch.header_signature] = ('PENDING', [])
+                    self._queue.append(batch)
+
+        if not self._block_interval:
+            self.publish()
+
+    def _publish_loop(self):
+        while not self._stop.wait(self._block_interval):
+            self.publish()
+
+    def publish(self):
+        '''Execute the queued batches and commit the valid ones in a block.
+
+           As on a validator, a batch depending on transactions not yet
+           committed stays queued until they are, and is invalid once one
+           of them is.
+        '''
+        with self._cond:
+            batches, self._queue = self._queue, []
+
+            committed = []
+            while batches:
+                deferred = []
+                for batch in batches:
+                    invalid = self._execute(batch)
+                    if invalid is _DEFERRED:
+                        deferred.append(batch)
+                    elif invalid is None:
+                        committed.append(batch.header_signature)
+                        self._committed_txns.update(
+                            txn.header_signature for txn in batch.transactions)
+                        self._statuses[batch.header_signature] = (
+                            'COMMITTED', [])
+                    else:
+                        self._invalid_txns.update(
+                            txn.header_signature for txn in batch.transactions)
+                        self._statuses[batch.header_signature] = (
+                            'INVALID', [invalid])
+
+                # Batches arriving before their dependencies in the same
+                # block get another pass once those are executed
+                if len(deferred) == len(batches):
+                    break
+                batches = deferred
+
+            self._queue = batches + self._queue
+
+            if committed:
+                self.block_num += 1
+                self.head = hashlib.sha512(
+                    ''.join([self.head] + committed).encode()).hexdigest()
+
+            self._cond.notify_all()
+
+    def _execute(self, batch):
+        '''Apply batch; return None, _DEFERRED while it depends on
+           transactions not yet committed, or the invalid transaction entry.
+        '''
+        seen = set()
+        for txn in batch.transactions:
+            header = process_request(txn).header
+            missing = [
+                dependency for dependency in header.dependencies
+                if dependency not in self._committed_txns and
+                dependency not in seen
+            ]
+            invalid = [
+                dependency for dependency in missing
+                if dependency in self._invalid_txns
+            ]
+            if invalid:
+                return {
+                    'id': txn.header_signature,
+                    'message': 'Dependency {} is invalid'.format(invalid[0]),
+                }
+            if missing:
+                return _DEFERRED
+            seen.add(txn.header_signature)
+
+        try:
+            error = apply_batch(self._handler, self.state, batch)
+        except Exception as err:
+            LOGGER.exception('Batch %s failed', batch.header_signature)
+            error = (batch.transactions[0].header_signature,
+                     'Internal error: {}'.format(err))
+
+        if error is None:
+            return None
+        return {'id': error[0], 'message': error[1]}
+
+    def statuses(self, batch_ids, wait=0):
+        '''Return the REST API status entries of batch_ids, waiting up to
+           wait seconds for the pending ones.
+        '''
+        with self._cond:
+            if wait:
+                self._cond.wait_for(
+                    lambda: all(
+                        self._statuses.get(batch_id, ('UNKNOWN',))[0] !=
+                        'PENDING' for batch_id in batch_ids),
+                    timeout=min(wait, MAX_WAIT))
+
+            entries = []
+            for batch_id in batch_ids:
+                status, invalid = self._statuses.get(
+                    batch_id, ('UNKNOWN', []))
+                entries.append({
+                    'id': batch_id,
+                    'status': status,
+                    'invalid_transactions': [
+                        dict(entry, extended_data='') for entry in invalid],
+                })
+            return entries
+
+
+def _query(url):
+    return {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, as clients reuse their connections
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately: with Nagle's algorithm, the
+    # body would wait for the client's delayed ACK of the headers, 40 ms
+    disable_nagle_algorithm = True
+
+    @property
+    def ledger(self):
+        return self.server.ledger
+
+    def log_message(self, fmt, *args):
+        LOGGER.debug(fmt, *args)
+
+    def _send_json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, code, title, message):
+        self._send_json(code, {'error': {
+            'code': code, 'title': title, 'message': message}})
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def _link(self, path):
+        return 'http://{}{}'.format(self.headers.get('Host', ''), path)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = _query(url)
+
+        if url.path == '/batch_statuses':
+            if not query.get('id'):
+                self._send_error(400, 'Missing Id', 'id is required')
+                return
+            self._statuses(query['id'].split(','), query)
+        elif url.path == '/state':
+            self._list_state(query)
+        elif url.path.startswith('/state/'):
+            self._get_state(url.path[len('/state/'):])
+        elif url.path == '/blocks':
+            self._send_json(200, {
+                'head': self.ledger.head,
+                'data': [{
+                    'header_signature': self.ledger.head,
+                    'header': {'block_num': str(self.ledger.block_num)},
+                }],
+                'link': self._link(self.path),
+            })
+        else:
+            self._send_error(404, 'Not Found', url.path)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = _query(url)
+        body = self._read_body()
+
+        if url.path == '/batches':
+            self._submit(body)
+        elif url.path == '/batch_statuses':
+            try:
+                batch_ids = json.loads(body.decode())
+            except ValueError:
+                self._send_error(400, 'Bad Request', 'expected a JSON list')
+                return
+            self._statuses(batch_ids, query)
+        else:
+            self._send_error(404, 'Not Found', url.path)
+
+    def _submit(self, body):
+        batch_list = BatchList()
+        try:
+            batch_list.ParseFromString(body)
+        except DecodeError:
+            self._send_error(
+                400, 'Submitted Batches Invalid', 'cannot parse BatchList')
+            return
+        if not batch_list.batches:
+            self._send_error(400, 'No Batches Submitted', 'empty BatchList')
+            return
+
+        self.ledger.submit(batch_list.batches)
+        self._send_json(202, {'link': self._link(
+            '/batch_statuses?id={}'.format(','.join(
+                batch.header_signature for batch in batch_list.batches)))})
+
+    def _statuses(self, batch_ids, query):
+        try:
+            wait = int(query.get('wait') or 0)
+        except ValueError:
+            wait = MAX_WAIT
+        self._send_json(200, {
+            'data': self.ledger.statuses(batch_ids, wait=wait),
+            'link': self._link(self.path),
+        })
+
+    def _get_state(self, address):
+        data = self.ledger.state.get(address)
+        if data is None:
+            self._send_error(404, 'State Not Found', address)
+            return
+        self._send_json(200, {
+            'data': base64.b64encode(data).decode(),
+            'head': self.ledger.head,
+            'link': self._link(self.path),
+        })
+
+    def _list_state(self, query):
+        prefix = query.get('address', '')
+        limit = min(int(query.get('limit') or DEFAULT_PAGE_SIZE),
+                    DEFAULT_PAGE_SIZE)
+
+        # One more entry tells where the next page starts
+        entries = self.ledger.state.list(
+            prefix, start=query.get('start'), limit=limit + 1)
+
+        paging = {'limit': limit}
+        if len(entries) > limit:
+            paging['next_position'] = entries[limit][0]
+            entries = entries[:limit]
+
+        self._send_json(200, {
+            'data': [
+                {'address': address,
+                 'data': base64.b64encode(data).decode()}
+                for address, data in entries
+            ],
+            'head': self.ledger.head,
+            'paging': paging,
+            'link': self._link(self.path),
+        })
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RestStandIn(object):
+    '''A REST API stand-in serving a Ledger on bind, host:port.
+
+       Use port 0 to pick a free port; url gives the address to connect to.
+    '''
+
+    def __init__(self, bind=DEFAULT_BIND, block_interval=0,
+                 auto_archive=False):
+        host, port = bind.rsplit(':', 1)
+        handler = BattleshipTransactionHandler(
+            bs_namespace, auto_archive=auto_archive)
+        # Traced like the processor with BATTLESHIP_TRACE set
+        handler.apply = Tracer.from_environment(
+            process_name='battleship-rest').traced(handler.apply)
+        self.ledger = Ledger(handler, block_interval=block_interval)
+        self._server = _Server((host, int(port)), _RequestHandler)
+        self._server.ledger = self.ledger
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        '''Serve in a background thread.'''
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.ledger.close()
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Serves a local stand-in for the REST API of a '
+        'battleship network, executing the transactions in-process against '
+        'in-memory state.')
+
+    parser.add_argument(
+        '--bind',
+        type=str,
+        default=DEFAULT_BIND,
+        help='host:port to listen on')
+
+    parser.add_argument(
+        '--block-interval',
+        type=float,
+        default=0,
+        help='time, in seconds, between two blocks (default: commit each '
+        'submission at once)')
+
+    parser.add_argument(
+        '--auto-archive',
+        action='store_true',
+        help='archive games on the winning shot, like '
+        'BATTLESHIP_AUTO_ARCHIVE=1')
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='log every request and the messages of the handler')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    logging.basicConfig()
+    logging.getLogger().setLevel(
+        logging.DEBUG if args.verbose else logging.INFO)
+
+    stand_in = RestStandIn(
+        bind=args.bind,
+        block_interval=args.block_interval,
+        auto_archive=args.auto_archive)
+    LOGGER.info('Serving the REST API stand-in on %s', stand_in.url)
+    stand_in.serve_forever()
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,376 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Offline Monte Carlo simulator of battleship games.
+
+Plays many games at once with NumPy: the boards of a chunk of games are one
+(games, 2, 100) array, and every placement and shot is applied to all the
+games of the chunk in a single vectorized operation. Sampled games are then
+replayed through the rule functions of the transaction handler (_place,
+_update_board and _update_game_state), which must reach the same boards,
+boat counts and states.
+
+The simulated games can also be written as `battleship build`/`run` scripts,
+to load the network with realistic games.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from processor.battleship_tp import BOAT_CASES
+from processor.battleship_tp import ID_BOAT
+from processor.battleship_tp import _game_boat_data_to_list
+from processor.battleship_tp import _place
+from processor.battleship_tp import _update_board
+from processor.battleship_tp import _update_game_state
+
+# Square values of the simulated boards; boat i of ID_BOAT is BOAT + i
+EMPTY = 0
+MISS = 1
+HIT = 2
+BOAT = 3
+
+HORIZONTAL = 0
+VERTICAL = 1
+DIRECTIONS = ['horizontal', 'vertical']
+
+ROWS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
+
+# The payload only accepts spaces 1 to 99, so by default the last square is
+# never used: a boat on it could not be sunk through the chain
+PLAYABLE_SQUARES = 99
+
+DEFAULT_CHUNK = 100000
+
+
+def _candidates(length, squares):
+    '''Every position of a boat of length within the first squares.
+
+       Returns the start indexes, the directions and the (n, length) array
+       of the squares each position covers.
+    '''
+    starts, directions, cells = [], [], []
+    for start in range(100):
+        row, col = divmod(start, 10)
+        if col + length <= 10:
+            starts.append(start)
+            directions.append(HORIZONTAL)
+            cells.append([start + k for k in range(length)])
+        if row + length <= 10:
+            starts.append(start)
+            directions.append(VERTICAL)
+            cells.append([start + 10 * k for k in range(length)])
+
+    cells = np.array(cells)
+    keep = (cells < squares).all(axis=1)
+    return (np.array(starts)[keep], np.array(directions)[keep], cells[keep])
+
+
+class SimulationResult(object):
+    '''The games of one simulated chunk.
+
+       placements: (games, 2, 5, 2) start index and direction of each boat,
+           for each player, in the order of ID_BOAT.
+       shots: (games, 2, squares) order in which each player fires.
+       shots_fired: (games, 2) number of shots each player fired.
+       winner: (games,) 0 if player 1 won, 1 if player 2 won.
+       boards: (games, 2, 100) final boards.
+       remaining: (games, 2, 5) squares left afloat of each boat.
+    '''
+
+    def __init__(self, placements, shots, shots_fired, winner, boards,
+                 remaining):
+        self.placements = placements
+        self.shots = shots
+        self.shots_fired = shots_fired
+        self.winner = winner
+        self.boards = boards
+        self.remaining = remaining
+
+    def __len__(self):
+        return len(self.winner)
+
+    @property
+    def moves(self):
+        return self.shots_fired.sum(axis=1)
+
+
+def simulate(games, rng, squares=PLAYABLE_SQUARES):
+    '''Play games random games, using the first squares of the boards.
+
+       Both players place their fleet uniformly at random and fire at
+       random squares they have not fired at yet.
+    '''
+    index = np.arange(games)
+    boards = np.zeros((games, 2, 100), dtype=np.uint8)
+    placements = np.zeros((games, 2, len(ID_BOAT), 2), dtype=np.int16)
+
+    # Longest boats first, so free room is left for the short ones
+    for player in range(2):
+        for boat in np.argsort(BOAT_CASES[player])[::-1]:
+            starts, directions, cells = _candidates(
+                BOAT_CASES[player][boat], squares)
+
+            # (games, candidates): positions not overlapping a placed boat
+            free = (boards[:, player][:, cells] == EMPTY).all(axis=2)
+            choice = np.argmax(
+                rng.random(free.shape) * free, axis=1)
+
+            chosen = cells[choice]
+            boards[index[:, None], player, chosen] = BOAT + boat
+            placements[:, player, boat, 0] = starts[choice]
+            placements[:, player, boat, 1] = directions[choice]
+
+    # Shots do not depend on earlier results, so the whole game follows
+    # from the squares each player's shots land on, in firing order
+    shots = np.argsort(rng.random((games, 2, squares)), axis=2)
+    landed = np.stack([
+        boards[index[:, None], 1 - player, shots[:, player]]
+        for player in range(2)
+    ], axis=1)
+
+    # Turn at which each player sinks the last enemy boat; player 1 fires
+    # first in every turn, so wins ties
+    fleet = sum(BOAT_CASES[0])
+    hits = np.cumsum(landed >= BOAT, axis=2, dtype=np.int16)
+    last_hit = np.argmax(hits == fleet, axis=2)
+    winner = (last_hit[:, 1] < last_hit[:, 0]).astype(np.int8)
+
+    shots_fired = np.empty((games, 2), dtype=np.int16)
+    end_turn = np.where(winner == 0, last_hit[:, 0], last_hit[:, 1])
+    shots_fired[:, 0] = end_turn + 1
+    shots_fired[:, 1] = end_turn + winner
+
+    remaining = np.empty((games, 2, len(ID_BOAT)), dtype=np.int16)
+    for player in range(2):
+        fired = np.arange(squares)[None] < shots_fired[:, player, None]
+        enemy = 1 - player
+
+        for boat in range(len(ID_BOAT)):
+            remaining[:, enemy, boat] = BOAT_CASES[enemy][boat] - \
+                ((landed[:, player] == BOAT + boat) & fired).sum(axis=1)
+
+        marks = np.where(landed[:, player] >= BOAT, HIT, MISS)
+        rows, turns = np.nonzero(fired)
+        boards[rows, enemy, shots[rows, player, turns]] = marks[rows, turns]
+
+    return SimulationResult(
+        placements, shots, shots_fired, winner, boards, remaining)
+
+
+def _board_str(board):
+    marks = ['-', 'X', 'O'] + ID_BOAT
+    return ''.join(marks[square] for square in board)
+
+
+def game_moves(result, game):
+    '''Yield the moves of a simulated game as (player, action, fields).
+
+       player is 0 or 1, and fields the payload fields of the move.
+    '''
+    for player in range(2):
+        for boat, boat_id in enumerate(ID_BOAT):
+            start, direction = result.placements[game, player, boat]
+            yield player, 'place', {
+                'space': int(start) + 1,
+                'boat': boat_id,
+                'direction': DIRECTIONS[direction],
+            }
+
+    fired = result.shots_fired[game]
+    for turn in range(int(fired.max())):
+        for player in range(2):
+            if turn < fired[player]:
+                yield player, 'shoot', {
+                    'space': int(result.shots[game, player, turn]) + 1,
+                }
+
+
+def cross_check(result, game):
+    '''Replay a simulated game through the rules of the handler.
+
+       Raises AssertionError where the rules and the simulation disagree.
+    '''
+    boards = ['-' * 100, '-' * 100]
+    to_place = _game_boat_data_to_list('1' * 2 * len(ID_BOAT))
+    boat_cases = [list(cases) for cases in BOAT_CASES]
+    state = 'PLACE'
+
+    # The rule functions print each hit and miss
+    with contextlib.redirect_stdout(io.StringIO()):
+        for player, action, fields in game_moves(result, game):
+            if action == 'place':
+                assert state == 'PLACE', state
+                boards[player], to_place = _place(
+                    boards[player], to_place, fields['space'],
+                    fields['boat'], fields['direction'], player)
+                state = _update_game_state(state, to_place, boat_cases)
+            else:
+                assert state == ('P1-NEXT', 'P2-NEXT')[player], state
+                enemy = 1 - player
+                boards[enemy], boat_cases = _update_board(
+                    boards[enemy], boat_cases, fields['space'], state)
+                state = _update_game_state(state, to_place, boat_cases)
+
+    expected_state = ('P1-WIN', 'P2-WIN')[result.winner[game]]
+    assert state == expected_state, (state, expected_state)
+    for player in range(2):
+        assert boards[player] == _board_str(result.boards[game, player]), \
+            'board of player {} differs'.format(player + 1)
+    assert boat_cases == result.remaining[game].tolist(), boat_cases
+
+
+def write_script(result, out, prefix, player1, player2, first=0):
+    '''Write the games of result as a `battleship build`/`run` script.'''
+    players = (player1, player2)
+    for game in range(len(result)):
+        name = '{}{}'.format(prefix, first + game)
+        out.write('{} create {} {} {}\n'.format(
+            player1, name, player1, player2))
+        for player, action, fields in game_moves(result, game):
+            row, col = divmod(fields['space'] - 1, 10)
+            if action == 'place':
+                out.write('{} place {} {} {} {} {}\n'.format(
+                    players[player], name, ROWS[row], col + 1,
+                    fields['boat'], fields['direction']))
+            else:
+                out.write('{} shoot {} {} {}\n'.format(
+                    players[player], name, ROWS[row], col + 1))
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Simulates random battleship games offline and checks '
+        'a sample of them against the rules of the transaction processor.')
+
+    parser.add_argument(
+        '--games',
+        type=int,
+        default=100000,
+        help='number of games to simulate')
+
+    parser.add_argument(
+        '--chunk',
+        type=int,
+        default=DEFAULT_CHUNK,
+        help='number of games simulated together')
+
+    parser.add_argument(
+        '--check',
+        type=int,
+        default=100,
+        help='number of games replayed through the rules of the processor')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed of the random generator, for reproducible runs')
+
+    parser.add_argument(
+        '--all-squares',
+        action='store_true',
+        help='also use square 100, which the payload does not accept')
+
+    parser.add_argument(
+        '--script',
+        type=str,
+        help='write the games to this file as a battleship build/run script')
+
+    parser.add_argument(
+        '--players',
+        type=str,
+        default='jack,jill',
+        help='the two key names playing the games of the script')
+
+    parser.add_argument(
+        '--prefix',
+        type=str,
+        default='sim',
+        help='prefix of the game names of the script')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    rng = np.random.default_rng(args.seed)
+    squares = 100 if args.all_squares else PLAYABLE_SQUARES
+    player1, player2 = args.players.split(',')
+
+    script = open(args.script, 'w') if args.script else None
+
+    wins = np.zeros(2, dtype=np.int64)
+    lengths = np.zeros(2 * squares + 1, dtype=np.int64)
+    checked = 0
+    elapsed = 0.0
+
+    try:
+        for first in range(0, args.games, args.chunk):
+            count = min(args.chunk, args.games - first)
+
+            start = time.time()
+            result = simulate(count, rng, squares=squares)
+            elapsed += time.time() - start
+
+            wins += np.bincount(result.winner, minlength=2)
+            lengths += np.bincount(result.moves, minlength=len(lengths))
+
+            # Spread the checks over the chunks
+            to_check = min(count, args.check - checked,
+                           -(-args.check * count // args.games))
+            for game in rng.choice(count, max(to_check, 0), replace=False):
+                cross_check(result, game)
+                checked += 1
+
+            if script is not None:
+                write_script(result, script, args.prefix, player1, player2,
+                             first=first)
+    finally:
+        if script is not None:
+            script.close()
+
+    moves = np.arange(len(lengths))
+    print(json.dumps({
+        'games': args.games,
+        'games_per_second': round(args.games / elapsed) if elapsed else None,
+        'player1_wins': int(wins[0]),
+        'player2_wins': int(wins[1]),
+        'mean_moves': float((lengths * moves).sum() / lengths.sum()),
+        'min_moves': int(moves[lengths > 0].min()),
+        'max_moves': int(moves[lengths > 0].max()),
+        'checked': checked,
+    }, indent=2))
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -6,9 +6,49 @@ from sawtooth_sdk.processor.exceptions import InternalError
 BATTLESHIP_NAMESPACE = hashlib.sha512('battleship'.encode("utf-8")).hexdigest()[0:6]
 
 
-def _make_battleship_address(name):
-    return BATTLESHIP_NAMESPACE + \
-        hashlib.sha512(name.encode('utf-8')).hexdigest()[:64]
+# Addresses are laid out as namespace + partition + hash of the key, so
+# that the games of one lifecycle stage can be read with a prefix query.
+PARTITION_PLACING = '00'
+PARTITION_IN_PLAY = '01'
+PARTITION_FINISHED = '02'
+PARTITION_RESULTS = '03'
+PARTITION_PLAYERS = '10'
+
+GAME_PARTITIONS = (PARTITION_PLACING, PARTITION_IN_PLAY, PARTITION_FINISHED)
+
+
+def _partition_for_state(state):
+    if state == 'PLACE':
+        return PARTITION_PLACING
+    if state in ('P1-WIN', 'P2-WIN'):
+        return PARTITION_FINISHED
+    return PARTITION_IN_PLAY
+
+
+def _make_battleship_address(name, partition):
+    return BATTLESHIP_NAMESPACE + partition + \
+        hashlib.sha512(name.encode('utf-8')).hexdigest()[:62]
+
+
+def _make_game_addresses(name):
+    return [_make_battleship_address(name, partition)
+            for partition in GAME_PARTITIONS]
+
+
+def _make_result_address(name):
+    return _make_battleship_address(name, PARTITION_RESULTS)
+
+
+def _make_player_index_prefix(player):
+    return BATTLESHIP_NAMESPACE + PARTITION_PLAYERS + \
+        hashlib.sha512(player.encode('utf-8')).hexdigest()[:30]
+
+
+# Each game of a player has an index entry of its own, under the prefix of
+# the player, so that games sharing a player never write the same address.
+def _make_player_game_address(player, game_name):
+    return _make_player_index_prefix(player) + \
+        hashlib.sha512(game_name.encode('utf-8')).hexdigest()[:32]
 
 
 class Game:
@@ -23,6 +63,16 @@ class Game:
         self.to_place = to_place
         
 
+class Result:
+    def __init__(self, name, player1, player2, winner, moves, hits_hash):
+        self.name = name
+        self.player1 = player1
+        self.player2 = player2
+        self.winner = winner
+        self.moves = moves
+        self.hits_hash = hits_hash
+
+
 class BattleshipState:
 
     TIMEOUT = 3
@@ -48,27 +98,34 @@ class BattleshipState:
             KeyError: The Game with game_name does not exist.
         """
 
-        games = self._load_games(game_name=game_name)
-        
-        del games[game_name]
-        if games:
-            self._store_game(game_name, games=games)
-        else:
-            self._delete_game(game_name)
+        partition = self._find_partition(game_name)
+        if partition is None:
+            raise KeyError(game_name)
+
+        self._remove_game(game_name, partition)
 
     def set_game(self, game_name, game):
         """Store the game in the validator state.
 
+        The game is kept in the partition matching its state, so a state
+        transition may move it to a new address.
+
         Args:
             game_name (str): The name.
             game (Game): The information specifying the current game.
         """
 
-        games = self._load_games(game_name=game_name)
+        partition = _partition_for_state(game.state)
+
+        current = self._find_partition(game_name)
+        if current is not None and current != partition:
+            self._remove_game(game_name, current)
+
+        games = self._load_games(game_name, partition)
 
         games[game_name] = game
 
-        self._store_game(game_name, games=games)
+        self._store_game(game_name, partition, games=games)
 
     def get_game(self, game_name):
         """Get the game associated with game_name.
@@ -79,53 +136,151 @@ class BattleshipState:
         Returns:
             (Game): All the information specifying a game.
         """
-        
-        return self._load_games(game_name=game_name).get(game_name)
 
-    def _store_game(self, game_name, games):
-        address = _make_battleship_address(game_name)
+        partition = self._find_partition(game_name)
+        if partition is None:
+            return None
+
+        return self._load_games(game_name, partition).get(game_name)
 
-        state_data = self._serialize(games)
+    def get_result(self, game_name):
+        """Get the archived result of the game named game_name.
+
+        Args:
+            game_name (str): The name.
 
+        Returns:
+            (Result): The result, or None if the game was not archived.
+        """
+
+        data = self._read(_make_result_address(game_name))
+        if not data:
+            return None
+
+        return self._deserialize_results(data).get(game_name)
+
+    def set_result(self, game_name, result):
+        """Store the archived result of the game named game_name.
+
+        Args:
+            game_name (str): The name.
+            result (Result): The compact record of the finished game.
+        """
+
+        address = _make_result_address(game_name)
+
+        data = self._read(address)
+        results = self._deserialize_results(data) if data else {}
+
+        results[game_name] = result
+
+        self._write(address, self._serialize_results(results))
+
+    def add_player_game(self, player, game_name):
+        """Record game_name in the index of player.
+
+        Args:
+            player (str): The player, as stored in Game.player1/player2.
+            game_name (str): The name.
+        """
+
+        address = _make_player_game_address(player, game_name)
+
+        names = self._load_player_games(address)
+        if game_name in names:
+            return
+
+        names.add(game_name)
+        self._write(address, self._serialize_index(names))
+
+    def delete_player_game(self, player, game_name):
+        """Remove game_name from the index of player.
+
+        Args:
+            player (str): The player.
+            game_name (str): The name.
+        """
+
+        address = _make_player_game_address(player, game_name)
+
+        names = self._load_player_games(address)
+        if game_name not in names:
+            return
+
+        names.remove(game_name)
+        if names:
+            self._write(address, self._serialize_index(names))
+        else:
+            self._delete(address)
+
+    def _read(self, address):
+        if address not in self._address_cache:
+            self._prefetch([address])
+
+        return self._address_cache[address]
+
+    def _prefetch(self, addresses):
+        """Read the uncached addresses among addresses in one request."""
+
+        missing = [a for a in addresses if a not in self._address_cache]
+        if not missing:
+            return
+
+        state_entries = self._context.get_state(
+            missing,
+            timeout=self.TIMEOUT)
+
+        for address in missing:
+            self._address_cache[address] = None
+        for entry in state_entries:
+            self._address_cache[entry.address] = entry.data
+
+    def _write(self, address, state_data):
         self._address_cache[address] = state_data
 
         self._context.set_state(
             {address: state_data},
             timeout=self.TIMEOUT)
 
-    def _delete_game(self, game_name):
-        address = _make_battleship_address(game_name)
-
+    def _delete(self, address):
         self._context.delete_state(
             [address],
             timeout=self.TIMEOUT)
 
         self._address_cache[address] = None
 
-    def _load_games(self, game_name):
-        address = _make_battleship_address(game_name)
+    def _find_partition(self, game_name):
+        """Return the partition holding game_name, or None."""
 
-        if address in self._address_cache:
-            if self._address_cache[address]:
-                serialized_games = self._address_cache[address]
-                games = self._deserialize(serialized_games)
-            else:
-                games = {}
-        else:
-            state_entries = self._context.get_state(
-                [address],
-                timeout=self.TIMEOUT)
-            if state_entries:
+        self._prefetch(_make_game_addresses(game_name))
 
-                self._address_cache[address] = state_entries[0].data
+        for partition in GAME_PARTITIONS:
+            if game_name in self._load_games(game_name, partition):
+                return partition
 
-                games = self._deserialize(data=state_entries[0].data)
+        return None
 
-            else:
-                self._address_cache[address] = None
-                games = {}
+    def _remove_game(self, game_name, partition):
+        games = self._load_games(game_name, partition)
 
-        return games
+        del games[game_name]
+
+        self._store_game(game_name, partition, games=games)
+
+    def _store_game(self, game_name, partition, games):
+        address = _make_battleship_address(game_name, partition)
+
+        if games:
+            self._write(address, self._serialize(games))
+        else:
+            self._delete(address)
+
+    def _load_games(self, game_name, partition):
+        data = self._read(_make_battleship_address(game_name, partition))
+        if not data:
+            return {}
+
+        return self._deserialize(data=data)
 
     def _deserialize(self, data):
         """Take bytes stored in state and deserialize them into Python
@@ -149,6 +304,80 @@ class BattleshipState:
 
         return games
 
+    def _deserialize_results(self, data):
+        """Take the bytes of a result entry and deserialize them.
+
+        Args:
+            data (bytes): The UTF-8 encoded string stored in state.
+
+        Returns:
+            (dict): game name (str) keys, Result values.
+        """
+
+        results = {}
+        try:
+            for result in data.decode().split("|"):
+                name, player1, player2, winner, moves, hits_hash = result.split(",")
+
+                results[name] = Result(name, player1, player2, winner, int(moves), hits_hash)
+        except ValueError as e:
+            raise InternalError("Failed to deserialize result data") from e
+
+        return results
+
+    def _serialize_results(self, results):
+        """Takes a dict of results and serializes them into bytes.
+
+        Args:
+            results (dict): game name (str) keys, Result values.
+
+        Returns:
+            (bytes): The UTF-8 encoded string stored in state.
+        """
+
+        result_strs = []
+        for name, r in results.items():
+            result_strs.append(",".join(
+                [name, r.player1, r.player2, r.winner, str(r.moves), r.hits_hash]))
+
+        return "|".join(sorted(result_strs)).encode()
+
+    def _load_player_games(self, address):
+        data = self._read(address)
+        if not data:
+            return set()
+
+        return self._deserialize_index(data)
+
+    def _deserialize_index(self, data):
+        """Take the bytes of a player index entry and deserialize them.
+
+        Args:
+            data (bytes): The UTF-8 encoded string stored in state.
+
+        Returns:
+            (set): The names of the games stored at the entry, more than
+                one only when their addresses collide.
+        """
+
+        try:
+            return set(data.decode().split("|"))
+        except ValueError as e:
+            raise InternalError("Failed to deserialize player index") from e
+
+    def _serialize_index(self, names):
+        """Takes the game names of a player index entry and serializes them
+        into bytes.
+
+        Args:
+            names (set): The names of the games.
+
+        Returns:
+            (bytes): The UTF-8 encoded string stored in state.
+        """
+
+        return "|".join(sorted(names)).encode()
+
     def _serialize(self, games):
         """Takes a dict of game objects and serializes them into bytes.
 
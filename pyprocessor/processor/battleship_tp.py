@@ -15,8 +15,10 @@ Transaction family class for battleship.
 '''
 
 from re import M
+import argparse
 import traceback
 import sys
+import os
 import hashlib
 import logging
 
@@ -26,7 +28,9 @@ from sawtooth_sdk.processor.exceptions import InternalError
 from sawtooth_sdk.processor.core import TransactionProcessor
 
 from processor.battleship_payload import BattleshipPayload
-from processor.battleship_state import Game, BattleshipState
+from processor.battleship_profiler import SamplingProfiler
+from processor.battleship_trace import Tracer
+from processor.battleship_state import Game, Result, BattleshipState
 
 LOGGER = logging.getLogger(__name__)
 ID_BOAT = ['L', 'M', 'N', 'Q', 'P'] # Name IDs of ID_BOAT, can be found in CLI as well 
@@ -34,6 +38,8 @@ BOAT_CASES = [[5, 4, 3, 3, 2],[5, 4, 3, 3, 2]] # Initial number of cases for boa
 
 FAMILY_NAME = "battleship"
 
+DEFAULT_URL = 'tcp://validator:4004'
+
 def _hash(data):
     '''Compute the SHA-512 hash and return the result as hex characters.'''
     return hashlib.sha512(data).hexdigest()
@@ -49,8 +55,11 @@ class BattleshipTransactionHandler(TransactionHandler):
     It implements functions to deposit, withdraw, and transfer money.
     '''
 
-    def __init__(self, namespace_prefix):
+    def __init__(self, namespace_prefix, auto_archive=False):
         self._namespace_prefix = namespace_prefix
+        # Every processor of a network must share this setting, otherwise
+        # validators would disagree on the outcome of a winning shot.
+        self._auto_archive = auto_archive
 
     @property
     def family_name(self):
@@ -58,7 +67,7 @@ class BattleshipTransactionHandler(TransactionHandler):
 
     @property
     def family_versions(self):
-        return ['1.0']
+        return ['1.0', '2.0']
 
     @property
     def namespaces(self):
@@ -77,7 +86,9 @@ class BattleshipTransactionHandler(TransactionHandler):
         # Get the public key sent from the client.
         signer = header.signer_public_key
         
-        battleship_payload = BattleshipPayload.from_bytes(transaction.payload)
+        # 1.0 payloads are CSV, 2.0 payloads binary
+        battleship_payload = BattleshipPayload.from_bytes(
+            transaction.payload, header.family_version)
         
         battleship_state = BattleshipState(context)
 
@@ -91,6 +102,9 @@ class BattleshipTransactionHandler(TransactionHandler):
 
             battleship_state.delete_game(battleship_payload.name)
 
+            for player in _game_players(game):
+                battleship_state.delete_player_game(player, game.name)
+
         elif battleship_payload.action == 'create':
             if battleship_payload.player1 == None or battleship_payload.player2 == None: 
                 raise InvalidTransaction(
@@ -101,6 +115,11 @@ class BattleshipTransactionHandler(TransactionHandler):
                     'Invalid action: Game already exists: {}'.format(
                         battleship_payload.name))
 
+            if battleship_state.get_result(battleship_payload.name) is not None:
+                raise InvalidTransaction(
+                    'Invalid action: Game already archived: {}'.format(
+                        battleship_payload.name))
+
             game = Game(name=battleship_payload.name,
                         board_P1="-" * 100,
                         board_P2="-" * 100,
@@ -111,19 +130,10 @@ class BattleshipTransactionHandler(TransactionHandler):
                         to_place=_game_boat_data_to_str([[1, 1, 1, 1, 1], [1, 1, 1, 1, 1]]))
 
             battleship_state.set_game(battleship_payload.name, game)
+            for player in _game_players(game):
+                battleship_state.add_player_game(player, game.name)
             _display("Player {} created a game.".format(signer[:6]))
         
-        elif battleship_payload.action == 'show': 
-            game = battleship_state.get_game(battleship_payload.name)
-
-            if game is None:
-                raise InvalidTransaction(
-                    'Invalid action: show requires an existing game')
-
-            if game.player1 == '' or game.player2 == '':
-                raise InvalidTransaction(
-                    'Invalid action: show requires two existing players')
-        
         elif battleship_payload.action == 'place': 
             game = battleship_state.get_game(battleship_payload.name)
             if game is None:
@@ -185,7 +195,7 @@ class BattleshipTransactionHandler(TransactionHandler):
                      and game.player2 != currentplayer):
                 raise InvalidTransaction(
                     "Not this player's turn: {}".format(currentplayer[:6]))
-            
+
             if game.state == "P1-NEXT":
 
                 if game.board_P2[battleship_payload.space - 1] == 'X' or game.board_P2[battleship_payload.space - 1] == 'O':
@@ -225,12 +235,67 @@ class BattleshipTransactionHandler(TransactionHandler):
                 game.state = upd_game_state
                 _display("Player {} attacks space: {}\n\n".format(currentplayer[:6], battleship_payload.space)) 
 
-            battleship_state.set_game(battleship_payload.name, game)
+            if self._auto_archive and game.state in ('P1-WIN', 'P2-WIN'):
+                _archive_game(battleship_state, game)
+            else:
+                battleship_state.set_game(battleship_payload.name, game)
+
+        elif battleship_payload.action == 'archive':
+            game = battleship_state.get_game(battleship_payload.name)
+
+            if game is None:
+                raise InvalidTransaction(
+                    'Invalid action: archive requires an existing game')
+
+            if game.state not in ('P1-WIN', 'P2-WIN'):
+                raise InvalidTransaction(
+                    'Invalid Action: only finished games can be archived')
+
+            _archive_game(battleship_state, game)
+            _display("Player {} archived game {}.".format(signer[:6], game.name))
             
         else:
             raise InvalidTransaction('Unhandled action: {}'.format(
                 battleship_payload.action))
 
+def _game_players(game):
+    '''Return the distinct, non-empty players of a game.'''
+    players = []
+    for player in (game.player1, game.player2):
+        if player and player not in players:
+            players.append(player)
+    return players
+
+def _archive_game(battleship_state, game):
+    '''Replace a finished game with its compact result record, and take it
+       out of the index of its players.
+    '''
+    winner = game.player1 if game.state == 'P1-WIN' else game.player2
+
+    battleship_state.delete_game(game.name)
+    for player in _game_players(game):
+        battleship_state.delete_player_game(player, game.name)
+    battleship_state.set_result(game.name, Result(
+        name=game.name,
+        player1=game.player1,
+        player2=game.player2,
+        winner=winner,
+        moves=_count_moves(game),
+        hits_hash=_hits_hash(game)))
+
+def _count_moves(game):
+    '''Number of shots fired in the game, by both players.'''
+    return sum(board.count('X') + board.count('O')
+               for board in (game.board_P1, game.board_P2))
+
+def _hits_hash(game):
+    '''Hash of the final hit/miss masks of both boards.'''
+    masks = [
+        ''.join(square if square in ('X', 'O') else '-' for square in board)
+        for board in (game.board_P1, game.board_P2)
+    ]
+    return _hash('|'.join(masks).encode('utf-8'))[:64]
+
 def _update_board(board, boat_cases, space, state):
     index = space - 1
 
@@ -456,18 +521,50 @@ def _display(msg):
         LOGGER.debug("+ " + line.center(length) + " +")
     LOGGER.debug("+" + (length + 2) * "-" + "+")
 
-def setup_loggers():
+def setup_loggers(quiet=False):
     logging.basicConfig()
-    logging.getLogger().setLevel(logging.DEBUG)
+    logging.getLogger().setLevel(logging.WARNING if quiet else logging.DEBUG)
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Transaction processor of the battleship family.')
+
+    parser.add_argument(
+        '-C', '--connect',
+        type=str,
+        default=DEFAULT_URL,
+        help='endpoint of the validator to connect to')
+
+    parser.add_argument(
+        '-q', '--quiet',
+        action='store_true',
+        help='only log warnings and errors')
 
-def main():
+    return parser
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
     '''Entry-point function for the battleship transaction processor.'''
-    setup_loggers()
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    setup_loggers(quiet=args.quiet)
     try:
         # Register the transaction handler and start it.
-        processor = TransactionProcessor(url='tcp://validator:4004')
-
-        handler = BattleshipTransactionHandler(bs_namespace)
+        processor = TransactionProcessor(url=args.connect)
+
+        handler = BattleshipTransactionHandler(
+            bs_namespace,
+            auto_archive=os.environ.get('BATTLESHIP_AUTO_ARCHIVE') == '1')
+
+        # Opt-in sampling profiler, see processor.battleship_profiler
+        profiler = SamplingProfiler.from_environment()
+        profiler.install_signal_handlers()
+        # Spans of every apply call with BATTLESHIP_TRACE set, see
+        # processor.battleship_trace
+        tracer = Tracer.from_environment()
+        handler.apply = profiler.profiled(tracer.traced(handler.apply))
 
         processor.add_handler(handler)
 
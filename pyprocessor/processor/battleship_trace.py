@@ -0,0 +1,165 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Tracing of the apply calls of the transaction processor.
+
+With BATTLESHIP_TRACE set to a file, every apply call and every state call
+made by it is appended to the file as a span in the Chrome trace event
+format, under the trace id of its transaction: the first 32 hex digits of
+its header signature. The client traces its side of the same transactions
+to the same format, see battleship_family.battleship_trace in pyclient,
+which also summarizes the trace files.
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from processor.battleship_payload import BattleshipPayload
+
+TRACE_ENV = 'BATTLESHIP_TRACE'
+
+TRACE_ID_LENGTH = 32
+
+
+def _microseconds(seconds):
+    return int(round(seconds * 1e6))
+
+
+def _action(transaction):
+    try:
+        return BattleshipPayload.from_bytes(
+            transaction.payload, transaction.header.family_version).action
+    except InvalidTransaction:
+        return ''
+
+
+class Tracer(object):
+    '''Appends trace events to path; does nothing without a path.
+
+       Each event is appended in a single write, so the client and several
+       processors can share the file.
+    '''
+
+    def __init__(self, path=None, process_name='battleship-tp'):
+        self.path = path
+        self._fd = None
+        self._lock = threading.Lock()
+        if not path:
+            return
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            os.write(fd, b'[\n')
+            os.close(fd)
+        except FileExistsError:
+            pass
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+        self._write({
+            'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+            'args': {'name': '{} {}'.format(process_name, os.getpid())},
+        })
+
+    @classmethod
+    def from_environment(cls, process_name='battleship-tp', environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(environ.get(TRACE_ENV), process_name=process_name)
+
+    @property
+    def enabled(self):
+        return self._fd is not None
+
+    def _write(self, event):
+        data = (json.dumps(event, separators=(',', ':')) + ',\n').encode()
+        with self._lock:
+            if self._fd is not None:
+                os.write(self._fd, data)
+
+    def span(self, name, start, end, trace, **args):
+        args['trace_id'] = trace
+        self._write({
+            'name': name, 'cat': 'battleship', 'ph': 'X',
+            'ts': _microseconds(start),
+            'dur': _microseconds(end - start),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def traced(self, apply):
+        '''Return apply, the apply method of a handler, traced along with
+           the state calls it makes.
+        '''
+        if not self.enabled:
+            return apply
+
+        @functools.wraps(apply)
+        def wrapper(transaction, context):
+            trace = transaction.signature[:TRACE_ID_LENGTH]
+            start = time.time()
+            # Ends the arrow the client starts on submission
+            self._write({
+                'name': 'transaction', 'cat': 'battleship', 'ph': 'f',
+                'bp': 'e', 'id': trace, 'ts': _microseconds(start),
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+            })
+            status = 'ok'
+            try:
+                return apply(transaction, _TracedContext(context, self, trace))
+            except Exception as err:
+                status = type(err).__name__
+                raise
+            finally:
+                self.span('apply', start, time.time(), trace,
+                          action=_action(transaction), status=status)
+        return wrapper
+
+
+class _TracedContext(object):
+    '''A transaction context tracing the state calls made through it.'''
+
+    def __init__(self, context, tracer, trace):
+        self._context = context
+        self._tracer = tracer
+        self._trace = trace
+
+    def _call(self, name, method, addresses, *args, **kwargs):
+        start = time.time()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._tracer.span(name, start, time.time(), self._trace,
+                              addresses=len(addresses))
+
+    def get_state(self, addresses, timeout=None):
+        return self._call('get_state', self._context.get_state, addresses,
+                          addresses, timeout=timeout)
+
+    def set_state(self, entries, timeout=None):
+        return self._call('set_state', self._context.set_state, entries,
+                          entries, timeout=timeout)
+
+    def delete_state(self, addresses, timeout=None):
+        return self._call('delete_state', self._context.delete_state,
+                          addresses, addresses, timeout=timeout)
+
+    def __getattr__(self, name):
+        # Receipts and events are not traced
+        return getattr(self._context, name)
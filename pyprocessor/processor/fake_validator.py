@@ -0,0 +1,587 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+Stand-in for a validator, to measure the throughput of battleship-tp alone.
+
+Transaction processors register with it over ZMQ as with a validator. It then
+streams them TpProcessRequests for simulated games, at most concurrency at a
+time and, optionally, no more than rate per second, and serves their state
+requests from a MemoryState. Each game has players of its own and only one
+move in flight, so the transactions in flight never touch the same address.
+It reports the transactions processed per second and the latency of each
+request, overall and by worker.
+'''
+
+import argparse
+import binascii
+import collections
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+
+import numpy as np
+import zmq
+
+from sawtooth_sdk.processor.exceptions import AuthorizationException
+from sawtooth_sdk.protobuf import processor_pb2
+from sawtooth_sdk.protobuf import state_context_pb2
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+from processor.battleship_sim import game_moves
+from processor.battleship_sim import simulate
+from processor.battleship_tp import FAMILY_NAME
+from processor.battleship_tp import bs_namespace
+from processor.memory_context import MemoryContext
+from processor.memory_context import MemoryState
+
+from battleship_family.battleship_payload import encode_payload
+
+DEFAULT_BIND = 'tcp://127.0.0.1:4004'
+
+PERCENTILES = (50, 95, 99)
+
+# Games simulated at once when the workload runs out of games
+GAME_CHUNK = 1000
+
+
+def _new_id():
+    return binascii.hexlify(os.urandom(16)).decode()
+
+
+class Workload(object):
+    '''Endless supply of simulated games, as lists of payloads.'''
+
+    def __init__(self, seed=None, family_version='1.0'):
+        self._rng = np.random.default_rng(seed)
+        self.family_version = family_version
+        self._run = binascii.hexlify(os.urandom(3)).decode()
+        self._games = collections.deque()
+        self._count = 0
+
+    def next_game(self):
+        '''Return the name and the payloads of the moves of a new game.'''
+        if not self._games:
+            result = simulate(GAME_CHUNK, self._rng)
+            self._games.extend(
+                list(game_moves(result, game)) for game in range(len(result)))
+
+        name = 'tp-{}-{}'.format(self._run, self._count)
+        self._count += 1
+        players = [name + '-p1', name + '-p2']
+
+        moves = [(name, 'create', '', '', '', players[0], players[1], '')]
+        for player, action, fields in self._games.popleft():
+            moves.append((
+                name, action,
+                fields['space'],
+                fields.get('boat', ''),
+                fields.get('direction', ''),
+                '', '', players[player]))
+
+        if self.family_version == '2.0':
+            return name, [encode_payload('2.0', *move) for move in moves]
+        return name, [
+            ','.join(str(field) for field in move).encode() for move in moves]
+
+
+class Worker(object):
+    '''A registered transaction processor.'''
+
+    def __init__(self, identity, header_style):
+        self.identity = identity
+        self.header_style = header_style
+        self.in_flight = 0
+        self.latencies = []
+
+
+class _Request(object):
+    def __init__(self, game, worker, context_id, context):
+        self.game = game
+        self.worker = worker
+        self.context_id = context_id
+        self.context = context
+        self.sent = time.time()
+
+
+class FakeValidator(object):
+    '''Serves registered transaction processors the moves of simulated
+       games, over a ROUTER socket bound to bind.
+    '''
+
+    def __init__(self, bind=DEFAULT_BIND, concurrency=8, rate=None,
+                 games=256, seed=None, family_version='1.0'):
+        self._zmq = zmq.Context()
+        self._socket = self._zmq.socket(zmq.ROUTER)
+        self._socket.bind(bind)
+        self.url = self._socket.getsockopt_string(zmq.LAST_ENDPOINT)
+
+        self._concurrency = concurrency
+        self._rate = rate
+        self._games = games
+        self._workload = Workload(seed, family_version=family_version)
+
+        self.state = MemoryState()
+        self.workers = collections.OrderedDict()
+
+        # Requests in flight, by correlation id and by context id
+        self._requests = {}
+        self._contexts = {}
+
+        self.counts = dict(ok=0, invalid=0, internal_error=0)
+        self.errors = []
+
+    def close(self):
+        self._socket.close(linger=0)
+        self._zmq.term()
+
+    def _send(self, identity, message_type, content, correlation_id=None):
+        message = Message(
+            message_type=message_type,
+            correlation_id=correlation_id or _new_id(),
+            content=content.SerializeToString())
+        self._socket.send_multipart([identity, message.SerializeToString()])
+        return message.correlation_id
+
+    def _receive(self, timeout):
+        '''Handle the messages arriving within timeout seconds.
+
+           Returns the games whose request is over, with its outcome.
+        '''
+        over = []
+        if not self._socket.poll(int(timeout * 1000)):
+            return over
+
+        while True:
+            try:
+                identity, data = self._socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return over
+
+            message = Message()
+            message.ParseFromString(data)
+            result = self._handle(identity, message)
+            if result is not None:
+                over.append(result)
+
+    def _handle(self, identity, message):
+        message_type = message.message_type
+
+        if message_type == Message.TP_REGISTER_REQUEST:
+            request = processor_pb2.TpRegisterRequest()
+            request.ParseFromString(message.content)
+            if identity not in self.workers:
+                self.workers[identity] = Worker(
+                    identity, request.request_header_style)
+            self._send(
+                identity, Message.TP_REGISTER_RESPONSE,
+                processor_pb2.TpRegisterResponse(
+                    status=processor_pb2.TpRegisterResponse.OK,
+                    protocol_version=request.protocol_version),
+                message.correlation_id)
+
+        elif message_type == Message.TP_UNREGISTER_REQUEST:
+            self.workers.pop(identity, None)
+            self._send(
+                identity, Message.TP_UNREGISTER_RESPONSE,
+                processor_pb2.TpUnregisterResponse(
+                    status=processor_pb2.TpUnregisterResponse.OK),
+                message.correlation_id)
+
+        elif message_type == Message.TP_PROCESS_RESPONSE:
+            return self._processed(message)
+
+        elif message_type in _STATE_REQUESTS:
+            self._serve_state(identity, message)
+
+        return None
+
+    def _serve_state(self, identity, message):
+        request_class, response_class, response_type, apply = \
+            _STATE_REQUESTS[message.message_type]
+        request = request_class()
+        request.ParseFromString(message.content)
+
+        context = self._contexts.get(request.context_id)
+        response = response_class(status=response_class.OK)
+        if context is None:
+            response.status = response_class.STATUS_UNSET
+        else:
+            try:
+                apply(context, request, response)
+            except AuthorizationException:
+                response.status = response_class.AUTHORIZATION_ERROR
+
+        self._send(identity, response_type, response, message.correlation_id)
+
+    def _dispatch(self, game):
+        '''Send the next move of game to the least busy worker.'''
+        name, payloads = game
+        worker = min(self.workers.values(), key=lambda w: w.in_flight)
+
+        payload = payloads[0]
+        header = TransactionHeader(
+            family_name=FAMILY_NAME,
+            family_version=self._workload.family_version,
+            inputs=[bs_namespace],
+            outputs=[bs_namespace],
+            signer_public_key='02' + '00' * 32,
+            batcher_public_key='02' + '00' * 32,
+            nonce=_new_id())
+
+        context_id = _new_id()
+        request = processor_pb2.TpProcessRequest(
+            payload=payload,
+            signature=_new_id() * 4,
+            context_id=context_id)
+        if worker.header_style == processor_pb2.TpRegisterRequest.RAW:
+            request.header_bytes = header.SerializeToString()
+        else:
+            request.header.CopyFrom(header)
+
+        context = MemoryContext(self.state, header.inputs, header.outputs)
+        correlation_id = self._send(
+            worker.identity, Message.TP_PROCESS_REQUEST, request)
+
+        self._requests[correlation_id] = _Request(
+            game, worker, context_id, context)
+        self._contexts[context_id] = context
+        worker.in_flight += 1
+
+    def _processed(self, message):
+        request = self._requests.pop(message.correlation_id, None)
+        if request is None:
+            return None
+        del self._contexts[request.context_id]
+
+        response = processor_pb2.TpProcessResponse()
+        response.ParseFromString(message.content)
+
+        worker = request.worker
+        worker.in_flight -= 1
+        worker.latencies.append(time.time() - request.sent)
+
+        if response.status == processor_pb2.TpProcessResponse.OK:
+            self.counts['ok'] += 1
+            self.state.apply(request.context.changes)
+            request.game[1].pop(0)
+            return request.game, True
+
+        if response.status == processor_pb2.TpProcessResponse.INVALID_TRANSACTION:
+            self.counts['invalid'] += 1
+        else:
+            self.counts['internal_error'] += 1
+        if len(self.errors) < 10:
+            self.errors.append('{}: {}'.format(
+                request.game[0], response.message))
+        return request.game, False
+
+    def wait_for_workers(self, count, timeout=60):
+        '''Wait until count transaction processors have registered.'''
+        deadline = time.time() + timeout
+        while len(self.workers) < count:
+            if time.time() > deadline:
+                raise Exception(
+                    '{} of {} transaction processors registered'.format(
+                        len(self.workers), count))
+            self._receive(0.1)
+
+    def run(self, transactions=None, duration=None, report=None,
+            report_interval=5):
+        '''Stream transactions until transactions were processed or for
+           duration seconds, then wait for those in flight.
+
+           Returns the summary of the run.
+        '''
+        start_time = time.time()
+        last_report = start_time
+        reported = 0
+        dispatched = 0
+
+        ready = collections.deque(
+            self._workload.next_game() for _ in range(self._games))
+
+        while True:
+            now = time.time()
+            stopping = (
+                (transactions is not None and dispatched >= transactions) or
+                (duration is not None and now - start_time >= duration))
+            if stopping and not self._requests:
+                break
+            if not self.workers:
+                raise Exception('All transaction processors unregistered')
+
+            while not stopping and ready and \
+                    len(self._requests) < self._concurrency:
+                if self._rate and \
+                        dispatched >= (now - start_time) * self._rate:
+                    break
+                if transactions is not None and dispatched >= transactions:
+                    break
+                self._dispatch(ready.popleft())
+                dispatched += 1
+
+            for game, ok in self._receive(0.001 if self._rate else 0.05):
+                # An invalid move ends its game, as its successors would be
+                if ok and game[1]:
+                    ready.append(game)
+                else:
+                    ready.append(self._workload.next_game())
+
+            if report is not None and now - last_report >= report_interval:
+                processed = self.processed
+                report({
+                    'elapsed': round(now - start_time, 1),
+                    'tps': round((processed - reported) /
+                                 (now - last_report), 1),
+                    'processed': processed,
+                    'invalid': self.counts['invalid'],
+                })
+                reported = processed
+                last_report = now
+
+        return self.summary(time.time() - start_time)
+
+    @property
+    def processed(self):
+        return sum(self.counts.values())
+
+    def summary(self, elapsed):
+        latencies = [
+            latency
+            for worker in self.workers.values()
+            for latency in worker.latencies
+        ]
+        return {
+            'elapsed': round(elapsed, 2),
+            'workers': len(self.workers),
+            'concurrency': self._concurrency,
+            'target_tps': self._rate,
+            'tps': round(self.processed / elapsed, 1) if elapsed else 0.0,
+            'counts': self.counts,
+            'latency': _latency_summary(latencies),
+            'by_worker': [
+                dict(processed=len(worker.latencies),
+                     **_latency_summary(worker.latencies))
+                for worker in self.workers.values()
+            ],
+            'errors': self.errors,
+        }
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return {}
+
+    latencies = np.array(latencies) * 1000
+    summary = {'mean_ms': round(float(latencies.mean()), 3)}
+    for percentile, value in zip(
+            PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        summary['p{}_ms'.format(percentile)] = round(float(value), 3)
+    return summary
+
+
+def _get(context, request, response):
+    response.entries.extend(context.get_state(list(request.addresses)))
+
+
+def _set(context, request, response):
+    response.addresses.extend(context.set_state(
+        {entry.address: entry.data for entry in request.entries}))
+
+
+def _delete(context, request, response):
+    response.addresses.extend(
+        context.delete_state(list(request.addresses)))
+
+
+def _receipt(context, request, response):
+    context.add_receipt_data(request.data)
+
+
+def _event(context, request, response):
+    context.add_event(
+        request.event.event_type,
+        [(attribute.key, attribute.value)
+         for attribute in request.event.attributes],
+        request.event.data)
+
+
+# Request type -> request, response, response type and the call serving it
+_STATE_REQUESTS = {
+    Message.TP_STATE_GET_REQUEST: (
+        state_context_pb2.TpStateGetRequest,
+        state_context_pb2.TpStateGetResponse,
+        Message.TP_STATE_GET_RESPONSE, _get),
+    Message.TP_STATE_SET_REQUEST: (
+        state_context_pb2.TpStateSetRequest,
+        state_context_pb2.TpStateSetResponse,
+        Message.TP_STATE_SET_RESPONSE, _set),
+    Message.TP_STATE_DELETE_REQUEST: (
+        state_context_pb2.TpStateDeleteRequest,
+        state_context_pb2.TpStateDeleteResponse,
+        Message.TP_STATE_DELETE_RESPONSE, _delete),
+    Message.TP_RECEIPT_ADD_DATA_REQUEST: (
+        state_context_pb2.TpReceiptAddDataRequest,
+        state_context_pb2.TpReceiptAddDataResponse,
+        Message.TP_RECEIPT_ADD_DATA_RESPONSE, _receipt),
+    Message.TP_EVENT_ADD_REQUEST: (
+        state_context_pb2.TpEventAddRequest,
+        state_context_pb2.TpEventAddResponse,
+        Message.TP_EVENT_ADD_RESPONSE, _event),
+}
+
+
+def spawn_workers(count, url):
+    '''Start count battleship-tp processes connecting to url.'''
+    script = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'battleship-tp')
+    return [
+        subprocess.Popen(
+            [sys.executable, script, '--connect', url, '--quiet'],
+            stdout=subprocess.DEVNULL)
+        for _ in range(count)
+    ]
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Stands in for a validator to measure how many '
+        'transactions per second battleship transaction processors sustain.')
+
+    parser.add_argument(
+        '--bind',
+        type=str,
+        default=DEFAULT_BIND,
+        help='ZMQ endpoint the transaction processors connect to')
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of transaction processors to wait for')
+
+    parser.add_argument(
+        '--spawn',
+        action='store_true',
+        help='start the transaction processors as subprocesses')
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=8,
+        help='most transactions in flight over all the processors')
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        help='most transactions sent per second (default: as fast as '
+        'the processors answer)')
+
+    parser.add_argument(
+        '--transactions',
+        type=int,
+        help='number of transactions to send')
+
+    parser.add_argument(
+        '--duration',
+        type=float,
+        help='time, in seconds, during which transactions are sent '
+        '(default: 30 unless --transactions is given)')
+
+    parser.add_argument(
+        '--games',
+        type=int,
+        default=256,
+        help='number of games played at the same time')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed of the simulated games')
+
+    parser.add_argument(
+        '--family-version',
+        choices=['1.0', '2.0'],
+        default='1.0',
+        help='family version of the transactions: 1.0 CSV payloads, or 2.0 '
+        'binary payloads')
+
+    parser.add_argument(
+        '--report-interval',
+        type=float,
+        default=5,
+        help='time, in seconds, between two live reports on stderr; '
+        '0 disables them')
+
+    return parser
+
+
+def _print_live(live):
+    print('{elapsed:>7}s  {tps:>8} tps  processed {processed}  '
+          'invalid {invalid}'.format(**live), file=sys.stderr)
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = create_parser(prog_name).parse_args(args)
+
+    duration = args.duration
+    if duration is None and args.transactions is None:
+        duration = 30
+
+    validator = FakeValidator(
+        bind=args.bind,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        games=args.games,
+        seed=args.seed,
+        family_version=args.family_version)
+
+    processes = []
+    try:
+        if args.spawn:
+            processes = spawn_workers(args.workers, validator.url)
+        validator.wait_for_workers(args.workers)
+
+        summary = validator.run(
+            transactions=args.transactions,
+            duration=duration,
+            report=_print_live if args.report_interval > 0 else None,
+            report_interval=args.report_interval)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        validator.close()
+
+    print(json.dumps(summary, indent=2))
+
+
+def main_wrapper():
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as err:
+        raise err
+    except BaseException:
+        traceback.print_exc(file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,221 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+'''
+In-memory global state, for running transaction handlers without a validator.
+
+MemoryState holds the state entries. MemoryContext gives a transaction the
+same get_state/set_state/delete_state interface as the SDK's Context, with
+the validator's rules: addresses outside the transaction's inputs and
+outputs are refused, and the writes of a transaction only reach the state
+once the whole batch is valid.
+'''
+
+import bisect
+import hashlib
+import threading
+import time
+
+from sawtooth_sdk.processor.exceptions import AuthorizationException
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessRequest
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateEntry
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+
+class MemoryState(object):
+    '''State entries by address, kept sorted for prefix listings.'''
+
+    def __init__(self, entries=None):
+        self._lock = threading.RLock()
+        self._data = {}
+        self._addresses = []
+        if entries:
+            self.apply(entries)
+
+    def get(self, address):
+        with self._lock:
+            return self._data.get(address)
+
+    def __len__(self):
+        return len(self._data)
+
+    def list(self, prefix='', start=None, limit=None):
+        '''Return the (address, data) entries under prefix, in address
+           order, from address start on.
+        '''
+        with self._lock:
+            first = prefix if start is None else max(start, prefix)
+            index = bisect.bisect_left(self._addresses, first)
+            entries = []
+            for address in self._addresses[index:]:
+                if not address.startswith(prefix):
+                    break
+                if limit is not None and len(entries) == limit:
+                    break
+                entries.append((address, self._data[address]))
+            return entries
+
+    def digest(self):
+        '''Return a hex digest of every entry, standing in for the state
+           root: equal states, however reached, have equal digests.
+        '''
+        digest = hashlib.sha512()
+        with self._lock:
+            for address in self._addresses:
+                digest.update(address.encode())
+                digest.update(hashlib.sha512(self._data[address]).digest())
+        return digest.hexdigest()
+
+    def apply(self, changes):
+        '''Write changes, address -> data, where None or b'' deletes.'''
+        with self._lock:
+            for address, data in changes.items():
+                if data:
+                    if address not in self._data:
+                        bisect.insort(self._addresses, address)
+                    self._data[address] = data
+                elif address in self._data:
+                    del self._data[address]
+                    del self._addresses[
+                        bisect.bisect_left(self._addresses, address)]
+
+
+def _authorized(address, prefixes):
+    return any(address.startswith(prefix) for prefix in prefixes)
+
+
+class MemoryContext(object):
+    '''The context of one transaction over a MemoryState.
+
+       Reads see the writes of the transaction itself, then pending, the
+       writes of the earlier transactions of the same batch, then state.
+       Writes stay in changes until the caller applies them.
+    '''
+
+    def __init__(self, state, inputs, outputs, pending=None):
+        self._state = state
+        self._inputs = list(inputs)
+        self._outputs = list(outputs)
+        self._pending = {} if pending is None else pending
+        self.changes = {}
+        self.events = []
+        self.receipt_data = []
+
+    def _read(self, address):
+        for changes in (self.changes, self._pending):
+            if address in changes:
+                return changes[address]
+        return self._state.get(address)
+
+    def get_state(self, addresses, timeout=None):
+        for address in addresses:
+            if not _authorized(address, self._inputs):
+                raise AuthorizationException(
+                    'Tried to get unauthorized address: {}'.format(addresses))
+
+        entries = []
+        for address in addresses:
+            data = self._read(address)
+            if data:
+                entries.append(TpStateEntry(address=address, data=data))
+        return entries
+
+    def set_state(self, entries, timeout=None):
+        for address in entries:
+            if not _authorized(address, self._outputs):
+                raise AuthorizationException(
+                    'Tried to set unauthorized address: {}'.format(
+                        list(entries)))
+
+        self.changes.update(entries)
+        return list(entries)
+
+    def delete_state(self, addresses, timeout=None):
+        for address in addresses:
+            if not _authorized(address, self._outputs):
+                raise AuthorizationException(
+                    'Tried to delete unauthorized address: {}'.format(
+                        addresses))
+
+        deleted = [address for address in addresses if self._read(address)]
+        for address in addresses:
+            self.changes[address] = None
+        return deleted
+
+    def add_receipt_data(self, data, timeout=None):
+        self.receipt_data.append(data)
+
+    def add_event(self, event_type, attributes=None, data=None,
+                  timeout=None):
+        self.events.append((event_type, attributes or [], data))
+
+
+def process_request(transaction):
+    '''Return the TpProcessRequest a validator sends for transaction.'''
+    header = TransactionHeader()
+    header.ParseFromString(transaction.header)
+    return TpProcessRequest(
+        header=header,
+        payload=transaction.payload,
+        signature=transaction.header_signature)
+
+
+def apply_batch(handler, state, batch, on_transaction=None):
+    '''Execute the transactions of batch with handler, against state.
+
+       The writes are applied only when every transaction is valid. Returns
+       None then, or the id and error message of the first invalid
+       transaction, leaving state unchanged. An InternalError of the handler is
+       raised, as a validator would retry the transaction.
+    '''
+    return apply_requests(
+        handler, state,
+        [process_request(transaction) for transaction in batch.transactions],
+        on_transaction=on_transaction)
+
+
+def apply_requests(handler, state, requests, on_transaction=None):
+    '''Execute the TpProcessRequests of one batch, as apply_batch does.
+
+       on_transaction, if given, is called with the request, the seconds
+       it took and its error message, or None, after each transaction; the
+       transactions after an invalid one are not executed.
+    '''
+    pending = {}
+    for request in requests:
+        start = time.perf_counter()
+        error = None
+
+        if request.header.family_name != handler.family_name or \
+                request.header.family_version not in handler.family_versions:
+            error = 'No handler for {} {}'.format(
+                request.header.family_name,
+                request.header.family_version)
+        else:
+            context = MemoryContext(
+                state, request.header.inputs, request.header.outputs,
+                pending=pending)
+            try:
+                handler.apply(request, context)
+            except (InvalidTransaction, AuthorizationException) as err:
+                error = str(err)
+
+        if on_transaction is not None:
+            on_transaction(request, time.perf_counter() - start, error)
+        if error is not None:
+            return request.signature, error
+
+        pending.update(context.changes)
+
+    state.apply(pending)
+    return None